@@ -0,0 +1,202 @@
+"""
+Incremental parsing of source bodies.
+
+Bodies are read from the response in chunks and split into config lines as
+they complete, so a large source is never held in memory as a whole (let
+alone as a second, base64-decoded copy). Subscription-style bodies are
+detected from their first bytes, unless the source declares its format,
+and decoded on the fly.
+"""
+
+from __future__ import annotations
+
+import binascii
+import re
+from collections.abc import AsyncIterator, Callable
+
+import aiohttp
+
+CHUNK_SIZE = 64 * 1024
+
+# Bytes inspected before deciding whether a body is base64
+SNIFF_BYTES = 256
+
+_BASE64_BODY = re.compile(rb"[A-Za-z0-9+/=_\-\s]+")
+_WHITESPACE = re.compile(rb"\s+")
+_URLSAFE = bytes.maketrans(b"-_", b"+/")
+
+
+class BodyTooLargeError(ValueError):
+    """Raised when a source body exceeds its byte limit"""
+
+
+class BodyDecodeError(ValueError):
+    """Raised when a body that looked like base64 fails to decode"""
+
+
+class Base64Decoder:
+    """Decodes base64 fed in arbitrary chunks, ignoring whitespace"""
+
+    def __init__(self):
+        self._pending = b""
+
+    def feed(self, data: bytes) -> bytes:
+        data = self._pending + _WHITESPACE.sub(b"", data).translate(_URLSAFE)
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        return self._decode(data[:usable])
+
+    def close(self) -> bytes:
+        # Subscriptions frequently drop the trailing padding
+        data = self._pending.rstrip(b"=")
+        self._pending = b""
+        if not data:
+            return b""
+        return self._decode(data + b"=" * (-len(data) % 4))
+
+    @staticmethod
+    def _decode(data: bytes) -> bytes:
+        # Padding may legitimately appear between concatenated blocks
+        try:
+            return b"".join(
+                binascii.a2b_base64(block + b"=" * (-len(block) % 4))
+                for block in data.replace(b"=", b" ").split())
+        except binascii.Error as e:
+            raise BodyDecodeError(f"Invalid base64 body: {e}") from e
+
+
+class LineSplitter:
+    """Turns body chunks into config lines, decoding base64 bodies on the fly"""
+
+    def __init__(self, fmt: str = "auto"):
+        """
+        Args:
+            fmt: "plain" or "base64" to skip sniffing; "auto" decides from
+                the first SNIFF_BYTES of the body
+        """
+        self._sniffed = b""
+        self._decoder: Base64Decoder | None = None
+        self._decided = fmt != "auto"
+        self._partial = b""
+        if fmt == "base64":
+            self._decoder = Base64Decoder()
+
+    @property
+    def is_base64(self) -> bool:
+        return self._decoder is not None
+
+    def feed(self, chunk: bytes) -> list[str]:
+        if not self._decided:
+            self._sniffed += chunk
+            if len(self._sniffed.strip()) < SNIFF_BYTES:
+                return []
+            return self._split(self._decide())
+        if self._decoder is not None:
+            chunk = self._decoder.feed(chunk)
+        return self._split(chunk)
+
+    def close(self) -> list[str]:
+        lines = []
+        if not self._decided:
+            lines.extend(self._split(self._decide()))
+        if self._decoder is not None:
+            lines.extend(self._split(self._decoder.close()))
+            self._decoder = None
+        tail, self._partial = self._partial, b""
+        return lines + _clean([tail])
+
+    def _decide(self) -> bytes:
+        head = self._sniffed.strip()
+        if (head and b"://" not in head
+                and _BASE64_BODY.fullmatch(head[:SNIFF_BYTES])):
+            self._decoder = Base64Decoder()
+        self._decided = True
+        data, self._sniffed = self._sniffed, b""
+        if self._decoder is not None:
+            return self._decoder.feed(data)
+        return data
+
+    def _split(self, data: bytes) -> list[str]:
+        if not data:
+            return []
+        pieces = (self._partial + data).split(b"\n")
+        self._partial = pieces.pop()
+        return _clean(pieces)
+
+
+def _clean(pieces: list[bytes]) -> list[str]:
+    lines = []
+    for piece in pieces:
+        line = piece.decode("utf-8", errors="ignore").strip()
+        if line and not line.startswith("#"):
+            lines.append(line)
+    return lines
+
+
+def split_lines(body: bytes, fmt: str = "auto") -> list[str]:
+    """Config lines of a complete body (same rules as the streaming reader)"""
+    splitter = LineSplitter(fmt)
+    return splitter.feed(body) + splitter.close()
+
+
+async def iter_lines(
+    response: aiohttp.ClientResponse,
+    max_bytes: int | None = None,
+    sink: Callable[[bytes], object] | None = None,
+    fmt: str = "auto",
+) -> AsyncIterator[str]:
+    """
+    Yield config lines from a response body as they arrive.
+
+    Args:
+        response: Response whose body is read in chunks
+        max_bytes: Abort with BodyTooLargeError beyond this many bytes
+        sink: Called with every raw chunk, e.g. to write the body to disk
+        fmt: "plain" or "base64" if known, "auto" to sniff the body
+
+    Raises:
+        BodyTooLargeError: If the body is (or announces to be) too large
+        BodyDecodeError: If a base64 body turns out not to be valid
+    """
+    splitter = LineSplitter(fmt)
+    async for chunk in _chunks(response, max_bytes, sink):
+        for line in splitter.feed(chunk):
+            yield line
+
+    for line in splitter.close():
+        yield line
+
+
+async def read_body(
+    response: aiohttp.ClientResponse,
+    max_bytes: int | None = None,
+    sink: Callable[[bytes], object] | None = None,
+) -> bytes:
+    """
+    Read a whole body, for formats that cannot be parsed line by line.
+
+    Raises:
+        BodyTooLargeError: If the body is (or announces to be) too large
+    """
+    return b"".join([chunk async for chunk in _chunks(response, max_bytes,
+                                                      sink)])
+
+
+async def _chunks(
+    response: aiohttp.ClientResponse,
+    max_bytes: int | None,
+    sink: Callable[[bytes], object] | None,
+) -> AsyncIterator[bytes]:
+    if (max_bytes and response.content_length
+            and response.content_length > max_bytes):
+        raise BodyTooLargeError(
+            f"Body of {response.content_length} bytes exceeds {max_bytes}")
+
+    received = 0
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        received += len(chunk)
+        if max_bytes and received > max_bytes:
+            raise BodyTooLargeError(f"Body exceeds {max_bytes} bytes")
+        if sink is not None:
+            sink(chunk)
+        yield chunk
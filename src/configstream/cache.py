@@ -0,0 +1,116 @@
+"""
+Persistent cache of proxy test results.
+
+Results are keyed by the canonical fingerprint of each config so that
+configs seen again within CACHE_TTL seconds are not re-tested.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from .config import AppSettings
+from .fingerprint import config_fingerprint
+from .models import Proxy
+
+logger = logging.getLogger(__name__)
+
+# Bump when config_fingerprint changes, so old keys are not trusted
+CACHE_VERSION = 2
+
+
+class ResultCache:
+    """On-disk LRU cache of test outcomes with a freshness TTL"""
+
+    def __init__(
+        self,
+        path: str | Path,
+        ttl: int | None = None,
+        max_entries: int | None = None,
+        write_only: bool = False,
+    ):
+        settings = AppSettings()
+        self.path = Path(path)
+        self.ttl = ttl if ttl is not None else settings.CACHE_TTL
+        self.max_entries = max_entries or settings.TEST_CACHE_MAX_ENTRIES
+        # Record outcomes for later runs without reusing any in this one
+        self.write_only = write_only
+        self.entries: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self) -> None:
+        """Load entries from disk, dropping anything already stale"""
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable test cache {self.path}: {e}")
+            return
+        if data.get("version") != CACHE_VERSION:
+            return
+
+        now = time.time()
+        for key, entry in data.get("entries", {}).items():
+            if now - entry.get("checked", 0) < self.ttl:
+                self.entries[key] = entry
+        logger.info(f"Loaded {len(self.entries)} fresh test results from cache")
+
+    def save(self) -> None:
+        """Write the cache atomically"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(
+            json.dumps({
+                "version": CACHE_VERSION,
+                "entries": self.entries
+            }))
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        """Return the fresh entry for key, or None"""
+        entry = self.entries.get(key)
+        if entry is None or time.time() - entry["checked"] >= self.ttl:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, proxy: Proxy) -> None:
+        """Record the outcome of a test, evicting the least recently used"""
+        key = config_fingerprint(proxy)
+        self.entries[key] = {
+            "working": proxy.is_working,
+            "latency": proxy.latency,
+            "tested_at": proxy.tested_at,
+            "failure": (proxy.security_issues[-1]
+                        if proxy.security_issues and not proxy.is_working else
+                        None),
+            "checked": time.time(),
+        }
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def restore(self, proxy: Proxy) -> bool:
+        """Copy a fresh cached outcome onto proxy; False if there is none"""
+        if self.write_only:
+            return False
+        entry = self.get(config_fingerprint(proxy))
+        if entry is None:
+            return False
+
+        proxy.is_working = entry["working"]
+        proxy.latency = entry["latency"]
+        proxy.tested_at = entry["tested_at"]
+        if entry["failure"]:
+            proxy.security_issues.append(entry["failure"])
+        return True
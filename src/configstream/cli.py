@@ -8,12 +8,16 @@ from pathlib import Path
 import click
 from rich.console import Console
 from rich.progress import Progress
+from rich.table import Table
 
 from . import pipeline
 from .config import AppSettings
 from .models import Proxy
 from .geoip import download_geoip_dbs
 from .logging_config import setup_logging
+from .overlap import analyze_sources
+from .source_cache import SourceCache
+from .sources import SourceFileError, load_sources
 
 console = Console()
 config = AppSettings()
@@ -73,7 +77,8 @@ def cli():
     "--sources",
     "sources_file",
     required=True,
-    help="Path to the file containing source URLs.",
+    help="Path to the file containing source URLs (one per line, optionally "
+    "followed by refresh=, priority=, format= and max_bytes= options).",
     type=click.Path(exists=True, dir_okay=False),
 )
 @click.option(
@@ -94,7 +99,28 @@ def cli():
     "--country",
     "country_filter",
     default=None,
-    help="Filter proxies by country code (e.g., US, DE).",
+    help="Only test proxies in these countries, comma-separated (e.g., US,DE).",
+    type=str,
+)
+@click.option(
+    "--protocol",
+    "protocol_filter",
+    default=None,
+    help="Only test these protocols, comma-separated (e.g., vless,trojan).",
+    type=str,
+)
+@click.option(
+    "--port",
+    "port_filter",
+    default=None,
+    help="Only test proxies on these ports, comma-separated (e.g., 443,8443).",
+    type=str,
+)
+@click.option(
+    "--asn",
+    "asn_filter",
+    default=None,
+    help="Only test proxies in these ASNs, comma-separated (e.g., AS13335).",
     type=str,
 )
 @click.option(
@@ -111,6 +137,20 @@ def cli():
     help="Maximum latency in milliseconds.",
     type=float,
 )
+@click.option(
+    "--target-working",
+    "target_working",
+    default=None,
+    help="Stop testing once this many working proxies are found.",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--per-country-quota",
+    "per_country_quota",
+    default=None,
+    help="Stop testing a country once it has this many working proxies.",
+    type=click.IntRange(min=1),
+)
 @click.option(
     "--max-workers",
     "max_workers",
@@ -125,6 +165,40 @@ def cli():
     help="Timeout for testing each proxy.",
     type=int,
 )
+@click.option(
+    "--host-size",
+    "host_size",
+    default=0,
+    help="Proxies per shared sing-box process (0 = one process per proxy).",
+    type=click.IntRange(min=0),
+)
+@click.option(
+    "--preflight/--no-preflight",
+    "preflight",
+    default=True,
+    help="Drop proxies whose endpoint refuses a TCP/TLS connection before testing.",
+)
+@click.option(
+    "--cache-ttl",
+    "cache_ttl",
+    default=None,
+    help="Seconds a cached test result stays fresh (default: CACHE_TTL).",
+    type=click.IntRange(min=0),
+)
+@click.option(
+    "--no-cache",
+    "no_cache",
+    is_flag=True,
+    default=False,
+    help="Re-test every proxy instead of reusing cached results.",
+)
+@click.option(
+    "--resume",
+    "resume",
+    is_flag=True,
+    default=False,
+    help="Reuse results journaled by an interrupted run instead of re-testing.",
+)
 @click.option(
     "--verbose",
     "verbose",
@@ -137,10 +211,20 @@ def merge(
     output_dir: str,
     max_proxies: int | None,
     country_filter: str | None,
+    protocol_filter: str | None,
+    port_filter: str | None,
+    asn_filter: str | None,
     min_latency: float | None,
     max_latency: float | None,
+    target_working: int | None,
+    per_country_quota: int | None,
     max_workers: int,
     timeout: int,
+    host_size: int,
+    preflight: bool,
+    cache_ttl: int | None,
+    no_cache: bool,
+    resume: bool,
     verbose: bool,
 ):
     """
@@ -156,10 +240,11 @@ def merge(
 
     try:
         # Read sources
-        sources = Path(sources_file).read_text().splitlines()
-        sources = [
-            s.strip() for s in sources if s.strip() and not s.startswith("#")
-        ]
+        try:
+            sources = load_sources(sources_file)
+        except SourceFileError as e:
+            click.echo(f"✗ Invalid sources file {sources_file}: {e}", err=True)
+            sys.exit(1)
 
         if not sources:
             click.echo("✗ No sources found in the specified file.", err=True)
@@ -180,12 +265,28 @@ def merge(
                     max_latency=max_latency,
                     timeout=timeout,
                     country_filter=country_filter,
+                    protocol_filter=protocol_filter,
+                    port_filter=port_filter,
+                    asn_filter=asn_filter,
+                    host_size=host_size,
+                    preflight=preflight,
+                    use_cache=not no_cache,
+                    cache_ttl=cache_ttl,
+                    target_working=target_working,
+                    per_country_quota=per_country_quota,
+                    resume=resume,
                 ))
 
         if not result["success"]:
             click.echo(f"\n✗ Pipeline failed: {result['error']}", err=True)
             sys.exit(1)
 
+        if result.get("partial") is True:
+            click.echo("\n⚠ Pipeline interrupted, partial outputs saved to: "
+                       f"{output_dir}")
+            click.echo("⚠ Run again with --resume to continue testing")
+            sys.exit(1)
+
         click.echo("\n✓ Pipeline completed successfully!")
         click.echo(f"✓ Output files saved to: {output_dir}")
 
@@ -214,6 +315,81 @@ def update_databases():
         )
 
 
+@cli.group()
+def sources():
+    """
+    Inspect the sources file.
+    """
+
+
+@sources.command()
+@click.option(
+    "--sources",
+    "sources_file",
+    default="sources.txt",
+    help="Path to the sources file to analyze.",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    "--output",
+    "output_file",
+    default=None,
+    help="Also write the full report to this JSON file.",
+    type=click.Path(dir_okay=False),
+)
+def analyze(sources_file: str, output_file: str | None) -> None:
+    """
+    Find sources that mirror or are contained in other sources.
+
+    Every source is fetched (reusing the source cache of merge runs) and
+    its config set compared with the others. Identical and subset sources
+    can be dropped; sources that add almost nothing unique can be fetched
+    less often.
+    """
+    try:
+        specs = load_sources(sources_file)
+    except SourceFileError as e:
+        click.echo(f"✗ Invalid sources file {sources_file}: {e}", err=True)
+        sys.exit(1)
+    if not specs:
+        click.echo("✗ No sources found in the specified file.", err=True)
+        sys.exit(1)
+
+    click.echo(f"✓ Loaded {len(specs)} sources")
+    cache = SourceCache(Path(config.CACHE_DIR) / "sources")
+    report, results = asyncio.run(analyze_sources(specs, cache))
+
+    failed = [source for source, result in results.items()
+              if not result.success]
+    if failed:
+        click.echo(f"⚠ {len(failed)} sources could not be fetched")
+
+    table = Table(title="Redundant sources")
+    table.add_column("Source", overflow="fold")
+    table.add_column("Configs", justify="right")
+    table.add_column("Unique", justify="right")
+    table.add_column("Finding")
+    for entry in report["sources"]:
+        if entry["identical_to"]:
+            finding = f"drop: identical to {entry['identical_to']}"
+        elif entry["subset_of"]:
+            finding = f"drop: subset of {entry['subset_of']}"
+        elif entry["recommendation"] == "reduce_refresh":
+            finding = "fetch less often"
+        else:
+            continue
+        table.add_row(entry["source"], str(entry["configs"]),
+                      str(entry["unique_configs"]), finding)
+    console.print(table)
+    click.echo(f"✓ {len(report['drop'])} sources could be dropped, "
+               f"{len(report['reduce_refresh'])} fetched less often")
+
+    if output_file:
+        report["failed"] = failed
+        Path(output_file).write_text(json.dumps(report, indent=2))
+        click.echo(f"✓ Report saved to: {output_file}")
+
+
 @cli.command()
 @click.option(
     "--input",
@@ -320,6 +496,8 @@ def retest(
                     max_workers=max_workers,
                     proxies=proxies,
                     timeout=timeout,
+                    # Fresh results for the next merge, which reuses them
+                    read_cache=False,
                 )
             )
 
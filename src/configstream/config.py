@@ -18,6 +18,15 @@ class AppSettings:
     RETEST_TIMEOUT = int(os.getenv("RETEST_TIMEOUT", "8"))
     GEOIP_TIMEOUT = int(os.getenv("GEOIP_TIMEOUT", "5"))
 
+    # Race test URLs instead of falling back sequentially; the next URL is
+    # launched after TEST_RACE_STAGGER seconds without an answer
+    TEST_RACE = os.getenv("TEST_RACE", "true").lower() == "true"
+    TEST_RACE_STAGGER = float(os.getenv("TEST_RACE_STAGGER", "0.5"))
+
+    # Pre-flight TCP/TLS reachability probe
+    PREFLIGHT_TIMEOUT = float(os.getenv("PREFLIGHT_TIMEOUT", "3"))
+    PREFLIGHT_CONCURRENCY = int(os.getenv("PREFLIGHT_CONCURRENCY", "200"))
+
     # Latency thresholds
     MIN_LATENCY = int(os.getenv("MIN_LATENCY", "10"))  # milliseconds
     MAX_LATENCY = int(os.getenv("MAX_LATENCY", "10000"))  # milliseconds
@@ -26,9 +35,67 @@ class AppSettings:
     RATE_LIMIT_REQUESTS = int(os.getenv("RATE_LIMIT_REQUESTS", "100"))
     RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))  # seconds
 
+    # Share of a --target-working/--per-country-quota budget spent on
+    # sources that have not produced a working proxy yet
+    QUOTA_EXPLORATION = float(os.getenv("QUOTA_EXPLORATION", "0.1"))
+
+    # Source health history: weight of the latest run in the averages, and
+    # how many empty/dead runs in a row before a source is skipped for
+    # SOURCE_BACKOFF_HOURS (doubling each further barren run; 0 disables)
+    SOURCE_HEALTH_DECAY = float(os.getenv("SOURCE_HEALTH_DECAY", "0.3"))
+    SOURCE_BACKOFF_RUNS = int(os.getenv("SOURCE_BACKOFF_RUNS", "3"))
+    SOURCE_BACKOFF_HOURS = float(os.getenv("SOURCE_BACKOFF_HOURS", "6"))
+
     # Memory management
     BATCH_SIZE = int(os.getenv("BATCH_SIZE", "50"))
-    CACHE_TTL = int(os.getenv("CACHE_TTL", "1800"))  # 30 minutes
+    # Capacity of each queue between streaming pipeline stages
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "1000"))
+    FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "20"))
+    # raw.githubusercontent.com rate-limits bursts from a single client
+    FETCH_PER_HOST_CONCURRENCY = int(
+        os.getenv("FETCH_PER_HOST_CONCURRENCY", "4"))
+    # Requests per second per host (0 = unpaced)
+    FETCH_HOST_RATE = float(os.getenv("FETCH_HOST_RATE", "5"))
+    # How often a source answering 429 is re-queued, and the longest
+    # Retry-After worth waiting for
+    FETCH_RATE_LIMIT_RETRIES = int(os.getenv("FETCH_RATE_LIMIT_RETRIES", "2"))
+    FETCH_MAX_RETRY_AFTER = int(os.getenv("FETCH_MAX_RETRY_AFTER", "300"))
+    # Sources larger than this are aborted while downloading
+    SOURCE_MAX_BYTES = int(os.getenv("SOURCE_MAX_BYTES", str(64 * 1024 * 1024)))
+    # Sources with at least PARSE_POOL_MIN_CONFIGS lines are parsed in a
+    # process pool, PARSE_CHUNK_SIZE lines per task (PARSE_WORKERS 0 = one
+    # process per CPU, 1 = always parse inline)
+    PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))
+    PARSE_POOL_MIN_CONFIGS = int(os.getenv("PARSE_POOL_MIN_CONFIGS", "20000"))
+    PARSE_CHUNK_SIZE = int(os.getenv("PARSE_CHUNK_SIZE", "5000"))
+    # Test results are reused for this long. The workflow merges every
+    # three hours, so the next merge finds the previous one's results still
+    # fresh, with half an hour of slack for runs starting late
+    CACHE_TTL = int(os.getenv("CACHE_TTL", "12600"))  # 3.5 hours
+    CACHE_DIR = os.getenv("CACHE_DIR", "data/cache")
+    # Journaled results stay replayable by --resume for this long. A run
+    # the workflow kills is resumed by the next merge, three hours later
+    JOURNAL_MAX_AGE = int(os.getenv("JOURNAL_MAX_AGE", "14400"))  # 4 hours
+    TEST_CACHE_MAX_ENTRIES = int(os.getenv("TEST_CACHE_MAX_ENTRIES", "100000"))
+    # Cached GeoIP lookups, and addresses per lookup task on a worker thread
+    GEOIP_CACHE_MAX_ENTRIES = int(
+        os.getenv("GEOIP_CACHE_MAX_ENTRIES", "200000"))
+    GEOIP_BATCH_SIZE = int(os.getenv("GEOIP_BATCH_SIZE", "256"))
+    # Resolve server host names before GeoIP and pre-flight; answers are
+    # cached for their TTL, failures for DNS_NEGATIVE_TTL seconds
+    DNS_RESOLVE = os.getenv("DNS_RESOLVE", "true").lower() == "true"
+    DNS_TIMEOUT = float(os.getenv("DNS_TIMEOUT", "3"))
+    DNS_CONCURRENCY = int(os.getenv("DNS_CONCURRENCY", "100"))
+    DNS_NEGATIVE_TTL = int(os.getenv("DNS_NEGATIVE_TTL", "300"))
+    DNS_CACHE_MAX_ENTRIES = int(os.getenv("DNS_CACHE_MAX_ENTRIES", "100000"))
+    # How long a downloaded GeoIP database is used before asking MaxMind
+    # (conditionally) for a newer build
+    GEOIP_REFRESH_HOURS = float(os.getenv("GEOIP_REFRESH_HOURS", "24"))
+    # "mmap" (shared pages, low memory), "memory" or "auto"
+    GEOIP_READER_MODE = os.getenv("GEOIP_READER_MODE", "mmap")
+    # "reader" looks addresses up in the database; "table" in a range table
+    # compiled from it once per build (for bulk offline geolocation)
+    GEOIP_BACKEND = os.getenv("GEOIP_BACKEND", "reader")
 
     # Protocol colors (moved from hardcoded JavaScript)
     PROTOCOL_COLORS = {
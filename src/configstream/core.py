@@ -1,17 +1,23 @@
 import asyncio
 import logging
+from concurrent.futures import Executor
 from datetime import datetime
 
-from .parsers import (_parse_generic, _parse_hysteria, _parse_hysteria2,
-                    _parse_naive, _parse_ss, _parse_trojan, _parse_tuic,
-                    _parse_vless, _parse_vmess, _parse_wireguard)
+from .config import AppSettings
+from .parsers import PARSERS, parser_for
 
 from .models import Proxy
 
 logger = logging.getLogger(__name__)
 
 
-def parse_config(config_string: str) -> Proxy | None:
+def parse_config(config_string: str,
+                 scheme: str | None = None) -> Proxy | None:
+    """
+    Parse one share link.
+
+    A scheme the fetcher already classified the line as skips the lookup.
+    """
     if not config_string or not isinstance(config_string, str):
         return None
 
@@ -19,63 +25,81 @@ def parse_config(config_string: str) -> Proxy | None:
     if not config_string or config_string.startswith("#"):
         return None
 
-    try:
-        if config_string.startswith("vmess://"):
-            return _parse_vmess(config_string)
-        if config_string.startswith("vless://"):
-            return _parse_vless(config_string)
-        if config_string.startswith("ss://"):
-            return _parse_ss(config_string)
-        if config_string.startswith("trojan://"):
-            return _parse_trojan(config_string)
-        if config_string.startswith("hysteria://"):
-            return _parse_hysteria(config_string)
-        if config_string.startswith("hy2://") or config_string.startswith(
-                "hysteria2://"):
-            return _parse_hysteria2(config_string)
-        if config_string.startswith("tuic://"):
-            return _parse_tuic(config_string)
-        if config_string.startswith("wg://") or config_string.startswith(
-                "wireguard://"):
-            return _parse_wireguard(config_string)
-        if config_string.startswith("naive+https://"):
-            return _parse_naive(config_string)
-        if any(
-                config_string.startswith(f"{p}://")
-                for p in
-            ["ssh", "http", "https", "socks", "socks4", "socks5"]):
-            return _parse_generic(config_string)
-
+    parser = PARSERS.get(scheme) if scheme else parser_for(config_string)
+    if parser is None:
         logger.debug(f"Unknown protocol in config: {config_string[:50]}...")
         return None
 
+    try:
+        return parser(config_string)
     except Exception as e:
         logger.debug(f"Error parsing config: {e}")
         return None
 
 
-def parse_config_batch(config_strings: list[str]) -> list[Proxy]:
+def parse_config_batch(config_strings: list[str],
+                       schemes: list[str] | None = None) -> list[Proxy]:
     parsed = []
-    for config_string in config_strings:
-        proxy = parse_config(config_string)
+    for index, config_string in enumerate(config_strings):
+        proxy = parse_config(config_string,
+                             schemes[index] if schemes else None)
         if proxy is not None:
             parsed.append(proxy)
     return parsed
 
 
-async def geolocate_proxy(proxy: Proxy, geoip_reader=None) -> Proxy:
-    if geoip_reader is None:
-        proxy.country = "Unknown"
-        proxy.country_code = "XX"
-        return proxy
-    try:
-        response = geoip_reader.city(proxy.address)
-        proxy.country = response.country.name or "Unknown"
-        proxy.country_code = response.country.iso_code or "XX"
-        proxy.city = response.city.name or "Unknown"
-        proxy.asn = f"AS{response.autonomous_system.autonomous_system_number}"
-    except Exception:
-        proxy.country = "Unknown"
-        proxy.country_code = "XX"
-    return proxy
+def _parse_chunk(config_strings: list[str],
+                 schemes: list[str] | None = None) -> list[tuple]:
+    """
+    Parse configs in a pool worker.
+
+    Parsers only fill these fields, so sending them back as tuples keeps
+    the pickled result small.
+    """
+    return [(proxy.config, proxy.protocol, proxy.address, proxy.port,
+             proxy.uuid, proxy.remarks, proxy.details)
+            for proxy in parse_config_batch(config_strings, schemes)]
+
+
+async def parse_config_batch_parallel(
+        config_strings: list[str],
+        executor: Executor | None,
+        chunk_size: int | None = None,
+        min_configs: int | None = None,
+        schemes: list[str] | None = None) -> list[Proxy]:
+    """
+    Parse configs across a process pool without blocking the event loop.
+
+    Batches smaller than min_configs, or any batch without an executor,
+    are parsed inline, where the pool's pickling overhead would outweigh
+    the parsing itself. schemes, the fetcher's classification of each
+    config, saves looking the parsers up again. Parsers registered at runtime reach the workers
+    only if they were registered before the pool forked.
+
+    Returns:
+        Parsed proxies, in input order
+    """
+    settings = AppSettings()
+    if min_configs is None:
+        min_configs = settings.PARSE_POOL_MIN_CONFIGS
+    if executor is None or len(config_strings) < min_configs:
+        return parse_config_batch(config_strings, schemes)
 
+    chunk_size = max(1, chunk_size or settings.PARSE_CHUNK_SIZE)
+    loop = asyncio.get_running_loop()
+    chunks = await asyncio.gather(*(
+        loop.run_in_executor(executor, _parse_chunk,
+                             config_strings[i:i + chunk_size],
+                             schemes[i:i + chunk_size] if schemes else None)
+        for i in range(0, len(config_strings), chunk_size)))
+    return [
+        Proxy(config=config,
+              protocol=protocol,
+              address=address,
+              port=port,
+              uuid=uuid,
+              remarks=remarks,
+              details=details)
+        for chunk in chunks
+        for config, protocol, address, port, uuid, remarks, details in chunk
+    ]
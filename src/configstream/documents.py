@@ -0,0 +1,283 @@
+"""
+Share links from Clash and sing-box configuration documents.
+
+Sources declared with format=clash or format=sing-box publish a whole
+client configuration instead of a list of share links. The proxies (Clash)
+or outbounds (sing-box) in it are converted to the share links the rest of
+the pipeline parses. Entries of unsupported types are skipped.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import logging
+from typing import Any
+from urllib.parse import quote, urlencode
+
+import yaml
+
+from .body_stream import BodyDecodeError
+
+logger = logging.getLogger(__name__)
+
+
+def _host(server: str) -> str:
+    return f"[{server}]" if ":" in server else server
+
+
+def _link(scheme: str,
+          userinfo: str,
+          server: str,
+          port: Any,
+          name: str,
+          query: dict[str, Any] | None = None) -> str:
+    params = {k: v for k, v in (query or {}).items() if v not in (None, "")}
+    link = f"{scheme}://"
+    if userinfo:
+        link += f"{userinfo}@"
+    link += f"{_host(server)}:{int(port)}"
+    if params:
+        link += f"?{urlencode(params, quote_via=quote)}"
+    if name:
+        link += f"#{quote(name)}"
+    return link
+
+
+def _vmess(name: str, server: str, port: Any, uuid: str, alter_id: Any,
+           cipher: str | None, network: str, host: str, path: str,
+           tls: bool, sni: str) -> str:
+    data = {
+        "v": "2",
+        "ps": name,
+        "add": server,
+        "port": str(port),
+        "id": uuid,
+        "aid": str(alter_id or 0),
+        "scy": cipher or "auto",
+        "net": network or "tcp",
+        "type": "none",
+        "host": host,
+        "path": path,
+        "tls": "tls" if tls else "",
+        "sni": sni,
+    }
+    return "vmess://" + base64.b64encode(
+        json.dumps(data, ensure_ascii=False).encode()).decode()
+
+
+def _shadowsocks(name: str, server: str, port: Any, method: str,
+                 password: str) -> str:
+    userinfo = base64.b64encode(f"{method}:{password}".encode()).decode()
+    return _link("ss", userinfo, server, port, name)
+
+
+def _credentials(username: str | None, password: str | None) -> str:
+    if not username:
+        return ""
+    if not password:
+        return quote(username, safe="")
+    return f"{quote(username, safe='')}:{quote(password, safe='')}"
+
+
+def _clash_transport(proxy: dict[str, Any]) -> dict[str, Any]:
+    network = proxy.get("network") or "tcp"
+    ws = proxy.get("ws-opts") or {}
+    grpc = proxy.get("grpc-opts") or {}
+    return {
+        "type": network,
+        "path": ws.get("path"),
+        "host": (ws.get("headers") or {}).get("Host"),
+        "serviceName": grpc.get("grpc-service-name"),
+    }
+
+
+def _from_clash(proxy: dict[str, Any]) -> str | None:
+    kind = proxy.get("type")
+    name = str(proxy.get("name") or "")
+    server, port = proxy["server"], proxy["port"]
+    sni = proxy.get("servername") or proxy.get("sni")
+
+    if kind == "ss":
+        return _shadowsocks(name, server, port, proxy["cipher"],
+                            proxy["password"])
+    if kind == "vmess":
+        transport = _clash_transport(proxy)
+        return _vmess(name, server, port, proxy["uuid"],
+                      proxy.get("alterId"), proxy.get("cipher"),
+                      transport["type"], transport["host"] or "",
+                      transport["path"] or transport["serviceName"] or "",
+                      bool(proxy.get("tls")), sni or "")
+    if kind == "vless":
+        reality = proxy.get("reality-opts") or {}
+        security = ("reality" if reality else
+                    "tls" if proxy.get("tls") else "none")
+        return _link(
+            "vless", proxy["uuid"], server, port, name, {
+                "encryption": "none",
+                "security": security,
+                "sni": sni,
+                "flow": proxy.get("flow"),
+                "fp": proxy.get("client-fingerprint"),
+                "pbk": reality.get("public-key"),
+                "sid": reality.get("short-id"),
+                **_clash_transport(proxy),
+            })
+    if kind == "trojan":
+        return _link("trojan", quote(proxy["password"], safe=""), server,
+                     port, name, {
+                         "sni": sni,
+                         **_clash_transport(proxy)
+                     })
+    if kind == "hysteria2":
+        return _link("hysteria2", quote(proxy["password"], safe=""), server,
+                     port, name, {
+                         "sni": sni,
+                         "obfs": proxy.get("obfs"),
+                         "obfs-password": proxy.get("obfs-password"),
+                     })
+    if kind == "tuic":
+        return _link(
+            "tuic", _credentials(proxy["uuid"], proxy.get("password")),
+            server, port, name, {
+                "sni": sni,
+                "congestion_control": proxy.get("congestion-controller"),
+                "alpn": ",".join(proxy.get("alpn") or []),
+            })
+    if kind in ("socks5", "http"):
+        return _link(kind, _credentials(proxy.get("username"),
+                                        proxy.get("password")), server,
+                     port, name)
+    return None
+
+
+def _singbox_tls(outbound: dict[str, Any]) -> dict[str, Any]:
+    tls = outbound.get("tls") or {}
+    reality = tls.get("reality") or {}
+    return {
+        "enabled": bool(tls.get("enabled")),
+        "sni": tls.get("server_name"),
+        "alpn": ",".join(tls.get("alpn") or []),
+        "fp": (tls.get("utls") or {}).get("fingerprint"),
+        "reality": reality if reality.get("enabled") else None,
+    }
+
+
+def _singbox_transport(outbound: dict[str, Any]) -> dict[str, Any]:
+    transport = outbound.get("transport") or {}
+    return {
+        "type": transport.get("type") or "tcp",
+        "path": transport.get("path"),
+        "host": (transport.get("headers") or {}).get("Host"),
+        "serviceName": transport.get("service_name"),
+    }
+
+
+def _from_singbox(outbound: dict[str, Any]) -> str | None:
+    kind = outbound.get("type")
+    name = str(outbound.get("tag") or "")
+    if "server" not in outbound:
+        # selector, urltest, direct, block, dns, ...
+        return None
+    server, port = outbound["server"], outbound["server_port"]
+    tls = _singbox_tls(outbound)
+
+    if kind == "shadowsocks":
+        return _shadowsocks(name, server, port, outbound["method"],
+                            outbound["password"])
+    if kind == "vmess":
+        transport = _singbox_transport(outbound)
+        return _vmess(name, server, port, outbound["uuid"],
+                      outbound.get("alter_id"), outbound.get("security"),
+                      transport["type"], transport["host"] or "",
+                      transport["path"] or transport["serviceName"] or "",
+                      tls["enabled"], tls["sni"] or "")
+    if kind == "vless":
+        reality = tls["reality"] or {}
+        security = ("reality" if reality else
+                    "tls" if tls["enabled"] else "none")
+        return _link(
+            "vless", outbound["uuid"], server, port, name, {
+                "encryption": "none",
+                "security": security,
+                "sni": tls["sni"],
+                "flow": outbound.get("flow"),
+                "fp": tls["fp"],
+                "pbk": reality.get("public_key"),
+                "sid": reality.get("short_id"),
+                **_singbox_transport(outbound),
+            })
+    if kind == "trojan":
+        return _link("trojan", quote(outbound["password"], safe=""), server,
+                     port, name, {
+                         "sni": tls["sni"],
+                         **_singbox_transport(outbound)
+                     })
+    if kind == "hysteria2":
+        obfs = outbound.get("obfs") or {}
+        return _link("hysteria2", quote(outbound["password"], safe=""),
+                     server, port, name, {
+                         "sni": tls["sni"],
+                         "obfs": obfs.get("type"),
+                         "obfs-password": obfs.get("password"),
+                     })
+    if kind == "tuic":
+        return _link(
+            "tuic", _credentials(outbound["uuid"], outbound.get("password")),
+            server, port, name, {
+                "sni": tls["sni"],
+                "congestion_control": outbound.get("congestion_control"),
+                "alpn": tls["alpn"],
+            })
+    if kind in ("socks", "http"):
+        scheme = "socks5" if kind == "socks" else kind
+        return _link(scheme, _credentials(outbound.get("username"),
+                                          outbound.get("password")), server,
+                     port, name)
+    return None
+
+
+def _convert(entries: Any, convert, fmt: str) -> list[str]:
+    if not isinstance(entries, list):
+        raise BodyDecodeError(f"No proxy list in {fmt} document")
+    links = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            link = convert(entry)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.debug(f"Skipping malformed {fmt} entry: {e}")
+            continue
+        if link is not None:
+            links.append(link)
+    return links
+
+
+def clash_configs(body: bytes) -> list[str]:
+    """Share links for the proxies of a Clash (YAML) configuration"""
+    try:
+        document = yaml.safe_load(body)
+    except yaml.YAMLError as e:
+        raise BodyDecodeError(f"Invalid Clash document: {e}") from e
+    if not isinstance(document, dict):
+        raise BodyDecodeError("Clash document is not a mapping")
+    return _convert(document.get("proxies"), _from_clash, "clash")
+
+
+def singbox_configs(body: bytes) -> list[str]:
+    """Share links for the outbounds of a sing-box (JSON) configuration"""
+    try:
+        document = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise BodyDecodeError(f"Invalid sing-box document: {e}") from e
+    if not isinstance(document, dict):
+        raise BodyDecodeError("sing-box document is not an object")
+    return _convert(document.get("outbounds"), _from_singbox, "sing-box")
+
+
+# Formats whose bodies are whole documents rather than lists of lines
+DOCUMENT_PARSERS = {
+    "clash": clash_configs,
+    "sing-box": singbox_configs,
+}
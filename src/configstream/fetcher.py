@@ -6,13 +6,29 @@ This module provides improved network fetching with retry logic and detailed err
 from __future__ import annotations
 
 import asyncio
+import hashlib
+import inspect
 import logging
+from collections import deque
+from collections.abc import Callable, Iterable
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import partial
 from typing import Any
 from urllib.parse import urlparse
 
 import aiohttp
 from aiohttp import ClientTimeout
 
+from .body_stream import (BodyDecodeError, BodyTooLargeError, iter_lines,
+                          read_body, split_lines)
+from .config import AppSettings
+from .documents import DOCUMENT_PARSERS
+from .parsers import registered_scheme
+from .security.rate_limiter import RateLimiter
+from .source_cache import SourceCache
+from .sources import SourceSpec
+
 # Configure structured logging for better debugging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -37,6 +53,12 @@ class FetchResult:
         error: str | None = None,
         response_time: float | None = None,
         status_code: int | None = None,
+        not_modified: bool = False,
+        bytes_received: int = 0,
+        retry_after: float | None = None,
+        not_due: bool = False,
+        body_hash: str | None = None,
+        schemes: list[str] | None = None,
     ):
         self.source = source
         self.configs = configs
@@ -44,6 +66,20 @@ class FetchResult:
         self.error = error
         self.response_time = response_time
         self.status_code = status_code
+        # True when a 304 was answered from the source cache
+        self.not_modified = not_modified
+        # Body bytes downloaded (0 when served from the source cache)
+        self.bytes_received = bytes_received
+        # Seconds the server asked us to wait after a 429
+        self.retry_after = retry_after
+        # True when the cached body was younger than the source's refresh
+        # interval and no request was made
+        self.not_due = not_due
+        # SHA-256 of the body the configs were extracted from
+        self.body_hash = body_hash
+        # Registered scheme of each config, as classified while fetching;
+        # None when the configs came from the source cache unclassified
+        self.schemes = schemes
 
     def to_dict(self) -> dict[str, Any]:
         """Convert to dictionary for JSON serialization"""
@@ -54,15 +90,87 @@ class FetchResult:
             "error": self.error,
             "response_time": self.response_time,
             "status_code": self.status_code,
+            "not_modified": self.not_modified,
+            "bytes": self.bytes_received,
+            "retry_after": self.retry_after,
+            "not_due": self.not_due,
+            "body_hash": self.body_hash,
         }
 
 
+def config_line_scheme(line: str) -> str | None:
+    """Registered scheme of a share link line, None for any other line"""
+    scheme = registered_scheme(line)
+    if scheme is None:
+        logger.debug(f"Skipping invalid config line: {line[:50]}...")
+    return scheme
+
+
+def classify_lines(lines: Iterable[str]) -> tuple[list[str], list[str]]:
+    """The config lines among lines, and the scheme of each"""
+    configs: list[str] = []
+    schemes: list[str] = []
+    for line in lines:
+        scheme = config_line_scheme(line)
+        if scheme is not None:
+            configs.append(line)
+            schemes.append(scheme)
+    return configs, schemes
+
+
+def parse_retry_after(value: str | None, default: float = 60.0) -> float:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def extract_configs(body: bytes, fmt: str = "auto") -> list[str]:
+    """Return the config lines of a complete source body"""
+    return classify_body(body, fmt)[0]
+
+
+def classify_body(body: bytes,
+                  fmt: str = "auto") -> tuple[list[str], list[str]]:
+    """The config lines of a complete source body, and the scheme of each"""
+    if fmt in DOCUMENT_PARSERS:
+        return classify_lines(DOCUMENT_PARSERS[fmt](body))
+    return classify_lines(split_lines(body, fmt))
+
+
+def _drop_validators(headers: dict[str, str]) -> bool:
+    """Make a request unconditional; False if it already was"""
+    dropped = [
+        headers.pop(name, None)
+        for name in ("If-None-Match", "If-Modified-Since")
+    ]
+    return any(value is not None for value in dropped)
+
+
+def _parse_kind(fmt: str) -> str:
+    """Source cache key of the configs extracted in format fmt"""
+    return "fetcher" if fmt == "auto" else f"fetcher.{fmt}"
+
+
 async def fetch_from_source(
     session: aiohttp.ClientSession,
     source: str,
     timeout: int = 30,
     max_retries: int = 3,
     retry_delay: float = 1.0,
+    cache: SourceCache | None = None,
+    max_bytes: int | None = None,
+    fmt: str = "auto",
 ) -> FetchResult:
     """
     Fetch proxy configurations from a source with enhanced error handling.
@@ -73,10 +181,15 @@ async def fetch_from_source(
         timeout: Maximum time to wait for response
         max_retries: Number of retry attempts
         retry_delay: Initial delay between retries (exponential backoff)
+        cache: Source cache used for conditional requests and parse results
+        max_bytes: Abort bodies larger than this (default: SOURCE_MAX_BYTES)
+        fmt: Declared body format (see SOURCE_FORMATS), "auto" to sniff it
 
     Returns:
         FetchResult object containing configs and metadata
     """
+    if max_bytes is None:
+        max_bytes = AppSettings().SOURCE_MAX_BYTES
 
     # Validate URL format
     try:
@@ -103,10 +216,13 @@ async def fetch_from_source(
         "Cache-Control": "no-cache",
         "Pragma": "no-cache",
     }
+    if cache is not None:
+        headers.update(cache.conditional_headers(source))
 
     last_error = None
 
-    for attempt in range(max_retries):
+    attempt = 0
+    while attempt < max_retries:
         try:
             # Start timing the request
             start_time = asyncio.get_event_loop().time()
@@ -124,11 +240,58 @@ async def fetch_from_source(
                 # Calculate response time
                 response_time = asyncio.get_event_loop().time() - start_time
 
-                # Check for rate limiting
+                if response.status == 304:
+                    digest = cache.revalidated(source) if cache else None
+                    if cache is not None and digest is not None:
+                        try:
+                            configs = cache.configs(
+                                digest, _parse_kind(fmt),
+                                partial(extract_configs, fmt=fmt))
+                        except (OSError, BodyDecodeError) as e:
+                            logger.warning(
+                                f"Cached body of {source} unusable: {e}")
+                        else:
+                            logger.info(f"{source} not modified, "
+                                        f"reusing {len(configs)} configs")
+                            return FetchResult(
+                                source=source,
+                                configs=configs,
+                                success=True,
+                                response_time=response_time,
+                                status_code=response.status,
+                                not_modified=True,
+                                body_hash=digest,
+                            )
+                    # Nothing to reuse: ask for the full body, without
+                    # spending an attempt or backing off
+                    if _drop_validators(headers):
+                        logger.warning(f"{source} not modified but not "
+                                       f"cached, refetching it in full")
+                        continue
+                    raise aiohttp.ClientResponseError(
+                        request_info=response.request_info,
+                        history=response.history,
+                        status=response.status,
+                        message="Not modified, but nothing is cached",
+                        headers=response.headers,
+                    )
+
+                # Rate limited: hand the wait back to the caller instead of
+                # sleeping here while holding a connection slot
                 if response.status == 429:
-                    retry_after = response.headers.get("Retry-After", "60")
-                    raise RateLimitError(
-                        f"Rate limited. Retry after {retry_after} seconds")
+                    retry_after = parse_retry_after(
+                        response.headers.get("Retry-After"))
+                    logger.warning(f"Rate limit hit for {source}, "
+                                   f"retry after {retry_after:.0f}s")
+                    return FetchResult(
+                        source=source,
+                        configs=[],
+                        success=False,
+                        error=f"Rate limited. Retry after {retry_after:.0f} seconds",
+                        response_time=response_time,
+                        status_code=response.status,
+                        retry_after=retry_after,
+                    )
 
                 # Check for server errors (5xx)
                 if 500 <= response.status < 600:
@@ -150,41 +313,44 @@ async def fetch_from_source(
                         f"Unexpected content type for {source}: {content_type}"
                     )
 
-                # Read and process the response
-                text = await response.text(encoding="utf-8", errors="ignore")
-
-                # Parse configurations
-                configs = []
-                for line in text.splitlines():
-                    line = line.strip()
-
-                    # Skip empty lines and comments
-                    if not line or line.startswith("#"):
-                        continue
+                # Parse configurations as the body streams in
+                writer = cache.body_writer(source) if cache else None
+                # Hashed without a cache too, so mirrors can be recognized
+                hasher = hashlib.sha256()
+                received = 0
+
+                def sink(chunk: bytes) -> None:
+                    nonlocal received
+                    received += len(chunk)
+                    if writer is not None:
+                        writer.write(chunk)
+                    else:
+                        hasher.update(chunk)
 
-                    # Basic validation for proxy configs
-                    # (vmess://, vless://, ss://, trojan://, etc.)
-                    if any(
-                            line.startswith(prefix) for prefix in [
-                                "vmess://",
-                                "vless://",
-                                "ss://",
-                                "trojan://",
-                                "hysteria://",
-                                "hysteria2://",
-                                "tuic://",
-                                "wireguard://",
-                                "naive://",
-                                "http://",
-                                "https://",
-                                "socks://",
-                                "socks5://",
-                                "socks4://",
-                            ]):
-                        configs.append(line)
+                try:
+                    if fmt in DOCUMENT_PARSERS:
+                        configs, schemes = classify_body(
+                            await read_body(response, max_bytes, sink=sink),
+                            fmt)
+                    else:
+                        configs, schemes = [], []
+                        async for line in iter_lines(
+                                response, max_bytes, sink=sink, fmt=fmt):
+                            scheme = config_line_scheme(line)
+                            if scheme is not None:
+                                configs.append(line)
+                                schemes.append(scheme)
+                    if writer is not None:
+                        digest = writer.commit(
+                            response.headers.get("ETag"),
+                            response.headers.get("Last-Modified"))
+                        writer.cache.put_configs(digest, _parse_kind(fmt),
+                                                 configs)
                     else:
-                        logger.debug(
-                            f"Skipping invalid config line: {line[:50]}...")
+                        digest = hasher.hexdigest()
+                finally:
+                    if writer is not None:
+                        writer.abort()
 
                 # Log success
                 logger.info(
@@ -197,13 +363,19 @@ async def fetch_from_source(
                     success=True,
                     response_time=response_time,
                     status_code=response.status,
+                    bytes_received=received,
+                    body_hash=digest,
+                    schemes=schemes,
                 )
 
-        except RateLimitError as e:
-            logger.warning(f"Rate limit hit for {source}: {e}")
-            last_error = str(e)
-            # Wait longer for rate limits
-            await asyncio.sleep(60)
+        except (BodyTooLargeError, BodyDecodeError) as e:
+            # Retrying would only download the same bogus body again
+            logger.warning(f"Rejected body of {source}: {e}")
+            return FetchResult(source=source,
+                               configs=[],
+                               success=False,
+                               error=str(e),
+                               status_code=response.status)
 
         except TimeoutError:
             last_error = f"Timeout after {timeout} seconds"
@@ -225,6 +397,7 @@ async def fetch_from_source(
             delay = retry_delay * (2**attempt)  # Exponential backoff
             logger.debug(f"Waiting {delay:.1f}s before retry...")
             await asyncio.sleep(delay)
+        attempt += 1
 
     # All attempts failed
     logger.error(
@@ -236,23 +409,242 @@ async def fetch_from_source(
                        error=last_error)
 
 
+class _Host:
+    """Per-host fetch state shared by every request to that host"""
+
+    def __init__(self, per_host: int):
+        self.slots = asyncio.Semaphore(per_host)
+        # Loop time before which no request may be sent (Retry-After)
+        self.not_before = 0.0
+
+    def defer(self, seconds: float) -> None:
+        loop = asyncio.get_running_loop()
+        self.not_before = max(self.not_before, loop.time() + seconds)
+
+    async def wait(self) -> None:
+        loop = asyncio.get_running_loop()
+        while (delay := self.not_before - loop.time()) > 0:
+            await asyncio.sleep(delay)
+
+
+class FetchEngine:
+    """
+    Pooled, host-aware fetching of many sources over one session.
+
+    All requests share a single connection pool. At most max_concurrent
+    requests are in flight overall and at most per_host against any one
+    host, and each host is paced by a token bucket. A 429 re-queues the
+    source behind a not-before time for its host: that host pauses for
+    Retry-After seconds while every other host keeps using the global
+    slots.
+
+    Sources may be given as SourceSpecs: a source whose cached body is
+    younger than its refresh interval is answered from the source cache
+    without a request, and its format and max_bytes apply to the fetch.
+
+    Example:
+        >>> async with FetchEngine(cache=cache) as engine:
+        ...     await engine.fetch_each(sources, on_result=handle)
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int | None = None,
+        per_host: int | None = None,
+        timeout: int = 30,
+        max_retries: int = 3,
+        cache: SourceCache | None = None,
+        max_bytes: int | None = None,
+        host_rate: float | None = None,
+    ):
+        """
+        Args:
+            max_concurrent: Requests in flight overall (default: FETCH_CONCURRENCY)
+            per_host: Requests in flight per host (default: FETCH_PER_HOST_CONCURRENCY)
+            timeout: Timeout per request
+            max_retries: Attempts per source on errors and timeouts
+            cache: Source cache used for conditional requests and parse results
+            max_bytes: Abort bodies larger than this (default: SOURCE_MAX_BYTES)
+            host_rate: Requests per second per host, 0 for no pacing
+                (default: FETCH_HOST_RATE)
+        """
+        settings = AppSettings()
+        self.max_concurrent = max(1, max_concurrent
+                                  or settings.FETCH_CONCURRENCY)
+        self.per_host = max(1, per_host
+                            or settings.FETCH_PER_HOST_CONCURRENCY)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.cache = cache
+        self.max_bytes = max_bytes
+        if host_rate is None:
+            host_rate = settings.FETCH_HOST_RATE
+        self.rate_limiter = RateLimiter(host_rate) if host_rate > 0 else None
+        self.rate_limit_retries = settings.FETCH_RATE_LIMIT_RETRIES
+        self.max_retry_after = settings.FETCH_MAX_RETRY_AFTER
+        self._session: aiohttp.ClientSession | None = None
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        self._hosts: dict[str, _Host] = {}
+
+    async def __aenter__(self) -> FetchEngine:
+        connector = aiohttp.TCPConnector(
+            limit=self.max_concurrent,
+            limit_per_host=self.per_host,
+            ttl_dns_cache=300,  # DNS cache timeout
+            enable_cleanup_closed=True,  # Clean up closed connections
+        )
+        self._session = aiohttp.ClientSession(connector=connector)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def fetch(self, source: str | SourceSpec) -> FetchResult:
+        """Fetch one source, honoring the host limits and Retry-After"""
+        results = []
+        await self.fetch_each([source],
+                              lambda _, result: results.append(result))
+        return results[0]
+
+    async def fetch_each(
+        self,
+        sources: Iterable[str | SourceSpec],
+        on_result: Callable[[str, FetchResult], Any],
+    ) -> None:
+        """
+        Fetch sources concurrently, handing each result over as it arrives.
+
+        Every host gets up to per_host lanes working through its own
+        queue, so a paused host never blocks another one. on_result is
+        called with (source URL, result) and may be a coroutine; while it
+        is blocked, that lane starts no further fetches.
+        """
+        if self._session is None:
+            raise RuntimeError("FetchEngine must be used with 'async with'")
+
+        queues: dict[str, deque[tuple[SourceSpec, int]]] = {}
+        for source in map(SourceSpec.coerce, sources):
+            queues.setdefault(_host_name(source.url),
+                              deque()).append((source, 0))
+
+        lanes = [
+            asyncio.create_task(self._lane(host, queue, on_result))
+            for host, queue in queues.items()
+            for _ in range(min(self.per_host, len(queue)))
+        ]
+        try:
+            await asyncio.gather(*lanes)
+        finally:
+            for lane in lanes:
+                lane.cancel()
+            await asyncio.gather(*lanes, return_exceptions=True)
+
+    async def _lane(self, host_name: str,
+                    queue: deque[tuple[SourceSpec, int]],
+                    on_result: Callable[[str, FetchResult], Any]) -> None:
+        host = self._hosts.setdefault(host_name, _Host(self.per_host))
+        while queue:
+            spec, rate_limited = queue.popleft()
+            source = spec.url
+            result = self._not_due(spec)
+            if result is None:
+                async with host.slots:
+                    # Waiting here holds only this host's slot, never a
+                    # global one
+                    await host.wait()
+                    if self.rate_limiter is not None:
+                        await self.rate_limiter.acquire(host_name)
+                    async with self._slots:
+                        result = await self._fetch_once(spec)
+
+            if (result.retry_after is not None
+                    and rate_limited < self.rate_limit_retries
+                    and result.retry_after <= self.max_retry_after):
+                logger.info(f"Pausing {host_name or source} for "
+                            f"{result.retry_after:.0f}s, {source} re-queued")
+                host.defer(result.retry_after)
+                queue.append((spec, rate_limited + 1))
+                continue
+
+            try:
+                outcome = on_result(source, result)
+                if inspect.isawaitable(outcome):
+                    await outcome
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Fetch result callback failed: {e}")
+
+    def _not_due(self, spec: SourceSpec) -> FetchResult | None:
+        """Answer a source from the cache while its refresh interval lasts"""
+        if self.cache is None or spec.refresh is None:
+            return None
+        digest = self.cache.fresh(spec.url, spec.refresh)
+        if digest is None:
+            return None
+        try:
+            configs = self.cache.configs(
+                digest, _parse_kind(spec.format),
+                partial(extract_configs, fmt=spec.format))
+        except (OSError, BodyDecodeError) as e:
+            logger.warning(f"Refetching {spec.url}, cached body unusable: {e}")
+            return None
+        logger.debug(f"{spec.url} not due, reusing {len(configs)} configs")
+        return FetchResult(source=spec.url,
+                           configs=configs,
+                           success=True,
+                           not_due=True,
+                           body_hash=digest)
+
+    async def _fetch_once(self, spec: SourceSpec) -> FetchResult:
+        assert self._session is not None, "fetch_each checks the session"
+        try:
+            return await fetch_from_source(self._session,
+                                           spec.url,
+                                           self.timeout,
+                                           self.max_retries,
+                                           cache=self.cache,
+                                           max_bytes=spec.max_bytes
+                                           or self.max_bytes,
+                                           fmt=spec.format)
+        except Exception as e:
+            # Handle exceptions that escaped the try-catch
+            logger.error(f"Unhandled exception for {spec.url}: {e}")
+            return FetchResult(source=spec.url,
+                               configs=[],
+                               success=False,
+                               error=str(e))
+
+
+def _host_name(source: str) -> str:
+    try:
+        return urlparse(source).netloc.lower()
+    except ValueError:
+        return ""
+
+
 class SourceFetcher:
     """A class to fetch proxy configurations from multiple sources."""
 
+    def __init__(self, cache: SourceCache | None = None):
+        self.cache = cache
+
     async def fetch_all(self,
-                        sources: list[str],
+                        sources: list[str | SourceSpec],
                         max_proxies: int | None = None) -> list[str]:
         """
         Fetch all proxy configurations from the given sources.
 
         Args:
-            sources: A list of source URLs.
+            sources: A list of source URLs or SourceSpecs.
             max_proxies: The maximum number of proxies to fetch.
 
         Returns:
             A list of proxy configurations.
         """
-        results = await fetch_multiple_sources(sources)
+        results = await fetch_multiple_sources(sources, cache=self.cache)
         all_configs = []
         for result in results.values():
             if result.success:
@@ -262,53 +654,33 @@ class SourceFetcher:
         return all_configs
 
 
-async def fetch_multiple_sources(sources: list[str],
-                                 max_concurrent: int = 10,
-                                 timeout: int = 30) -> dict[str, FetchResult]:
+async def fetch_multiple_sources(
+        sources: list[str | SourceSpec],
+        max_concurrent: int = 10,
+        timeout: int = 30,
+        cache: SourceCache | None = None,
+        per_host: int | None = None) -> dict[str, FetchResult]:
     """
     Fetch from multiple sources concurrently with rate limiting.
 
     Args:
-        sources: List of source URLs
+        sources: List of source URLs or SourceSpecs
         max_concurrent: Maximum concurrent requests
         timeout: Timeout per request
+        cache: Source cache used for conditional requests and parse results
+        per_host: Maximum concurrent requests per host
 
     Returns:
         Dictionary mapping source URL to FetchResult
     """
     results = {}
 
-    # Create a semaphore to limit concurrent requests
-    semaphore = asyncio.Semaphore(max_concurrent)
-
-    async def fetch_with_semaphore(session, source):
-        async with semaphore:
-            return await fetch_from_source(session, source, timeout)
-
-    # Create session with connection pooling
-    connector = aiohttp.TCPConnector(
-        limit=100,  # Total connection pool limit
-        limit_per_host=10,  # Per-host connection limit
-        ttl_dns_cache=300,  # DNS cache timeout
-        enable_cleanup_closed=True,  # Clean up closed connections
-    )
-
-    async with aiohttp.ClientSession(connector=connector) as session:
-        tasks = [fetch_with_semaphore(session, source) for source in sources]
+    def collect(source: str, result: FetchResult) -> None:
+        results[source] = result
 
-        # Use asyncio.gather with return_exceptions to handle failures gracefully
-        fetch_results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        for source, result in zip(sources, fetch_results):
-            if isinstance(result, Exception):
-                # Handle exceptions that escaped the try-catch
-                logger.error(f"Unhandled exception for {source}: {result}")
-                results[source] = FetchResult(source=source,
-                                              configs=[],
-                                              success=False,
-                                              error=str(result))
-            else:
-                results[source] = result
+    async with FetchEngine(max_concurrent, per_host, timeout,
+                           cache=cache) as engine:
+        await engine.fetch_each(sources, collect)
 
     # Log summary
     successful = sum(1 for r in results.values() if r.success)
@@ -317,4 +689,7 @@ async def fetch_multiple_sources(sources: list[str],
         f"Fetch complete: {successful}/{len(sources)} sources successful, "
         f"{total_configs} total configs collected")
 
-    return results
+    return {
+        spec.url: results[spec.url]
+        for spec in map(SourceSpec.coerce, sources)
+    }
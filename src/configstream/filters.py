@@ -0,0 +1,92 @@
+"""
+Filters that can be decided before a proxy is tested.
+
+Country/ASN (from GeoIP), protocol and port do not depend on a live test,
+so the pipeline applies them up front and only tests proxies that could
+make it into the output. Latency filters still run after testing.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from .models import Proxy
+
+# Scheme-style names users tend to type, mapped to Proxy.protocol values
+PROTOCOL_ALIASES = {
+    "ss": "shadowsocks",
+    "hy2": "hysteria2",
+    "wg": "wireguard",
+}
+
+
+def parse_filter_values(value: str | Iterable[str] | None) -> set[str] | None:
+    """Turn "a,b" or ["a", "b"] into {"a", "b"}; empty input means no filter"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    values = {str(v).strip() for v in value if str(v).strip()}
+    return values or None
+
+
+def _normalize_asn(asn: str) -> str:
+    asn = asn.strip().upper()
+    return asn if asn.startswith("AS") else f"AS{asn}"
+
+
+@dataclass
+class PreTestFilter:
+    """Country, ASN, protocol and port constraints applied before testing"""
+
+    countries: set[str] | None = None
+    asns: set[str] | None = None
+    protocols: set[str] | None = None
+    ports: set[int] | None = None
+
+    @classmethod
+    def from_options(
+        cls,
+        country: str | Iterable[str] | None = None,
+        asn: str | Iterable[str] | None = None,
+        protocol: str | Iterable[str] | None = None,
+        port: str | Iterable[int] | None = None,
+    ) -> PreTestFilter:
+        countries = parse_filter_values(country)
+        asns = parse_filter_values(asn)
+        protocols = parse_filter_values(protocol)
+        ports = parse_filter_values(
+            [str(p) for p in port] if port is not None
+            and not isinstance(port, str) else port)
+
+        return cls(
+            countries={c.upper() for c in countries} if countries else None,
+            asns={_normalize_asn(a) for a in asns} if asns else None,
+            protocols={
+                PROTOCOL_ALIASES.get(p.lower(), p.lower())
+                for p in protocols
+            } if protocols else None,
+            ports={int(p) for p in ports} if ports else None,
+        )
+
+    @property
+    def active(self) -> bool:
+        return any((self.countries, self.asns, self.protocols, self.ports))
+
+    @property
+    def needs_geo(self) -> bool:
+        """True if matching requires the proxy to be geolocated first"""
+        return bool(self.countries or self.asns)
+
+    def matches(self, proxy: Proxy) -> bool:
+        if self.protocols and proxy.protocol.lower() not in self.protocols:
+            return False
+        if self.ports and proxy.port not in self.ports:
+            return False
+        if self.countries and (proxy.country_code or "").upper(
+        ) not in self.countries:
+            return False
+        if self.asns and (proxy.asn or "").upper() not in self.asns:
+            return False
+        return True
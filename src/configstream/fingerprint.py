@@ -0,0 +1,144 @@
+"""
+Canonical fingerprints of proxy configs.
+
+The same server is routinely republished with different remarks, query
+parameter order, base64 padding or URL encoding. The fingerprint is built
+from what decides where and how a client connects (protocol, normalized
+host, port, credentials and transport parameters), so all of those copies
+map to one fingerprint and only one of them is tested.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import ipaddress
+import json
+from typing import Any
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from .models import Proxy
+
+# Parameters that only label a config
+COSMETIC_PARAMS = frozenset({"ps", "remarks", "remark", "name", "tag", "v"})
+
+# vmess JSON fields that are already part of the fingerprint
+_VMESS_ENDPOINT = frozenset({"add", "port", "id"})
+
+# Values that mean the same as leaving the parameter out
+PARAM_DEFAULTS = {
+    "aid": {"0"},
+    "alterid": {"0"},
+    "encryption": {"none"},
+    "headertype": {"none"},
+    "net": {"tcp"},
+    "scy": {"auto"},
+    "security": {"none"},
+    "tls": {"none"},
+    # vless network or vmess header type
+    "type": {"tcp", "none"},
+    "allowinsecure": {"0", "false"},
+    "insecure": {"0", "false"},
+}
+
+# Parameters whose values are case-insensitive
+_CASELESS_PARAMS = frozenset({
+    "alpn", "encryption", "flow", "fp", "headertype", "host", "net",
+    "obfs", "scy", "security", "sni", "tls", "type", "congestion_control",
+})
+
+
+def normalize_host(host: str) -> str:
+    """Lower-case host without brackets or trailing dot; IPs compressed"""
+    host = host.strip().strip("[]").rstrip(".").lower()
+    try:
+        return ipaddress.ip_address(host).compressed
+    except ValueError:
+        return host
+
+
+def _normalize_params(params: dict[str, Any], host: str) -> list[list[str]]:
+    normalized = {}
+    for key, value in params.items():
+        key = key.strip().lower()
+        if key in COSMETIC_PARAMS:
+            continue
+        if isinstance(value, (list, tuple)):
+            value = ",".join(sorted(str(v).strip() for v in value))
+        value = unquote(str(value)).strip()
+        if key in _CASELESS_PARAMS:
+            value = value.lower()
+        if key in ("sni", "host", "peer", "servername"):
+            value = normalize_host(value)
+            # The server address is what the client uses without them
+            if value == host:
+                continue
+        if value == "" or value in PARAM_DEFAULTS.get(key, ()):
+            continue
+        normalized[key] = value
+    return sorted([key, value] for key, value in normalized.items())
+
+
+def canonical_form(proxy: Proxy) -> list[Any]:
+    """
+    The parts of a config that identify the server it connects to.
+
+    vmess and Shadowsocks are taken from their decoded fields; every other
+    protocol from its share link.
+    """
+    if proxy.protocol == "vmess":
+        details = proxy.details or {}
+        host = normalize_host(proxy.address)
+        params = {
+            k: v
+            for k, v in details.items() if k not in _VMESS_ENDPOINT
+        }
+        return [
+            "vmess", host, int(proxy.port),
+            str(details.get("id", proxy.uuid)).strip().lower(),
+            _normalize_params(params, host)
+        ]
+
+    if proxy.protocol == "shadowsocks":
+        details = proxy.details or {}
+        host = normalize_host(proxy.address)
+        query = urlsplit(proxy.config.split("#", 1)[0]).query
+        return [
+            "shadowsocks", host, int(proxy.port),
+            str(details.get("method", "")).lower(),
+            str(details.get("password", "")),
+            _normalize_params(dict(parse_qsl(query)), host)
+        ]
+
+    parts = urlsplit(proxy.config.strip().split("#", 1)[0].replace(
+        "naive+https://", "naive://", 1))
+    host = normalize_host(parts.hostname or proxy.address)
+    try:
+        port = parts.port or int(proxy.port)
+    except ValueError:
+        port = int(proxy.port)
+    username = unquote(parts.username or "")
+    if proxy.protocol in ("vless", "tuic"):
+        # UUIDs are case-insensitive
+        username = username.lower()
+    path = parts.path if parts.path not in ("", "/") else ""
+    return [
+        proxy.protocol, host, port, username,
+        unquote(parts.password or ""), path,
+        _normalize_params(dict(parse_qsl(parts.query)), host)
+    ]
+
+
+def config_fingerprint(proxy: Proxy) -> str:
+    """
+    Stable fingerprint of a proxy config.
+
+    Copies of one server that differ only in remarks, parameter order,
+    encoding or default-valued parameters share a fingerprint.
+    """
+    try:
+        form = canonical_form(proxy)
+    except (TypeError, ValueError):
+        # Unusual configs still deduplicate on their text, minus remarks
+        form = ["raw", proxy.config.strip().split("#", 1)[0]]
+    encoded = json.dumps(form, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:32]
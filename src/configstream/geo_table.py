@@ -0,0 +1,296 @@
+"""
+Compiled IP range table of a GeoIP database.
+
+Looking addresses up one reader.city() call at a time walks the database's
+search tree and decodes a full record per address. GeoIPRangeTable flattens
+the tree once per database build into sorted range starts (IPv4 as 32-bit
+integers, IPv6 as 16 big-endian bytes) with the index of each range's
+(country, country_code, city, asn) entry next to them. The file is memory
+mapped, so loading it costs nothing and processes share its pages, and a
+batch of addresses is resolved by sorting it and walking the starts in
+step, searchsorted-style.
+
+Answers are the same as GeoIPService's reader lookups.
+"""
+
+from __future__ import annotations
+
+import bisect
+import ipaddress
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Iterable, Sequence
+from pathlib import Path
+from typing import Any
+
+MAGIC = b"CSGEOR1\0"
+# magic, build epoch, IP version, country only, IPv4 ranges, IPv6 ranges,
+# size of the JSON entries
+_HEADER = struct.Struct("<8sQBBxxIII")
+
+_IPV4_RANGE = 1 << 32
+_IPV6_END = (1 << 128) - 1
+
+Entry = tuple[str, str, str, str]
+
+
+def range_entry(record: dict[str, Any], country_only: bool) -> Entry:
+    """
+    The (country, country_code, city, asn) of a raw database record.
+
+    Mirrors what GeoIPService reads from the geoip2 models.
+    """
+    country = record.get("country") or {}
+    city = ""
+    if not country_only:
+        city = ((record.get("city") or {}).get("names")
+                or {}).get("en") or "Unknown"
+    # Top level in ASN databases, a trait in those with ISP data
+    number = (record.get("autonomous_system_number")
+              or (record.get("traits") or {}).get("autonomous_system_number"))
+    return (
+        (country.get("names") or {}).get("en") or "Unknown",
+        country.get("iso_code") or "XX",
+        city,
+        f"AS{number}" if number else "",
+    )
+
+
+def _flatten(ranges: list[tuple[int, int, int]],
+             end: int) -> tuple[list[int], list[int]]:
+    """Sorted (first, last, entry) ranges as starts with gaps as entry 0"""
+    starts: list[int] = []
+    ids: list[int] = []
+    covered = -1
+    for first, last, entry in sorted(ranges):
+        if first <= covered:
+            # Overlaps an earlier, more specific or equal range
+            first = covered + 1
+            if first > last:
+                continue
+        if first > covered + 1:
+            starts.append(covered + 1)
+            ids.append(0)
+        if not ids or ids[-1] != entry:
+            starts.append(first)
+            ids.append(entry)
+        covered = last
+    if covered < end:
+        starts.append(covered + 1)
+        ids.append(0)
+    return starts, ids
+
+
+class _Keys16:
+    """16-byte big-endian keys of a buffer, as a sequence for bisect"""
+
+    def __init__(self, buffer: memoryview):
+        self.buffer = buffer
+
+    def __len__(self) -> int:
+        return len(self.buffer) // 16
+
+    def __getitem__(self, index: int) -> bytes:
+        return bytes(self.buffer[index * 16:index * 16 + 16])
+
+
+class GeoIPRangeTable:
+    """Range starts and entry indexes of one GeoIP database build"""
+
+    def __init__(self,
+                 epoch: int,
+                 ip_version: int,
+                 country_only: bool,
+                 v4_starts: Sequence[int],
+                 v4_ids: Sequence[int],
+                 v6_starts: bytes | memoryview,
+                 v6_ids: Sequence[int],
+                 entries: list[Entry | None],
+                 mapped: mmap.mmap | None = None):
+        self.epoch = epoch
+        self.ip_version = ip_version
+        self.country_only = country_only
+        self.v4_starts = v4_starts
+        self.v4_ids = v4_ids
+        self.v6_starts = _Keys16(memoryview(v6_starts))
+        self.v6_ids = v6_ids
+        # Entry 0 is "not in the database"
+        self.entries = entries
+        self._mapped = mapped
+
+    @classmethod
+    def compile(cls, networks: Iterable[tuple[Any, dict[str, Any]]],
+                epoch: int, ip_version: int,
+                country_only: bool) -> GeoIPRangeTable:
+        """
+        Build a table from (network, record) pairs, as iterating a
+        maxminddb Reader yields them.
+        """
+        entry_ids: dict[Entry, int] = {}
+        entries: list[Entry | None] = [None]
+        ranges: dict[int, list[tuple[int, int, int]]] = {4: [], 6: []}
+        for network, record in networks:
+            network = ipaddress.ip_network(network)
+            entry = range_entry(record or {}, country_only)
+            index = entry_ids.get(entry)
+            if index is None:
+                index = entry_ids[entry] = len(entries)
+                entries.append(entry)
+            ranges[network.version].append(
+                (int(network.network_address),
+                 int(network.broadcast_address), index))
+
+        v4_starts, v4_ids = _flatten(ranges[4], _IPV4_RANGE - 1)
+        v6_starts, v6_ids = _flatten(ranges[6], _IPV6_END)
+        return cls(epoch, ip_version, country_only, array("I", v4_starts),
+                   array("I", v4_ids),
+                   b"".join(start.to_bytes(16, "big")
+                            for start in v6_starts), array("I", v6_ids),
+                   entries)
+
+    @classmethod
+    def from_database(cls, db_path: str | Path) -> GeoIPRangeTable:
+        """Compile the table of an .mmdb database (slow: reads every range)"""
+        import maxminddb
+        with maxminddb.open_database(str(db_path)) as reader:
+            metadata = reader.metadata()
+            return cls.compile(
+                reader, metadata.build_epoch, metadata.ip_version,
+                metadata.database_type.endswith("-Country"))
+
+    def save(self, path: str | Path) -> None:
+        """Write the table atomically in the memory-mappable format"""
+        path = Path(path)
+        encoded = json.dumps(self.entries).encode("utf-8")
+        columns = [array("I", self.v4_starts), array("I", self.v4_ids)]
+        v6_ids = array("I", self.v6_ids)
+        if sys.byteorder == "big":
+            for column in (*columns, v6_ids):
+                column.byteswap()
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "wb") as out:
+            out.write(
+                _HEADER.pack(MAGIC, self.epoch, self.ip_version,
+                             self.country_only, len(self.v4_ids),
+                             len(self.v6_ids), len(encoded)))
+            for column in columns:
+                out.write(column.tobytes())
+            out.write(self.v6_starts.buffer)
+            out.write(v6_ids.tobytes())
+            out.write(encoded)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> GeoIPRangeTable:
+        """
+        Map a saved table.
+
+        Raises:
+            ValueError: If the file is not a complete table
+        """
+        with open(path, "rb") as source:
+            mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, epoch, ip_version, country_only, v4_count, v6_count,
+             entries_size) = _HEADER.unpack_from(mapped)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a GeoIP range table")
+            offset = _HEADER.size
+            sizes = [4 * v4_count, 4 * v4_count, 16 * v6_count, 4 * v6_count]
+            if len(mapped) != offset + sum(sizes) + entries_size:
+                raise ValueError(f"{path} is truncated")
+            entries = [
+                tuple(entry) if entry else None
+                for entry in json.loads(mapped[len(mapped) - entries_size:])
+            ]
+        except (struct.error, ValueError):
+            mapped.close()
+            raise
+
+        view = memoryview(mapped)
+        columns = []
+        for size in sizes:
+            columns.append(view[offset:offset + size])
+            offset += size
+        v4_starts, v4_ids, v6_starts, v6_ids = columns
+
+        def integers(column: memoryview) -> Sequence[int]:
+            if sys.byteorder == "big":
+                swapped = array("I", bytes(column))
+                swapped.byteswap()
+                return swapped
+            return column.cast("I")
+
+        return cls(epoch, ip_version, bool(country_only),
+                   integers(v4_starts), integers(v4_ids), v6_starts,
+                   integers(v6_ids), entries, mapped)
+
+    def close(self) -> None:
+        if self._mapped is not None:
+            # Views into the map have to go before it can close
+            self.v4_starts = self.v4_ids = self.v6_ids = array("I")
+            self.v6_starts = _Keys16(memoryview(b""))
+            self._mapped.close()
+            self._mapped = None
+
+    def _key(self, address: str) -> tuple[int, Any] | None:
+        """(4, int) or (6, bytes) search key of an address, None if invalid"""
+        try:
+            ip = ipaddress.ip_address(address.strip("[]"))
+        except ValueError:
+            return None
+        if ip.version == 4:
+            return 4, int(ip)
+        if self.ip_version == 4:
+            return None
+        # The IPv4 aliases of an IPv6 database (::/96, ::ffff:0:0/96,
+        # 6to4 and Teredo) answer with the IPv4 range
+        ipv4 = (ip.ipv4_mapped or ip.sixtofour
+                or (ip.teredo[0] if ip.teredo else None))
+        if ipv4 is not None:
+            return 4, int(ipv4)
+        if int(ip) < _IPV4_RANGE:
+            return 4, int(ip)
+        return 6, ip.packed
+
+    def _find(self, key: tuple[int, Any], low: int = 0) -> tuple[int, int]:
+        """(range, entry index) of a key, searching range starts from low"""
+        version, value = key
+        starts = self.v4_starts if version == 4 else self.v6_starts
+        ids = self.v4_ids if version == 4 else self.v6_ids
+        position = bisect.bisect_right(starts, value, low) - 1
+        return position, ids[position] if position >= 0 else 0
+
+    def lookup(self, address: str) -> Entry | None:
+        """Entry of one address, None if it is not in the database"""
+        key = self._key(address)
+        if key is None:
+            return None
+        _, entry = self._find(key)
+        return self.entries[entry]
+
+    def lookup_many(self, addresses: Sequence[str]) -> list[Entry | None]:
+        """
+        Entries of many addresses, in input order.
+
+        The addresses are sorted so each search starts where the previous
+        one ended; that makes a large batch one pass over the starts.
+        """
+        found: list[Entry | None] = [None] * len(addresses)
+        keyed = []
+        for index, address in enumerate(addresses):
+            key = self._key(address)
+            if key is not None:
+                keyed.append((key, index))
+        keyed.sort()
+
+        low = {4: 0, 6: 0}
+        for key, index in keyed:
+            position, entry = self._find(key, low[key[0]])
+            low[key[0]] = max(position, 0)
+            found[index] = self.entries[entry]
+        return found
@@ -1,11 +1,48 @@
 """GeoIP database management"""
 
+import asyncio
+import json
+import logging
 import os
+import shutil
+import sys
 import tarfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
 from pathlib import Path
+from typing import Any
 
 import aiohttp
 
+from .config import AppSettings
+from .fingerprint import normalize_host
+from .geo_table import GeoIPRangeTable
+from .models import Proxy
+
+logger = logging.getLogger(__name__)
+
+CITY_DB = "GeoLite2-City.mmdb"
+COUNTRY_DB = "GeoLite2-Country.mmdb"
+# The City and Country editions have no ASNs; they come from this one
+ASN_DB = "GeoLite2-ASN.mmdb"
+EDITIONS = {
+    "country": "GeoLite2-Country",
+    "city": "GeoLite2-City",
+    "asn": "GeoLite2-ASN",
+}
+# Validators and last check of every downloaded edition
+STATE_FILE = "geoip_state.json"
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+
+# mmap shares the file's pages between processes and keeps RSS low;
+# memory reads the whole database into each process up front
+GEOIP_READER_MODES = ("auto", "mmap", "memory")
+GEOIP_BACKENDS = ("reader", "table")
+# Compiled range tables are kept next to their database
+RANGE_TABLE_SUFFIX = ".ranges"
+
 
 class GeoIPManager:
     """Download and manage GeoIP databases"""
@@ -15,6 +52,8 @@ class GeoIPManager:
         "https://download.maxmind.com/app/geoip_download?edition_id=GeoLite2-Country&license_key={key}&suffix=tar.gz",
         "city":
         "https://download.maxmind.com/app/geoip_download?edition_id=GeoLite2-City&license_key={key}&suffix=tar.gz",
+        "asn":
+        "https://download.maxmind.com/app/geoip_download?edition_id=GeoLite2-ASN&license_key={key}&suffix=tar.gz",
     }
 
     def __init__(self, license_key: str | None = None):
@@ -24,7 +63,11 @@ class GeoIPManager:
 
     async def download_databases(self) -> bool:
         """
-        Download GeoIP databases.
+        Bring the GeoIP databases up to date, both editions concurrently.
+
+        An edition checked within GEOIP_REFRESH_HOURS is skipped; otherwise
+        a conditional request only downloads it when MaxMind has a newer
+        build.
 
         Returns:
             True if successful, False otherwise
@@ -34,70 +77,137 @@ class GeoIPManager:
             print("   Set environment variable or GitHub secret to enable")
             return False
 
-        success = True
-
         async with aiohttp.ClientSession() as session:
-            for db_type, url_template in self.GEOIP_URLS.items():
-                url = url_template.format(key=self.license_key)
-
-                try:
-                    print(f"📥 Downloading GeoLite2-{db_type.title()}...")
-                    await self._download_and_extract(session, url, db_type)
-                    print(
-                        f"✅ GeoLite2-{db_type.title()} downloaded successfully"
-                    )
-
-                except Exception as e:
-                    print(
-                        f"❌ Failed to download GeoLite2-{db_type.title()}: {str(e)}"
-                    )
-                    success = False
+            results = await asyncio.gather(*(
+                self._update(session, url_template.format(
+                    key=self.license_key), db_type)
+                for db_type, url_template in self.GEOIP_URLS.items()))
+        return all(results)
+
+    async def _update(self, session: aiohttp.ClientSession, url: str,
+                      db_type: str) -> bool:
+        name = EDITIONS[db_type]
+        try:
+            print(f"📥 Checking {name}...")
+            if await self._download_and_extract(session, url, db_type):
+                print(f"✅ {name} downloaded successfully")
+            else:
+                print(f"✅ {name} is up to date")
+        except Exception as e:
+            print(f"❌ Failed to download {name}: {str(e)}")
+            return False
 
-        return success
+        if AppSettings().GEOIP_BACKEND == "table":
+            try:
+                if await asyncio.to_thread(build_range_table,
+                                           self._db_path(db_type)):
+                    print(f"✅ {name} range table compiled")
+            except Exception as e:
+                # The reader still answers without it
+                print(f"⚠️ Could not compile the {name} range table: {e}")
+        return True
+
+    def _db_path(self, db_type: str) -> Path:
+        return self.data_dir / f"{EDITIONS[db_type]}.mmdb"
+
+    def _load_state(self) -> dict:
+        """ETag, Last-Modified and check time of every edition"""
+        try:
+            state: dict = json.loads((self.data_dir / STATE_FILE).read_text())
+        except (OSError, json.JSONDecodeError):
+            return {}
+        return state
+
+    def _save_state(self, db_type: str, entry: dict) -> None:
+        # Editions update concurrently, so re-read before writing
+        state = self._load_state()
+        state[db_type] = entry
+        state_path = self.data_dir / STATE_FILE
+        tmp_path = state_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(state, indent=2))
+        os.replace(tmp_path, state_path)
 
     async def _download_and_extract(
         self,
         session: aiohttp.ClientSession,
         url: str,
         db_type: str,
-    ) -> None:
-        """Download and extract GeoIP database"""
-
-        # Download with timeout
-        async with session.get(
-            url,
-            timeout=aiohttp.ClientTimeout(total=300),
-            ssl=True  # 5 minutes
-        ) as response:
-            if response.status != 200:
-                raise Exception(f"HTTP {response.status}")
-
-            # Save tar.gz file temporarily
-            tar_path = self.data_dir / f"geoip-{db_type}.tar.gz"
-            content = await response.read()
-            tar_path.write_bytes(content)
-
-            # Extract
-            with tarfile.open(tar_path) as tar:
-                # Find .mmdb file in archive
-                for member in tar.getmembers():
-                    if member.name.endswith(".mmdb"):
-                        extracted = tar.extractfile(member)
-                        if extracted is None:
-                            continue
-                        data = extracted.read()
-
-                        # Name based on type
-                        if db_type == "country":
-                            db_file = self.data_dir / "GeoLite2-Country.mmdb"
-                        else:
-                            db_file = self.data_dir / "GeoLite2-City.mmdb"
-
-                        db_file.write_bytes(data)
-                        break
+    ) -> bool:
+        """
+        Download and extract a GeoIP database if it changed.
+
+        The archive is streamed to disk and the .mmdb streamed out of it
+        into a temporary file that replaces the database atomically, so
+        neither is ever held in memory and readers never see half a file.
+
+        Returns:
+            True if a new database was installed, False if it was current
+        """
+        db_file = self._db_path(db_type)
+        entry = self._load_state().get(db_type, {}) if db_file.exists() else {}
+        refresh = AppSettings().GEOIP_REFRESH_HOURS * 3600
+        if entry and time.time() - entry.get("checked", 0) < refresh:
+            return False
+
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
 
+        tar_path = self.data_dir / f"geoip-{db_type}.tar.gz"
+        try:
+            async with session.get(
+                url,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=300),
+                ssl=True  # 5 minutes
+            ) as response:
+                if response.status == 304:
+                    self._save_state(db_type, {**entry,
+                                               "checked": time.time()})
+                    return False
+                if response.status != 200:
+                    raise Exception(f"HTTP {response.status}")
+
+                with open(tar_path, "wb") as tar_file:
+                    async for chunk in response.content.iter_chunked(
+                            DOWNLOAD_CHUNK_SIZE):
+                        tar_file.write(chunk)
+                validators = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
+
+            await asyncio.to_thread(self._extract, tar_path, db_file)
+        finally:
             # Cleanup tar.gz
-            tar_path.unlink()
+            tar_path.unlink(missing_ok=True)
+
+        self._save_state(db_type, {**validators, "checked": time.time()})
+        return True
+
+    @staticmethod
+    def _extract(tar_path: Path, db_file: Path) -> None:
+        """Stream the first .mmdb of an archive over db_file atomically"""
+        tmp_path = db_file.with_suffix(".mmdb.tmp")
+        # Stream mode reads the archive front to back once
+        with tarfile.open(tar_path, "r|gz") as tar:
+            for member in tar:
+                if not member.isfile() or not member.name.endswith(".mmdb"):
+                    continue
+                extracted = tar.extractfile(member)
+                if extracted is None:
+                    continue
+                try:
+                    with open(tmp_path, "wb") as out:
+                        shutil.copyfileobj(extracted, out,
+                                           DOWNLOAD_CHUNK_SIZE)
+                    os.replace(tmp_path, db_file)
+                finally:
+                    tmp_path.unlink(missing_ok=True)
+                return
+        raise Exception("No .mmdb file in archive")
 
     def verify_databases(self) -> bool:
         """Verify databases exist and are readable"""
@@ -116,6 +226,10 @@ class GeoIPManager:
                 print(f"❌ {db_path.name} missing or empty")
                 all_exist = False
 
+        asn_db = self.data_dir / ASN_DB
+        if not asn_db.exists() or asn_db.stat().st_size == 0:
+            print(f"⚠️ {ASN_DB} missing - ASN filters are unavailable")
+
         return all_exist
 
 
@@ -130,36 +244,405 @@ async def download_geoip_dbs() -> bool:
     return success
 
 
-class GeoIPService:
-    """Service for geolocating proxies"""
+def _reader_mode(mode: str) -> int:
+    import maxminddb
+    if mode == "memory":
+        return maxminddb.MODE_MEMORY
+    if mode == "mmap":
+        try:
+            from maxminddb import extension
+            has_extension = hasattr(extension, "Reader")
+        except ImportError:
+            has_extension = False
+        # The C extension always maps the file; without it fall back to
+        # the pure-Python mmap reader
+        if has_extension:
+            return maxminddb.MODE_MMAP_EXT
+        return maxminddb.MODE_MMAP
+    return maxminddb.MODE_AUTO
+
+
+# (resolved path, mode) -> (file mtime, reader)
+_readers: dict[tuple[str, str], tuple[int, Any]] = {}
+_readers_lock = threading.Lock()
+
+
+def open_reader(path: str | Path, mode: str | None = None):
+    """
+    Process-wide geoip2 Reader of a database.
+
+    Each database is opened once per process and mode, and again only
+    after the file has been replaced.
+
+    Args:
+        path: Path of an .mmdb database
+        mode: One of GEOIP_READER_MODES, GEOIP_READER_MODE by default
+
+    Returns:
+        The reader, or None if the database does not exist
+
+    Raises:
+        ValueError: For an unknown mode or a file that is not a database
+    """
+    mode = mode or AppSettings().GEOIP_READER_MODE
+    if mode not in GEOIP_READER_MODES:
+        raise ValueError(f"Unknown GeoIP reader mode {mode!r}")
+    path = Path(path)
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+    key = (str(path.resolve()), mode)
+    with _readers_lock:
+        cached = _readers.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        import geoip2.database
+        reader = geoip2.database.Reader(str(path), mode=_reader_mode(mode))
+        # A replaced database's reader may still be in use elsewhere, so
+        # it is left to be closed when the last reference goes away
+        _readers[key] = (mtime, reader)
+        return reader
+
+
+def load_range_table(db_path: str | Path,
+                     epoch: int | None = None) -> GeoIPRangeTable | None:
+    """
+    Saved range table of a database, None if there is none or it was
+    compiled from another build of the database.
+    """
+    try:
+        table = GeoIPRangeTable.load(
+            Path(db_path).with_suffix(RANGE_TABLE_SUFFIX))
+    except (OSError, ValueError):
+        return None
+    if epoch is not None and table.epoch != epoch:
+        table.close()
+        return None
+    return table
+
+
+def build_range_table(db_path: str | Path) -> bool:
+    """
+    Compile and save the range table of a database unless a current one
+    is saved. Slow; GeoIPManager runs it on a worker thread.
+
+    Returns:
+        True if a table was compiled
+
+    Raises:
+        OSError: If the database cannot be read or the table not written
+    """
+    reader = open_reader(db_path)
+    if reader is None:
+        raise FileNotFoundError(f"GeoIP database not found at {db_path}")
+    table = load_range_table(db_path, reader.metadata().build_epoch)
+    if table is not None:
+        table.close()
+        return False
+    table_path = Path(db_path).with_suffix(RANGE_TABLE_SUFFIX)
+    logger.info(f"Compiling GeoIP range table {table_path.name}")
+    table = GeoIPRangeTable.from_database(db_path)
+    table.save(table_path)
+    table.close()
+    return True
+
+
+def _geo_address(proxy: Proxy) -> str:
+    """Resolved IP of a proxy's server, or its address as written"""
+    return proxy.resolved_ips[0] if proxy.resolved_ips else proxy.address
+
+
+def _asn(response) -> str:
+    # Only present in databases with ISP data; GeoLite2 has a separate ASN
+    # database instead
+    number = response.traits.autonomous_system_number
+    return f"AS{number}" if number else ""
 
-    def __init__(self, db_path: str = "data/GeoLite2-City.mmdb"):
-        self.db_path = Path(db_path)
-        self.reader = None
-        if self.db_path.exists():
-            import geoip2.database
-            self.reader = geoip2.database.Reader(str(self.db_path))
 
-    async def geolocate(self, proxy_config) -> dict | None:
+class GeoIPService:
+    """
+    Batched, cached geolocation of proxies.
+
+    Lookups are keyed by normalized address and kept in an LRU cache that
+    is saved between runs and thrown away when the database's build epoch
+    changes. Addresses missing from the cache are looked up in chunks on
+    worker threads, so the event loop keeps running meanwhile.
+    """
+
+    def __init__(self,
+                 db_path: str | Path | None = None,
+                 cache_path: str | Path | None = None,
+                 max_entries: int | None = None,
+                 chunk_size: int | None = None,
+                 mode: str | None = None,
+                 backend: str | None = None,
+                 asn_db_path: str | Path | None = None):
         """
-        Geolocate a proxy configuration.
-
         Args:
-            proxy_config: The proxy configuration to geolocate.
-
-        Returns:
-            A dictionary with geolocation data, or None.
+            db_path: Database to use; by default the City database in
+                data/, or the Country database when the City one is missing
+            asn_db_path: ASN database, by default GeoLite2-ASN.mmdb next to
+                db_path; ASNs are empty without it
+            mode: Reader mode, see GEOIP_READER_MODES
+            backend: One of GEOIP_BACKENDS, GEOIP_BACKEND by default
+
+        Raises:
+            ValueError: For an unknown backend
         """
-        if not self.reader:
+        settings = AppSettings()
+        self.backend = backend or settings.GEOIP_BACKEND
+        if self.backend not in GEOIP_BACKENDS:
+            raise ValueError(f"Unknown GeoIP backend {self.backend!r}")
+        if db_path is None:
+            city_db = Path("data") / CITY_DB
+            country_db = Path("data") / COUNTRY_DB
+            use_country = country_db.exists() and not city_db.exists()
+            db_path = country_db if use_country else city_db
+        self.db_path = Path(db_path)
+        self.asn_db_path = (Path(asn_db_path) if asn_db_path else
+                            self.db_path.parent / ASN_DB)
+        self.mode = mode or settings.GEOIP_READER_MODE
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.max_entries = max_entries or settings.GEOIP_CACHE_MAX_ENTRIES
+        self.chunk_size = max(1, chunk_size or settings.GEOIP_BATCH_SIZE)
+        # geoip2 Reader, opened by open()
+        self.reader: Any = None
+        self.table: GeoIPRangeTable | None = None
+        self.epoch: int | None = None
+        self.asn_reader: Any = None
+        self.asn_table: GeoIPRangeTable | None = None
+        self.asn_epoch: int | None = None
+        self.country_only = False
+        # Address -> (country, country_code, city, asn), None if not found
+        self.entries: OrderedDict[str, tuple | None] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def open(self) -> bool:
+        """Open the database and load the lookups cached for its build"""
+        try:
+            if not self.db_path.exists():
+                logger.warning(f"GeoIP database not found at {self.db_path}")
+                return False
+            self.reader = open_reader(self.db_path, self.mode)
+            logger.info(f"Loaded GeoIP database {self.db_path.name}")
+        except Exception as e:
+            logger.warning(f"Could not load GeoIP database: {e}")
+            return False
+        metadata = self.reader.metadata()
+        database_type = getattr(metadata, "database_type", "")
+        self.country_only = (isinstance(database_type, str)
+                             and database_type.endswith("-Country"))
+        try:
+            self.epoch = int(metadata.build_epoch)
+        except (AttributeError, TypeError, ValueError):
+            self.epoch = None
+        if self.backend == "table":
+            self.table = self._range_table(self.db_path, self.epoch)
+        self._open_asn()
+        self._load()
+        return True
+
+    def _open_asn(self) -> None:
+        if not self.asn_db_path.exists():
+            return
+        try:
+            self.asn_reader = open_reader(self.asn_db_path, self.mode)
+        except Exception as e:
+            logger.warning(f"Could not load GeoIP ASN database: {e}")
+            return
+        try:
+            self.asn_epoch = int(self.asn_reader.metadata().build_epoch)
+        except (AttributeError, TypeError, ValueError):
+            self.asn_epoch = None
+        if self.backend == "table":
+            self.asn_table = self._range_table(self.asn_db_path,
+                                               self.asn_epoch)
+
+    @staticmethod
+    def _range_table(db_path: Path,
+                     epoch: int | None) -> GeoIPRangeTable | None:
+        # Compiling takes too long for the event loop; the updater does it
+        table = load_range_table(db_path, epoch)
+        if table is None:
+            logger.warning(
+                f"No range table of {db_path.name} for this build, using the "
+                f"reader; `configstream update-databases` compiles it")
+        return table
+
+    @property
+    def has_asn(self) -> bool:
+        """Whether lookups come with ASNs"""
+        return self.asn_reader is not None
+
+    def close(self) -> None:
+        """Save the cache; the shared reader stays open for later runs"""
+        if self.reader is None:
+            return
+        try:
+            self._save()
+        except OSError as e:
+            logger.warning(f"Could not save GeoIP cache: {e}")
+        for table in (self.table, self.asn_table):
+            if table is not None:
+                table.close()
+        self.table = self.asn_table = None
+        self.reader = self.asn_reader = None
+
+    def _load(self) -> None:
+        if self.cache_path is None or self.epoch is None:
+            return
+        if not self.cache_path.exists():
+            return
+        try:
+            data = json.loads(self.cache_path.read_text())
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(
+                f"Ignoring unreadable GeoIP cache {self.cache_path}: {e}")
+            return
+        if (data.get("epoch") != self.epoch
+                or data.get("database") != self.db_path.name
+                or data.get("asn_epoch") != self.asn_epoch):
+            return
+        for address, entry in data.get("entries", {}).items():
+            self.entries[address] = tuple(entry) if entry else None
+        logger.info(f"Loaded {len(self.entries)} cached GeoIP lookups")
+
+    def _save(self) -> None:
+        """Write the cache atomically"""
+        if self.cache_path is None or self.epoch is None:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_path.with_suffix(self.cache_path.suffix +
+                                               ".tmp")
+        tmp_path.write_text(
+            json.dumps({
+                "epoch": self.epoch,
+                "database": self.db_path.name,
+                "asn_epoch": self.asn_epoch,
+                "entries": self.entries
+            }))
+        os.replace(tmp_path, self.cache_path)
+
+    def _lookup(self, address: str) -> tuple | None:
+        """Look an address up in the database (blocking)"""
+        try:
+            if self.country_only:
+                response = self.reader.country(address)
+                city = ""
+            else:
+                response = self.reader.city(address)
+                city = response.city.name or "Unknown"
+            return (
+                response.country.name or "Unknown",
+                response.country.iso_code or "XX",
+                city,
+                _asn(response),
+            )
+        except Exception:
             return None
 
+    def _lookup_asn(self, address: str) -> str:
+        """ASN of an address in the ASN database (blocking)"""
         try:
-            response = self.reader.city(proxy_config.host)
-            return {
-                "country_code": response.country.iso_code,
-                "country_name": response.country.name,
-                "city_name": response.city.name,
-                "asn": f"AS{response.autonomous_system.autonomous_system_number}",
-            }
+            number = self.asn_reader.asn(address).autonomous_system_number
         except Exception:
-            return None
+            return ""
+        return f"AS{number}" if number else ""
+
+    def _with_asn(self, entry: tuple | None, asn: str) -> tuple | None:
+        if not asn:
+            return entry
+        if entry is None:
+            entry = ("Unknown", "XX", "" if self.country_only else "Unknown",
+                     "")
+        return (*entry[:3], asn)
+
+    def _lookup_chunk(self, addresses: list[str]) -> list[tuple | None]:
+        if self.table is not None:
+            entries = self.table.lookup_many(addresses)
+        else:
+            entries = [self._lookup(address) for address in addresses]
+        if self.asn_table is not None:
+            asns = [
+                entry[3] if entry else ""
+                for entry in self.asn_table.lookup_many(addresses)
+            ]
+        elif self.asn_reader is not None:
+            asns = [self._lookup_asn(address) for address in addresses]
+        else:
+            return entries
+        return [
+            self._with_asn(entry, asn) for entry, asn in zip(entries, asns)
+        ]
+
+    def _remember(self, address: str, entry: tuple | None) -> None:
+        self.entries[address] = entry
+        self.entries.move_to_end(address)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def lookup_many(self,
+                          addresses: Iterable[str]) -> dict[str, tuple | None]:
+        """
+        Geolocate addresses, each distinct one at most once.
+
+        Returns:
+            {normalized address: (country, country_code, city, asn) or None}
+        """
+        found: dict[str, tuple | None] = {}
+        missing = []
+        for address in addresses:
+            address = normalize_host(address)
+            if address in found:
+                continue
+            if address in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(address)
+                found[address] = self.entries[address]
+            else:
+                found[address] = None
+                missing.append(address)
+        if not missing or self.reader is None:
+            return found
+
+        self.misses += len(missing)
+        loop = asyncio.get_running_loop()
+        chunks = [
+            missing[i:i + self.chunk_size]
+            for i in range(0, len(missing), self.chunk_size)
+        ]
+        results = await asyncio.gather(*(
+            loop.run_in_executor(None, self._lookup_chunk, chunk)
+            for chunk in chunks))
+        for chunk, entries in zip(chunks, results):
+            for address, entry in zip(chunk, entries):
+                found[address] = entry
+                self._remember(address, entry)
+        return found
+
+    async def geolocate(self, proxies: list[Proxy]) -> list[Proxy]:
+        """
+        Set the country, city and ASN of proxies.
+
+        Proxies that cannot be located (or every proxy, without a database)
+        get country "Unknown" and code "XX".
+        """
+        if self.reader is None:
+            found = {}
+        else:
+            found = await self.lookup_many(map(_geo_address, proxies))
+        for proxy in proxies:
+            entry = found.get(normalize_host(_geo_address(proxy)))
+            if entry is None:
+                proxy.country = "Unknown"
+                proxy.country_code = "XX"
+                continue
+            country, country_code, city, asn = entry
+            proxy.country = sys.intern(country)
+            proxy.country_code = sys.intern(country_code)
+            proxy.city = sys.intern(city)
+            proxy.asn = asn
+        return proxies
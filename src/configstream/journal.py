@@ -0,0 +1,126 @@
+"""
+Append-only journal of test results for resumable runs.
+
+Every finished test is written as one NDJSON line while the run is in
+progress, so a run that is killed (e.g. by a CI timeout) leaves behind a
+record of everything it already tested. ``merge --resume`` replays the
+journal and only tests configs that are not in it yet. Entries older than
+JOURNAL_MAX_AGE are not replayed, so a journal left behind by a run
+interrupted long ago does not pass off old results as fresh.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import time
+from pathlib import Path
+from typing import IO, Any
+
+from .config import AppSettings
+from .fingerprint import config_fingerprint
+from .models import Proxy
+
+logger = logging.getLogger(__name__)
+
+
+class ResultJournal:
+    """NDJSON journal of test outcomes keyed by config fingerprint"""
+
+    def __init__(self, path: str | Path, max_age: float | None = None):
+        """
+        Args:
+            path: Journal file
+            max_age: Seconds a journaled result stays replayable
+                (default: JOURNAL_MAX_AGE)
+        """
+        self.path = Path(path)
+        self.max_age = (max_age if max_age is not None else
+                        AppSettings().JOURNAL_MAX_AGE)
+        self.entries: dict[str, dict[str, Any]] = {}
+        self.replayed = 0
+        self.stale = 0
+        self._file: IO[str] | None = None
+
+    def open(self, resume: bool = False) -> None:
+        """
+        Start journaling.
+
+        Args:
+            resume: Replay existing entries and append to them; otherwise
+                the previous journal is discarded
+        """
+        if resume:
+            self._replay()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Line buffered, so every entry reaches the OS as soon as it is written
+        self._file = open(self.path,
+                          "a" if resume else "w",
+                          buffering=1,
+                          encoding="utf-8")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self) -> None:
+        """Close and delete the journal once a run has completed"""
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+    def record(self, proxy: Proxy) -> None:
+        """Append the outcome of a finished test"""
+        if self._file is None:
+            return
+        entry: dict[str, Any] = {
+            "key": config_fingerprint(proxy),
+            "journaled_at": time.time(),
+            "working": proxy.is_working,
+            "latency": proxy.latency,
+            "tested_at": proxy.tested_at,
+            "connect_ms": proxy.connect_ms,
+            "tls_handshake_ms": proxy.tls_handshake_ms,
+            "failure": (proxy.security_issues[-1]
+                        if proxy.security_issues and not proxy.is_working else
+                        None),
+        }
+        self.entries[entry["key"]] = entry
+        self._file.write(json.dumps(entry) + "\n")
+
+    def restore(self, proxy: Proxy) -> bool:
+        """Copy a journaled outcome onto proxy; False if it was not tested"""
+        entry = self.entries.get(config_fingerprint(proxy))
+        if entry is None:
+            return False
+
+        proxy.is_working = entry["working"]
+        proxy.latency = entry["latency"]
+        proxy.tested_at = entry["tested_at"]
+        proxy.connect_ms = entry.get("connect_ms")
+        proxy.tls_handshake_ms = entry.get("tls_handshake_ms")
+        if entry.get("failure"):
+            proxy.security_issues.append(entry["failure"])
+        return True
+
+    def _replay(self) -> None:
+        if not self.path.exists():
+            return
+        oldest = time.time() - self.max_age
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    if entry.get("journaled_at", 0) < oldest:
+                        self.stale += 1
+                        continue
+                    self.entries[entry["key"]] = entry
+                except (json.JSONDecodeError, KeyError, TypeError,
+                        AttributeError):
+                    # A run killed mid-write can leave a truncated last line
+                    continue
+        self.replayed = len(self.entries)
+        if self.stale:
+            logger.info(f"Ignored {self.stale} journaled results older than "
+                        f"{self.max_age:.0f}s")
+        logger.info(f"Replayed {self.replayed} results from {self.path}")
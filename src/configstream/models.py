@@ -1,10 +1,20 @@
+import sys
 from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional
 
 
-@dataclass
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+@dataclass(slots=True)
 class Proxy:
-    """Represents a proxy with its configuration and test results."""
+    """
+    Represents a proxy with its configuration and test results.
+
+    Slotted, and protocol/country strings are interned, since a run holds
+    one instance per parsed config.
+    """
     config: str
     protocol: str
     address: str
@@ -20,4 +30,16 @@ class Proxy:
     is_secure: bool = True
     security_issues: List[str] = field(default_factory=list)
     tested_at: str = ""
-    details: Optional[Dict[str, Any]] = field(default_factory=dict)
\ No newline at end of file
+    source: str = ""
+    # Every source the config (or an equivalent copy of it) came from
+    sources: List[str] = field(default_factory=list)
+    connect_ms: Optional[float] = None
+    tls_handshake_ms: Optional[float] = None
+    # IPs the server's host name resolved to
+    resolved_ips: List[str] = field(default_factory=list)
+    details: Optional[Dict[str, Any]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.protocol = _intern(self.protocol)
+        self.country = _intern(self.country)
+        self.country_code = _intern(self.country_code)
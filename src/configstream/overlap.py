@@ -0,0 +1,225 @@
+"""
+Overlap between sources.
+
+Many public sources mirror each other or republish a subset of another
+source. SourceOverlap records the body hash and config set of every source
+fetched in a run, recognizes byte-identical bodies as they arrive (so the
+pipeline does not parse the same body twice) and afterwards reports which
+sources are identical to or contained in another source and could be
+dropped, and which add so little that they could be fetched less often.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from collections import defaultdict
+from collections.abc import Iterable, Set
+from typing import Any
+
+from .core import parse_config
+from .fetcher import FetchEngine, FetchResult
+from .fingerprint import config_fingerprint
+from .source_cache import SourceCache
+from .sources import SourceSpec
+
+# Sources whose configs are at most this share unique are worth fetching
+# less often, even when no single other source contains all of them
+LOW_UNIQUE_SHARE = 0.05
+
+
+def fingerprint_key(fingerprint: str) -> int:
+    """64-bit key of a canonical config fingerprint"""
+    return int(fingerprint[:16], 16)
+
+
+def config_key(config: str) -> int:
+    """
+    64-bit key of a config's canonical fingerprint.
+
+    Re-encodings of one server (remarks, parameter order, padding) share a
+    key, as they share a fingerprint in deduplication.
+    """
+    proxy = parse_config(config)
+    if proxy is not None:
+        return fingerprint_key(config_fingerprint(proxy))
+    # Unparseable lines are compared on their text, minus remarks
+    config = config.strip().split("#", 1)[0]
+    return int.from_bytes(
+        hashlib.blake2b(config.encode("utf-8"), digest_size=8).digest(),
+        "big")
+
+
+def config_set_hash(keys: Iterable[int]) -> str:
+    """Order-independent hash of a config set"""
+    digest = hashlib.sha256()
+    for key in sorted(keys):
+        digest.update(key.to_bytes(8, "big"))
+    return digest.hexdigest()
+
+
+class SourceOverlap:
+    """Body hashes and config sets of the sources fetched in one run"""
+
+    def __init__(self) -> None:
+        # Body hash -> first source that served it
+        self.bodies: dict[str, str] = {}
+        self.body_hashes: dict[str, str | None] = {}
+        # Source -> config keys; byte-identical sources share one set
+        self.configs: dict[str, set[int]] = {}
+
+    def observe_body(self, source: str, body_hash: str | None) -> str | None:
+        """
+        Record a fetched source, whose configs are added with add().
+
+        Returns:
+            The earlier source that served a byte-identical body, in which
+            case the configs need no parsing or adding
+        """
+        self.body_hashes[source] = body_hash
+        if body_hash is not None:
+            first = self.bodies.setdefault(body_hash, source)
+            if first != source:
+                self.configs[source] = self.configs.setdefault(first, set())
+                return first
+        self.configs.setdefault(source, set())
+        return None
+
+    def add(self, source: str, fingerprint: str) -> None:
+        """Add a config of source by its canonical fingerprint"""
+        self.configs.setdefault(source, set()).add(
+            fingerprint_key(fingerprint))
+
+    def observe(self, source: str, body_hash: str | None,
+                configs: Iterable[str]) -> str | None:
+        """
+        Record a fetched source together with its configs.
+
+        Returns:
+            The earlier source that served a byte-identical body, in which
+            case configs were not looked at
+        """
+        mirror = self.observe_body(source, body_hash)
+        if mirror is None:
+            self.configs[source].update(map(config_key, configs))
+        return mirror
+
+    def analyze(self) -> dict[str, Any]:
+        """
+        Compare the config sets of every source observed so far.
+
+        Of identical sources the first one observed is kept and the others
+        are compared through it, so copies do not make each other look
+        redundant. Sources reported as droppable add no unique configs.
+
+        Returns:
+            {"sources": [...], "drop": [...], "reduce_refresh": [...]}
+        """
+        set_hashes = {
+            source: config_set_hash(keys)
+            for source, keys in self.configs.items()
+        }
+        kept: dict[str, str] = {}
+        for source, set_hash in set_hashes.items():
+            kept.setdefault(set_hash, source)
+
+        owners: dict[int, list[str]] = defaultdict(list)
+        for source in kept.values():
+            for key in self.configs[source]:
+                owners[key].append(source)
+
+        found = {}
+        for source, keys in self.configs.items():
+            first = kept[set_hashes[source]]
+            # Empty sources are the source health history's business
+            identical_to = first if keys and first != source else None
+            subset_of = (self._superset(first, keys, owners)
+                         if keys and identical_to is None else None)
+            found[source] = (identical_to, subset_of)
+
+        # Unique configs are counted among the sources worth keeping, so
+        # dropping copies and subsets does not change anyone's verdict
+        holders: dict[int, int] = defaultdict(int)
+        for source in kept.values():
+            if not any(found[source]):
+                for key in self.configs[source]:
+                    holders[key] += 1
+
+        entries = []
+        for source, keys in self.configs.items():
+            identical_to, subset_of = found[source]
+            recommendation: str | None
+            if identical_to or subset_of:
+                unique = 0
+                recommendation = "drop"
+            else:
+                unique = sum(1 for key in keys if holders[key] == 1)
+                recommendation = ("reduce_refresh" if keys and unique <=
+                                  LOW_UNIQUE_SHARE * len(keys) else None)
+            entries.append({
+                "source": source,
+                "configs": len(keys),
+                "unique_configs": unique,
+                "body_hash": self.body_hashes.get(source),
+                "config_set_hash": set_hashes[source],
+                "identical_to": identical_to,
+                "subset_of": subset_of,
+                "recommendation": recommendation,
+            })
+
+        return {
+            "sources": entries,
+            "drop": [e["source"] for e in entries
+                     if e["recommendation"] == "drop"],
+            "reduce_refresh": [
+                e["source"] for e in entries
+                if e["recommendation"] == "reduce_refresh"
+            ],
+        }
+
+    def _superset(self, source: str, keys: Set[int],
+                  owners: dict[int, list[str]]) -> str | None:
+        """Smallest other source holding every config of source"""
+        containers: set[str] | None = None
+        for key in keys:
+            holders = set(owners[key])
+            if containers is None:
+                containers = holders
+            else:
+                containers &= holders
+            if len(containers) == 1:
+                return None
+        if containers is None:
+            return None
+        containers.discard(source)
+        if not containers:
+            return None
+        # Distinct config sets, so every container is strictly larger
+        return min(containers, key=lambda other: len(self.configs[other]))
+
+
+async def analyze_sources(
+        sources: Iterable[str | SourceSpec],
+        cache: SourceCache | None = None
+) -> tuple[dict[str, Any], dict[str, FetchResult]]:
+    """
+    Fetch sources and analyze their overlap.
+
+    Returns:
+        (overlap report, FetchResult of every source)
+    """
+    overlap = SourceOverlap()
+    results: dict[str, FetchResult] = {}
+
+    def collect(source: str, result: FetchResult) -> None:
+        results[source] = result
+
+    specs = list(map(SourceSpec.coerce, sources))
+    async with FetchEngine(cache=cache) as engine:
+        await engine.fetch_each(specs, collect)
+
+    # Observed in file order, so the earlier of two identical sources stays
+    for spec in specs:
+        result = results.get(spec.url)
+        if result is not None and result.success:
+            overlap.observe(spec.url, result.body_hash, result.configs)
+    return overlap.analyze(), results
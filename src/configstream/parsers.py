@@ -1,18 +1,65 @@
 import base64
+import binascii
 import json
 import logging
-from typing import Optional
+from typing import Callable, Optional
 from urllib.parse import parse_qs, unquote, urlparse
 
 from .models import Proxy
 
 logger = logging.getLogger(__name__)
 
+ConfigParser = Callable[[str], Optional[Proxy]]
 
+# Share link scheme (lower case, without "://") -> parser
+PARSERS: dict[str, ConfigParser] = {}
+
+
+def register_parser(*schemes: str) -> Callable[[ConfigParser], ConfigParser]:
+    """
+    Register a parser for share links of the given schemes.
+
+    Used as a decorator; a later registration of a scheme replaces the
+    earlier one, so built-in parsers can be overridden as well.
+
+    Args:
+        schemes: Schemes without "://", e.g. "vless"
+    """
+
+    def decorator(parser: ConfigParser) -> ConfigParser:
+        for scheme in schemes:
+            PARSERS[scheme.lower()] = parser
+        return parser
+
+    return decorator
+
+
+def registered_scheme(config: str) -> str | None:
+    """Lower-cased scheme of a share link, None unless it has a parser"""
+    scheme, separator, _ = config.partition("://")
+    if not separator:
+        return None
+    scheme = scheme.lower()
+    return scheme if scheme in PARSERS else None
+
+
+def parser_for(config: str) -> ConfigParser | None:
+    """Registered parser of a share link, None for unknown schemes"""
+    scheme = registered_scheme(config)
+    return PARSERS[scheme] if scheme is not None else None
+
+
+def _b64decode(data: str) -> bytes:
+    """Decode base64 that may be URL-safe or lack its padding"""
+    data = data.strip().replace("-", "+").replace("_", "/")
+    return base64.b64decode(data + "=" * (-len(data) % 4))
+
+
+@register_parser("vmess")
 def _parse_vmess(config: str) -> Proxy | None:
     try:
         data = config[len("vmess://"):]
-        decoded = base64.b64decode(data).decode("utf-8")
+        decoded = _b64decode(data).decode("utf-8")
         vmess_data = json.loads(decoded)
         return Proxy(
             config=config,
@@ -23,11 +70,12 @@ def _parse_vmess(config: str) -> Proxy | None:
             remarks=vmess_data.get("ps", ""),
             details=vmess_data,
         )
-    except (json.JSONDecodeError, base64.binascii.Error, KeyError) as e:
+    except (json.JSONDecodeError, binascii.Error, KeyError) as e:
         logger.debug(f"Failed to parse VMess config: {str(e)[:50]}")
         return None
 
 
+@register_parser("vless")
 def _parse_vless(config: str) -> Proxy | None:
     try:
         parsed = urlparse(config)
@@ -48,12 +96,13 @@ def _parse_vless(config: str) -> Proxy | None:
         return None
 
 
+@register_parser("ss")
 def _parse_ss(config: str) -> Proxy | None:
     try:
         if "@" not in config:
             return None
         encoded_part, host_part = config.replace("ss://", "").split("@", 1)
-        decoded_user_info = base64.b64decode(encoded_part).decode("utf-8")
+        decoded_user_info = _b64decode(unquote(encoded_part)).decode("utf-8")
         method, password = decoded_user_info.split(":", 1)
         host, port_remark = host_part.split(":", 1)
         port, remark = (port_remark.split("#", 1)
@@ -69,11 +118,12 @@ def _parse_ss(config: str) -> Proxy | None:
                 "password": password
             },
         )
-    except (ValueError, IndexError, base64.binascii.Error) as e:
+    except (ValueError, IndexError, binascii.Error) as e:
         logger.debug(f"Failed to parse Shadowsocks config: {str(e)[:50]}")
         return None
 
 
+@register_parser("trojan")
 def _parse_trojan(config: str) -> Proxy | None:
     try:
         parsed = urlparse(config)
@@ -93,6 +143,7 @@ def _parse_trojan(config: str) -> Proxy | None:
         return None
 
 
+@register_parser("hysteria")
 def _parse_hysteria(config: str) -> Proxy | None:
     try:
         parsed = urlparse(config)
@@ -112,6 +163,7 @@ def _parse_hysteria(config: str) -> Proxy | None:
         return None
 
 
+@register_parser("hysteria2", "hy2")
 def _parse_hysteria2(config: str) -> Proxy | None:
     try:
         parsed = urlparse(config)
@@ -131,6 +183,7 @@ def _parse_hysteria2(config: str) -> Proxy | None:
         return None
 
 
+@register_parser("tuic")
 def _parse_tuic(config: str) -> Proxy | None:
     try:
         parsed = urlparse(config)
@@ -150,6 +203,7 @@ def _parse_tuic(config: str) -> Proxy | None:
         return None
 
 
+@register_parser("wireguard", "wg")
 def _parse_wireguard(config: str) -> Proxy | None:
     try:
         parsed = urlparse(config)
@@ -169,6 +223,7 @@ def _parse_wireguard(config: str) -> Proxy | None:
         return None
 
 
+@register_parser("naive+https", "naive")
 def _parse_naive(config: str) -> Proxy | None:
     try:
         parsed = urlparse(config.replace("naive+", ""))
@@ -188,6 +243,7 @@ def _parse_naive(config: str) -> Proxy | None:
         return None
 
 
+@register_parser("ssh", "http", "https", "socks", "socks4", "socks5")
 def _parse_generic(config: str) -> Proxy | None:
     try:
         parsed = urlparse(config)
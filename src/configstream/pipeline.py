@@ -1,197 +1,850 @@
 import asyncio
-import base64
 import json
 import logging
+import signal
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Sequence, Union
 
-import aiohttp
-import geoip2.database
 from rich.progress import Progress
 
-from .core import Proxy, geolocate_proxy
-from .core import parse_config_batch
+from .cache import ResultCache
+from .config import AppSettings
+from .core import Proxy
+from .core import parse_config_batch_parallel
+from .fetcher import FetchEngine, FetchResult
+from .filters import PreTestFilter
+from .fingerprint import config_fingerprint
+from .geoip import GeoIPService
+from .journal import ResultJournal
+from .overlap import SourceOverlap
+from .preflight import EndpointProber, ProbeResult, apply_probe_result
+from .proxy_table import ProxyTable
+from .quota import WorkingQuota, interleave_by_source
+from .resolver import DNSCache, HostResolver
 from .testers import SingBoxTester
 from .output import (generate_base64_subscription, generate_clash_config,
                      generate_singbox_config)
+from .scheduler import WorkerPool
+from .source_cache import SourceCache
+from .source_health import SourceHealthDB
+from .sources import SourceSpec
 
 logger = logging.getLogger(__name__)
 
+# End-of-stream marker passed between pipeline stages
+_DONE = object()
+
 
 async def run_full_pipeline(
-    sources: List[str],
+    sources: Sequence[Union[str, SourceSpec]],
     output_dir: str,
     progress: Optional[Progress] = None,
     max_workers: int = 10,
     max_proxies: Optional[int] = None,
     country_filter: Optional[str] = None,
-    min_latency: Optional[int] = None,
-    max_latency: Optional[int] = None,
+    min_latency: Optional[float] = None,
+    max_latency: Optional[float] = None,
     timeout: int = 10,
     proxies: Optional[List[Proxy]] = None,
+    host_size: int = 0,
+    preflight: bool = True,
+    use_cache: bool = True,
+    read_cache: bool = True,
+    cache_ttl: Optional[int] = None,
+    cache_dir: Optional[str] = None,
+    protocol_filter: Optional[str] = None,
+    port_filter: Optional[str] = None,
+    asn_filter: Optional[str] = None,
+    target_working: Optional[int] = None,
+    per_country_quota: Optional[int] = None,
+    exploration: Optional[float] = None,
+    resume: bool = False,
+    resolve_dns: Optional[bool] = None,
 ) -> dict:
-    start_time = datetime.now(timezone.utc)
-    output_path = Path(output_dir)
-    output_path.mkdir(parents=True, exist_ok=True)
-
-    stats = {
-        "fetched": 0,
-        "tested": 0,
-        "working": 0,
-        "filtered": 0,
-    }
-
-    try:
-        logger.info(f"Starting pipeline with {len(sources)} sources")
-
-        if progress:
-            fetch_task = progress.add_task("Fetching configs...",
-                                           total=len(sources))
-
-        all_configs = []
-
-        async with aiohttp.ClientSession() as session:
-            tasks = [_fetch_source(session, source) for source in sources]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            for source, result in zip(sources, results):
-                if isinstance(result, Exception):
-                    logger.warning(f"Failed to fetch {source}: {result}")
-                    continue
-
-                configs, count = result
-                all_configs.extend(configs)
-                stats["fetched"] += count
-
-                if progress:
-                    progress.update(fetch_task, advance=1)
-
-        logger.info(f"Fetched {stats['fetched']} proxy configurations")
-
-        if stats["fetched"] == 0:
-            logger.error("No configurations fetched from any source")
-            return {
-                "success": False,
-                "stats": stats,
-                "output_files": {},
-                "error": "No configurations fetched",
-            }
-
-        if progress:
-            parse_task = progress.add_task("Parsing configs...",
-                                           total=stats["fetched"])
-
-        proxies = parse_config_batch(all_configs)
+    """
+    Fetch, test and geolocate proxies, then write every output format.
+
+    Sources are URLs or SourceSpecs from the sources file. When proxies is
+    given, sources are not fetched and those proxies are re-tested instead.
+    With resume, results journaled by an interrupted run are reused
+    instead of testing those configs again. With read_cache False, test
+    results still go to the result cache but none are taken from it.
+    """
+    pipeline = StreamingPipeline(
+        sources,
+        output_dir,
+        progress=progress,
+        max_workers=max_workers,
+        max_proxies=max_proxies,
+        country_filter=country_filter,
+        min_latency=min_latency,
+        max_latency=max_latency,
+        timeout=timeout,
+        proxies=proxies,
+        host_size=host_size,
+        preflight=preflight,
+        use_cache=use_cache,
+        read_cache=read_cache,
+        cache_ttl=cache_ttl,
+        cache_dir=cache_dir,
+        protocol_filter=protocol_filter,
+        port_filter=port_filter,
+        asn_filter=asn_filter,
+        target_working=target_working,
+        per_country_quota=per_country_quota,
+        exploration=exploration,
+        resume=resume,
+        resolve_dns=resolve_dns,
+    )
+    return await pipeline.run()
+
+
+class StreamingPipeline:
+    """
+    Fetch → parse → dedup → pre-flight → test → geo → sink, as a stream.
+
+    Every stage runs concurrently and hands items to the next one through
+    a bounded queue, so testing starts as soon as the first source has been
+    parsed and a slow stage applies backpressure upstream instead of the
+    whole corpus piling up in memory.
+    """
+
+    def __init__(
+        self,
+        sources: Sequence[Union[str, SourceSpec]],
+        output_dir: str,
+        progress: Optional[Progress] = None,
+        max_workers: int = 10,
+        max_proxies: Optional[int] = None,
+        country_filter: Optional[str] = None,
+        min_latency: Optional[float] = None,
+        max_latency: Optional[float] = None,
+        timeout: int = 10,
+        proxies: Optional[List[Proxy]] = None,
+        host_size: int = 0,
+        preflight: bool = True,
+        use_cache: bool = True,
+        read_cache: bool = True,
+        cache_ttl: Optional[int] = None,
+        cache_dir: Optional[str] = None,
+        protocol_filter: Optional[str] = None,
+        port_filter: Optional[str] = None,
+        asn_filter: Optional[str] = None,
+        target_working: Optional[int] = None,
+        per_country_quota: Optional[int] = None,
+        exploration: Optional[float] = None,
+        resume: bool = False,
+        queue_size: Optional[int] = None,
+        resolve_dns: Optional[bool] = None,
+    ):
+        self.settings = AppSettings()
+        # Fetch options of every source, keyed by URL
+        self.specs = {
+            spec.url: spec
+            for spec in map(SourceSpec.coerce, sources)
+        }
+        self.sources = list(self.specs)
+        self.output_path = Path(output_dir)
+        self.progress = progress
+        self.max_workers = max(1, max_workers)
+        self.max_proxies = max_proxies
+        self.min_latency = min_latency
+        self.max_latency = max_latency
+        self.timeout = timeout
+        self.supplied_proxies = proxies
+        self.host_size = host_size
+        self.preflight = preflight
+
+        self.pre_filter = PreTestFilter.from_options(country=country_filter,
+                                                     asn=asn_filter,
+                                                     protocol=protocol_filter,
+                                                     port=port_filter)
+        # Per-country quotas also need the country before testing
+        self.geo_before_test = bool(self.pre_filter.needs_geo
+                                    or per_country_quota)
+
+        # Conditional requests are always safe, so this ignores use_cache
+        self.source_cache = SourceCache(
+            Path(cache_dir or self.settings.CACHE_DIR) / "sources")
+
+        self.cache = None
+        if use_cache:
+            self.cache = ResultCache(
+                Path(cache_dir or self.settings.CACHE_DIR) /
+                "test_results.json",
+                ttl=cache_ttl,
+                write_only=not read_cache)
+
+        # Retests are one-off and must not clobber a merge run's journal
+        # or the source history
+        self.journal = None
+        self.health = None
+        self.overlap = None
+        self.resume = resume
+        if proxies is None:
+            self.overlap = SourceOverlap()
+            # Replayable for longer than cached results: a killed run is
+            # only resumed by the next scheduled merge
+            self.journal = ResultJournal(
+                Path(cache_dir or self.settings.CACHE_DIR) /
+                "test_journal.ndjson")
+            self.health = SourceHealthDB(
+                Path(cache_dir or self.settings.CACHE_DIR) /
+                "source_health.json")
+        self.skipped_sources: List[str] = []
+
+        self.quota = None
+        if target_working or per_country_quota:
+            self.quota = WorkingQuota(target_working=target_working,
+                                      per_country=per_country_quota,
+                                      exploration=exploration)
+
+        self.stats = {
+            "fetched": 0,
+            "tested": 0,
+            "working": 0,
+            "filtered": 0,
+            "preflight_failed": 0,
+            "cached": 0,
+            "prefiltered": 0,
+            "quota_skipped": 0,
+            "duplicates": 0,
+            "resumed": 0,
+            "not_modified": 0,
+            "not_due": 0,
+            "sources_skipped": 0,
+            "mirrored_sources": 0,
+            "unresolved": 0,
+        }
+        # FetchResult metadata of every source, for statistics.json
+        self.fetch_results: List[dict] = []
+        self.parsed = 0
+        self.over_limit = 0
+        self.queued_for_test = 0
+        self.working_proxies = ProxyTable()
+        if resolve_dns is None:
+            resolve_dns = self.settings.DNS_RESOLVE
+        self.resolver = None
+        if resolve_dns:
+            self.resolver = HostResolver(
+                DNSCache(Path(cache_dir or self.settings.CACHE_DIR) /
+                         "dns_cache.json"))
+
+        # GeoIP lookups are only persisted alongside the test cache
+        self.geoip = GeoIPService(
+            cache_path=(Path(cache_dir or self.settings.CACHE_DIR) /
+                        "geoip_cache.json") if use_cache else None)
+        # Started on the first source large enough to be worth it
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
+
+        queue_size = queue_size or self.settings.PIPELINE_QUEUE_SIZE
+        self.fetch_concurrency = max(
+            1, min(len(sources), self.settings.FETCH_CONCURRENCY))
+        self._raw_queue: asyncio.Queue = asyncio.Queue(
+            maxsize=self.fetch_concurrency)
+        self._parsed_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._unique_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._resolved_queue: asyncio.Queue = asyncio.Queue(
+            maxsize=queue_size)
+        self._check_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._test_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._geo_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+        self._intake_tasks: List[asyncio.Task] = []
+        self._test_task: Optional[asyncio.Task] = None
+        self._intake_halted = False
+        self.interrupted = False
+        self._errors: List[Exception] = []
+        self._progress_tasks: dict = {}
+        self._progress_totals: dict = {}
+
+    async def run(self) -> dict:
+        start_time = datetime.now(timezone.utc)
+        self.output_path.mkdir(parents=True, exist_ok=True)
 
-        logger.info(f"Successfully parsed {len(proxies)} configurations")
+        try:
+            if self.supplied_proxies is not None:
+                logger.info(
+                    f"Starting pipeline with {len(self.supplied_proxies)} proxies"
+                )
+            else:
+                logger.info(
+                    f"Starting pipeline with {len(self.sources)} sources")
+
+            if not self.geoip.open() and self.geo_before_test:
+                logger.warning(
+                    "Country/ASN filter or quota requested without a GeoIP database"
+                )
+            if self.pre_filter.asns and not self.geoip.has_asn:
+                # Every proxy would be filtered out
+                logger.error("ASN filter requested without the "
+                             "GeoLite2-ASN database")
+                return {
+                    "success": False,
+                    "stats": self.stats,
+                    "output_files": {},
+                    "error": "ASN filter needs the GeoLite2-ASN database",
+                }
+            if self.cache is not None:
+                self.cache.load()
+            if self.resolver is not None and self.resolver.cache is not None:
+                self.resolver.cache.load()
+            if self.journal is not None:
+                self.journal.open(resume=self.resume)
+            if self.health is not None:
+                self.health.load()
+                self.sources, self.skipped_sources = self.health.schedule(
+                    self.sources)
+                self.stats["sources_skipped"] = len(self.skipped_sources)
+            # Declared priorities outrank the history-based order
+            self.sources.sort(key=lambda url: -self.specs[url].priority)
+
+            self._add_progress("fetch", "Fetching configs...",
+                               len(self.sources))
+            self._add_progress("parse", "Parsing configs...")
+            if self.preflight:
+                self._add_progress("preflight", "Pre-flight checks...")
+            self._add_progress("test", "Testing proxies...")
+            self._add_progress("geo", "Geolocating...")
+
+            loop = asyncio.get_running_loop()
+            handled = []
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                try:
+                    loop.add_signal_handler(sig, self._interrupt, sig)
+                    handled.append(sig)
+                except (NotImplementedError, RuntimeError, ValueError):
+                    # Windows or not the main thread
+                    pass
+            try:
+                await self._run_stages()
+            finally:
+                for sig in handled:
+                    loop.remove_signal_handler(sig)
 
-        if progress:
-            progress.update(parse_task, completed=stats["fetched"])
+            if self.cache is not None:
+                try:
+                    self.cache.save()
+                except OSError as e:
+                    logger.warning(f"Could not save test cache: {e}")
+            if self.resolver is not None and self.resolver.cache is not None:
+                try:
+                    self.resolver.cache.save()
+                except OSError as e:
+                    logger.warning(f"Could not save DNS cache: {e}")
+
+            self.stats["not_modified"] = self.source_cache.not_modified
+            self.stats["not_due"] = self.source_cache.not_due
+            if self.health is not None:
+                self.health.commit()
+                try:
+                    self.health.save()
+                except OSError as e:
+                    logger.warning(f"Could not save source history: {e}")
+            tests_run = (self.stats["tested"] - self.stats["cached"] -
+                         self.stats["resumed"])
+            if self.interrupted:
+                logger.warning(f"Interrupted with "
+                               f"{self.queued_for_test - tests_run} proxies "
+                               f"left untested; rerun with --resume")
+            else:
+                self.stats["quota_skipped"] = self.queued_for_test - tests_run
+            self._log_summary()
+
+            if self.stats["fetched"] == 0:
+                logger.error("No configurations fetched from any source")
+                return {
+                    "success": False,
+                    "stats": self.stats,
+                    "output_files": {},
+                    "error": "No configurations fetched",
+                }
+
+            if self.parsed == 0:
+                logger.error("No configurations could be parsed")
+                return {
+                    "success": False,
+                    "stats": self.stats,
+                    "output_files": {},
+                    "error": "No configurations could be parsed",
+                }
+
+            result = self._write_outputs(start_time)
+            result["partial"] = self.interrupted
+            if (self.journal is not None and result["success"]
+                    and not self.interrupted):
+                self.journal.discard()
+            return result
 
-        if not proxies:
-            logger.error("No configurations could be parsed")
+        except Exception as e:
+            logger.error(f"Pipeline failed with exception: {e}",
+                         exc_info=True)
             return {
                 "success": False,
-                "stats": stats,
+                "stats": self.stats,
                 "output_files": {},
-                "error": "No configurations could be parsed",
+                "error": f"Pipeline failed: {e}",
             }
 
-        if max_proxies and len(proxies) > max_proxies:
-            logger.info(
-                f"Limiting to {max_proxies} proxies (down from {len(proxies)})")
-            proxies = proxies[:max_proxies]
-
-        if proxies:
-            stats["tested"] = len(proxies)
-        else:
-            stats["tested"] = 0
-
-        if progress:
-            test_task = progress.add_task("Testing proxies...",
-                                          total=len(proxies))
-
-        tester = SingBoxTester(timeout=timeout)
-
-        tested_proxies = []
-
-        for proxy in proxies:
-            tested_proxy = await tester.test(proxy)
-            tested_proxies.append(tested_proxy)
-            stats["working"] += 1 if tested_proxy.is_working else 0
-
-            if progress:
-                progress.update(test_task, advance=1)
-
-        logger.info(
-            f"Tested {len(tested_proxies)} proxies, {stats['working']} working"
-        )
-
-        if progress:
-            geo_task = progress.add_task("Geolocating...",
-                                         total=len(tested_proxies))
-
-        geoip_reader = None
+        finally:
+            if self.journal is not None:
+                self.journal.close()
+            self.geoip.close()
+            if self._parse_pool is not None:
+                self._parse_pool.shutdown(cancel_futures=True)
+
+    def _interrupt(self, sig: signal.Signals) -> None:
+        """Stop testing and let the run finish with what it has so far"""
+        if self.interrupted:
+            # Second signal: give up on a clean shutdown
+            asyncio.get_running_loop().remove_signal_handler(sig)
+            signal.raise_signal(sig)
+            return
+        self.interrupted = True
+        logger.warning(
+            f"Received {sig.name}, stopping tests and writing partial outputs")
+        self._halt_intake()
+        if self._test_task is not None:
+            self._test_task.cancel()
+
+    async def _run_stages(self) -> None:
+        checked_queue = (self._check_queue
+                         if self.preflight else self._test_queue)
+        admit_queue = (self._resolved_queue
+                       if self.resolver is not None else self._unique_queue)
+        self._intake_tasks = [
+            asyncio.create_task(
+                self._run_stage(self._fetch_stage(), None, self._raw_queue)),
+            asyncio.create_task(
+                self._run_stage(self._parse_stage(), self._raw_queue,
+                                self._parsed_queue)),
+            asyncio.create_task(
+                self._run_stage(self._dedup_stage(), self._parsed_queue,
+                                self._unique_queue)),
+            asyncio.create_task(
+                self._run_stage(self._admit_stage(admit_queue), admit_queue,
+                                checked_queue)),
+        ]
+        if self.resolver is not None:
+            self._intake_tasks.append(
+                asyncio.create_task(
+                    self._run_stage(self._resolve_stage(),
+                                    self._unique_queue,
+                                    self._resolved_queue)))
+        if self.preflight:
+            self._intake_tasks.append(
+                asyncio.create_task(
+                    self._run_stage(self._preflight_stage(),
+                                    self._check_queue, self._test_queue)))
+        test_task = self._test_task = asyncio.create_task(
+            self._run_stage(self._test_stage(), self._test_queue, None))
+        geo_task = asyncio.create_task(
+            self._run_stage(self._geo_stage(), self._geo_queue, None))
+
+        tasks = [*self._intake_tasks, test_task, geo_task]
         try:
-            geoip_db_path = Path("data/GeoLite2-City.mmdb")
-            if geoip_db_path.exists():
-                geoip_reader = geoip2.database.Reader(str(geoip_db_path))
-                logger.info("Loaded GeoIP database")
-            else:
-                logger.warning(f"GeoIP database not found at {geoip_db_path}")
+            # Does not raise if an interrupt cancelled the tests
+            await asyncio.wait([test_task])
+            # Cached results flow to the geo stage straight from intake
+            await asyncio.gather(*self._intake_tasks, return_exceptions=True)
+            await self._geo_queue.put(_DONE)
+            await geo_task
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self._errors:
+            raise self._errors[0]
+
+    async def _run_stage(self, stage, inbox: Optional[asyncio.Queue],
+                         outbox: Optional[asyncio.Queue]) -> None:
+        """Run a stage, then signal end of stream to the next one"""
+        try:
+            await stage
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.warning(f"Could not load GeoIP database: {e}")
+            logger.error(f"Pipeline stage failed: {e}")
+            self._errors.append(e)
+            # Keep draining so upstream stages never block on a full queue
+            if inbox is not None:
+                async for _ in _drain(inbox):
+                    pass
+        if outbox is not None:
+            await outbox.put(_DONE)
+
+    async def _fetch_stage(self) -> None:
+        if self.supplied_proxies is not None:
+            self.stats["fetched"] = len(self.supplied_proxies)
+            return
+        if not self.sources:
+            return
+
+        async def forward(source: str, result: FetchResult) -> None:
+            # Keyed by the requested URL, which the health history uses too
+            self.fetch_results.append({**result.to_dict(), "source": source})
+            if self.health is not None:
+                self.health.observe_fetch(source, result.success,
+                                          result.response_time,
+                                          result.bytes_received,
+                                          len(result.configs))
+            self._update_progress("fetch", advance=1)
+            if not result.success:
+                logger.warning(f"Failed to fetch {source}: {result.error}")
+                return
+            count = len(result.configs)
+            self.stats["fetched"] += count
+            if self.overlap is not None:
+                mirror = self.overlap.observe_body(source, result.body_hash)
+                if mirror is not None:
+                    # Every config would only be dropped as a duplicate
+                    logger.info(f"{source} serves the same body as {mirror}, "
+                                f"skipping {count} configs")
+                    self.stats["mirrored_sources"] += 1
+                    return
+            self._update_progress("parse", grow=count)
+            await self._raw_queue.put(
+                (source, result.configs, result.schemes))
+
+        async with FetchEngine(self.fetch_concurrency,
+                               cache=self.source_cache) as engine:
+            await engine.fetch_each([self.specs[url] for url in self.sources],
+                                    forward)
+
+    async def _parse_stage(self) -> None:
+        if self.supplied_proxies is not None:
+            self._update_progress("parse", grow=len(self.supplied_proxies))
+            for proxy in self.supplied_proxies:
+                # Re-tested from scratch rather than trusting the old result
+                proxy.is_working = False
+                proxy.latency = None
+                self.parsed += 1
+                await self._parsed_queue.put(proxy)
+            self._update_progress("parse",
+                                  advance=len(self.supplied_proxies))
+
+        async for source, configs, schemes in _drain(self._raw_queue):
+            proxies = await parse_config_batch_parallel(
+                configs, self._parse_executor(len(configs)), schemes=schemes)
+            for proxy in proxies:
+                proxy.source = source
+                self.parsed += 1
+                await self._parsed_queue.put(proxy)
+            self._update_progress("parse", advance=len(configs))
+
+    def _parse_executor(self, count: int) -> Optional[ProcessPoolExecutor]:
+        """Process pool for parsing count configs, None to parse inline"""
+        workers = self.settings.PARSE_WORKERS
+        if workers == 1 or count < self.settings.PARSE_POOL_MIN_CONFIGS:
+            return None
+        if self._parse_pool is None:
+            self._parse_pool = ProcessPoolExecutor(workers or None)
+        return self._parse_pool
+
+    async def _dedup_stage(self) -> None:
+        """
+        Keep the first proxy of every canonical fingerprint.
+
+        Later copies only add their source to the representative's sources,
+        which is shared by reference so it stays current after the
+        representative has moved on.
+        """
+        origins: dict = {}
+        async for proxy in _drain(self._parsed_queue):
+            fingerprint = config_fingerprint(proxy)
+            if self.overlap is not None and proxy.source:
+                self.overlap.add(proxy.source, fingerprint)
+            sources = origins.get(fingerprint)
+            if sources is not None:
+                self.stats["duplicates"] += 1
+                if proxy.source and proxy.source not in sources:
+                    sources.append(proxy.source)
+                continue
+            if proxy.source and proxy.source not in proxy.sources:
+                proxy.sources.append(proxy.source)
+            origins[fingerprint] = proxy.sources
+            if self.health is not None:
+                self.health.observe_unique(proxy.source)
+            await self._unique_queue.put(proxy)
+
+    async def _resolve_stage(self) -> None:
+        """Resolve server names so GeoIP and pre-flight work on IPs"""
+        resolver = self.resolver
+        assert resolver is not None
+
+        async def forward(proxy: Proxy, _) -> None:
+            if not proxy.resolved_ips:
+                self.stats["unresolved"] += 1
+            await self._resolved_queue.put(proxy)
 
-        for proxy in tested_proxies:
-            if proxy.is_working:
-                await geolocate_proxy(proxy, geoip_reader)
+        try:
+            async with WorkerPool(resolver.resolve_proxy,
+                                  self.settings.DNS_CONCURRENCY,
+                                  on_result=forward,
+                                  on_error=forward) as pool:
+                async for proxy in _drain(self._unique_queue):
+                    await pool.submit(proxy)
+        finally:
+            await resolver.close()
+
+        logger.info(f"Resolved host names with {resolver.lookups} "
+                    f"DNS lookups; {self.stats['unresolved']} proxies "
+                    f"left unresolved")
+
+    async def _admit_stage(self, inbox: asyncio.Queue) -> None:
+        """Pre-test filters, --max-proxies and the result cache"""
+        admitted = 0
+        # Proxies already waiting are geolocated together, so the filters
+        # get GeoIPService's batched lookups
+        async for batch in _waiting(inbox, self.geoip.chunk_size):
+            if self.geo_before_test:
+                await self.geoip.geolocate(batch)
+            for proxy in batch:
+                if (self.pre_filter.active
+                        and not self.pre_filter.matches(proxy)):
+                    self.stats["prefiltered"] += 1
+                    continue
 
-            if progress:
-                progress.update(geo_task, advance=1)
+                if self.max_proxies and admitted >= self.max_proxies:
+                    self.over_limit += 1
+                    continue
+                admitted += 1
 
-        if geoip_reader:
-            geoip_reader.close()
+                if self.journal is not None and self.journal.restore(proxy):
+                    self.stats["resumed"] += 1
+                    await self._reuse_result(proxy)
+                    continue
+                if self.cache is not None and self.cache.restore(proxy):
+                    self.stats["cached"] += 1
+                    await self._reuse_result(proxy)
+                    continue
 
-        if progress:
-            filter_task = progress.add_task("Filtering...",
-                                            total=len(tested_proxies))
+                if self.preflight:
+                    self._update_progress("preflight", grow=1)
+                    await self._check_queue.put(proxy)
+                else:
+                    await self._queue_for_test(proxy)
+
+    async def _reuse_result(self, proxy: Proxy) -> None:
+        """Account for a result restored from the journal or cache"""
+        self.stats["tested"] += 1
+        if self.health is not None:
+            self.health.observe_test(proxy)
+        if self.quota is not None:
+            self.quota.record(proxy)
+        if proxy.is_working:
+            self.stats["working"] += 1
+            await self._send_to_geo(proxy)
+
+    async def _preflight_stage(self) -> None:
+        prober = EndpointProber()
+
+        async def forward(proxy: Proxy, reachable: bool) -> None:
+            self._update_progress("preflight", advance=1)
+            if reachable:
+                await self._queue_for_test(proxy)
+                return
+            self.stats["preflight_failed"] += 1
+            if self.health is not None:
+                self.health.observe_test(proxy)
+            if self.cache is not None:
+                self.cache.put(proxy)
+            if self.journal is not None:
+                self.journal.record(proxy)
+
+        async def failed(proxy: Proxy, error: Exception) -> None:
+            apply_probe_result(
+                proxy, ProbeResult(False, error=str(error)
+                                   or type(error).__name__))
+            await forward(proxy, False)
 
-        working_proxies = [p for p in tested_proxies if p.is_working]
+        try:
+            async with WorkerPool(prober.check,
+                                  self.settings.PREFLIGHT_CONCURRENCY,
+                                  on_result=forward,
+                                  on_error=failed) as pool:
+                async for proxy in _drain(self._check_queue):
+                    await pool.submit(proxy)
+        finally:
+            await prober.close()
+
+        logger.info(f"{self.stats['preflight_failed']} proxies failed "
+                    f"pre-flight checks ({prober.endpoints_probed} endpoints)")
+
+    async def _queue_for_test(self, proxy: Proxy) -> None:
+        self.queued_for_test += 1
+        self._update_progress("test", grow=1)
+        await self._test_queue.put(proxy)
+
+    async def _test_stage(self) -> None:
+        tester = SingBoxTester(timeout=self.timeout, host_size=self.host_size)
+        quota = self.quota
+        await tester.test_many(
+            self._test_feed(),
+            max_workers=self.max_workers,
+            on_result=self._record_test,
+            stop_when=(lambda: quota.done) if quota is not None else None)
+
+    async def _test_feed(self):
+        """Proxies waiting for a test, best sources first"""
+        async for batch in _waiting(self._test_queue,
+                                    self._test_queue.maxsize):
+            if self.health is not None:
+                batch = self.health.rank(batch)
+            if self.quota is None:
+                for proxy in batch:
+                    yield proxy
+                continue
+            for proxy in self.quota.schedule(interleave_by_source(batch)):
+                yield proxy
+            if self.quota.done:
+                return
+
+    async def _record_test(self, proxy: Proxy, tested_proxy: Proxy) -> None:
+        self.stats["tested"] += 1
+        if self.health is not None:
+            self.health.observe_test(tested_proxy)
+        self._update_progress("test", advance=1)
+        if self.cache is not None:
+            self.cache.put(tested_proxy)
+        if self.journal is not None:
+            self.journal.record(tested_proxy)
+
+        if self.quota is not None:
+            self.quota.record(tested_proxy)
+            if self.quota.done:
+                self._halt_intake()
+
+        if tested_proxy.is_working:
+            self.stats["working"] += 1
+            await self._send_to_geo(tested_proxy)
+
+    def _halt_intake(self) -> None:
+        """Quota met: stop fetching and feeding the tester"""
+        if self._intake_halted:
+            return
+        self._intake_halted = True
+        for task in self._intake_tasks:
+            task.cancel()
+        while not self._test_queue.empty():
+            self._test_queue.get_nowait()
+        self._test_queue.put_nowait(_DONE)
+
+    async def _send_to_geo(self, proxy: Proxy) -> None:
+        self._update_progress("geo", grow=1)
+        await self._geo_queue.put(proxy)
+
+    async def _geo_stage(self) -> None:
+        batch_size = self.geoip.chunk_size
+        async for batch in _waiting(self._geo_queue, batch_size):
+            # Proxies already geolocated by the pre-test filters are skipped
+            await self.geoip.geolocate(
+                [proxy for proxy in batch if not proxy.country_code])
+            self.working_proxies.extend(batch)
+            self._update_progress("geo", advance=len(batch))
+
+    def _add_progress(self, stage: str, description: str,
+                      total: int = 0) -> None:
+        if self.progress is None:
+            return
+        self._progress_totals[stage] = total
+        self._progress_tasks[stage] = self.progress.add_task(description,
+                                                             total=total)
+
+    def _update_progress(self, stage: str, advance: int = 0,
+                         grow: int = 0) -> None:
+        if self.progress is None or stage not in self._progress_tasks:
+            return
+        task_id = self._progress_tasks[stage]
+        if grow:
+            self._progress_totals[stage] += grow
+            self.progress.update(task_id,
+                                 total=self._progress_totals[stage])
+        if advance:
+            self.progress.update(task_id, advance=advance)
+
+    def _log_summary(self) -> None:
+        logger.info(f"Fetched {self.stats['fetched']} proxy configurations "
+                    f"({self.stats['not_modified']} sources not modified, "
+                    f"{self.stats['not_due']} not due)")
+        logger.info(f"Successfully parsed {self.parsed} configurations, "
+                    f"{self.stats['duplicates']} duplicates dropped")
+        if self.pre_filter.active:
+            logger.info(f"Pre-test filters dropped "
+                        f"{self.stats['prefiltered']} proxies")
+        if self.over_limit:
+            logger.info(f"Limited to {self.max_proxies} proxies "
+                        f"({self.over_limit} not tested)")
+        if self.cache is not None:
+            logger.info(f"Reused {self.stats['cached']} cached test results")
+        if self.resume:
+            logger.info(f"Resumed {self.stats['resumed']} results from the "
+                        f"journal of an interrupted run")
+        if self.stats["quota_skipped"]:
+            logger.info(f"Quota met, skipped {self.stats['quota_skipped']} "
+                        f"untested proxies")
+        logger.info(f"Tested {self.stats['tested']} proxies, "
+                    f"{self.stats['working']} working")
+
+        if self.progress is not None:
+            # Quota stops and failed fetches leave bars short of their total
+            for stage, task_id in self._progress_tasks.items():
+                self.progress.update(task_id,
+                                     completed=self._progress_totals[stage])
+
+    def _source_report(self, overlap: Optional[dict]) -> List[dict]:
+        """Fetch metadata and yield of every source, for statistics.json"""
+        report = [dict(result) for result in self.fetch_results]
+        report.extend({
+            "source": source,
+            "skipped": True
+        } for source in self.skipped_sources)
+        if self.health is not None:
+            for entry in report:
+                entry.update(self.health.report(entry["source"]))
+        if overlap is not None:
+            by_source = {entry["source"]: entry for entry in overlap["sources"]}
+            for entry in report:
+                analyzed = dict(by_source.get(entry["source"], {}))
+                analyzed.pop("source", None)
+                # Already reported from the fetch
+                analyzed.pop("body_hash", None)
+                entry.update(analyzed)
+        return sorted(report, key=lambda entry: entry["source"])
+
+    def _write_outputs(self, start_time: datetime) -> dict:
+        progress = self.progress
+        stats = self.stats
+        output_path = self.output_path
+        table = self.working_proxies
+        rows: Sequence[int] = range(len(table))
 
-        if country_filter:
-            working_proxies = [
-                p for p in working_proxies if p.country_code
-                and p.country_code.upper() == country_filter.upper()
-            ]
-            logger.info(
-                f"Filtered to {len(working_proxies)} proxies in {country_filter}"
-            )
+        if progress:
+            filter_task = progress.add_task("Filtering...", total=len(table))
 
-        if min_latency is not None:
-            working_proxies = [
-                p for p in working_proxies
-                if p.latency and p.latency >= min_latency
-            ]
+        if self.min_latency is not None:
+            rows = table.select(rows, min_latency=self.min_latency)
             logger.info(
-                f"Filtered to {len(working_proxies)} proxies with latency >= {min_latency}ms"
+                f"Filtered to {len(rows)} proxies with latency >= {self.min_latency}ms"
             )
 
-        if max_latency is not None:
-            working_proxies = [
-                p for p in working_proxies
-                if p.latency and p.latency <= max_latency
-            ]
+        if self.max_latency is not None:
+            rows = table.select(rows, max_latency=self.max_latency)
             logger.info(
-                f"Filtered to {len(working_proxies)} proxies with latency <= {max_latency}ms"
+                f"Filtered to {len(rows)} proxies with latency <= {self.max_latency}ms"
             )
 
-        working_proxies.sort(key=lambda p: p.latency or float('inf'))
+        rows = table.sort_by_latency(rows)
+        # Only the rows written out become Proxy objects again
+        working_proxies = table.proxies(rows)
 
         stats["filtered"] = len(working_proxies)
 
         if progress:
-            progress.update(filter_task, completed=len(tested_proxies))
+            progress.update(filter_task, completed=len(table))
 
         logger.info(
             f"Final result: {stats['filtered']} proxies after filtering")
@@ -246,6 +899,7 @@ async def run_full_pipeline(
                     "country_code": p.country_code,
                     "city": p.city,
                     "remarks": p.remarks,
+                    "sources": p.sources,
                 })
 
             json_path = output_path / "proxies.json"
@@ -256,11 +910,10 @@ async def run_full_pipeline(
 
             success_rate = (stats["working"] / stats["tested"] *
                             100) if stats["tested"] > 0 else 0
-            protocol_counts = {}
-            for p in working_proxies:
-                protocol_counts[p.protocol] = protocol_counts.get(
-                    p.protocol, 0) + 1
+            protocol_counts = table.protocol_counts(rows)
 
+            overlap = (self.overlap.analyze()
+                       if self.overlap is not None else None)
             stats_json = {
                 "generated_at":
                 start_time.isoformat(),
@@ -274,15 +927,44 @@ async def run_full_pipeline(
                 stats["working"],
                 "total_filtered":
                 stats["filtered"],
+                "total_preflight_failed":
+                stats["preflight_failed"],
+                "total_cached":
+                stats["cached"],
+                "total_prefiltered":
+                stats["prefiltered"],
+                "total_quota_skipped":
+                stats["quota_skipped"],
+                "total_duplicates":
+                stats["duplicates"],
+                "total_resumed":
+                stats["resumed"],
+                "total_not_modified":
+                stats["not_modified"],
+                "total_not_due":
+                stats["not_due"],
+                "total_bytes_fetched":
+                sum(r["bytes"] for r in self.fetch_results),
+                "partial":
+                self.interrupted,
                 "success_rate":
                 round(success_rate, 2),
                 "average_latency_ms":
-                round(
-                    sum(p.latency for p in working_proxies if p.latency) /
-                    len([p for p in working_proxies if p.latency]),
-                    2) if working_proxies else 0,
+                round(table.average_latency(rows), 2),
                 "protocol_distribution":
                 protocol_counts,
+                "total_sources_skipped":
+                stats["sources_skipped"],
+                "total_mirrored_sources":
+                stats["mirrored_sources"],
+                "total_unresolved":
+                stats["unresolved"],
+                "redundant_sources": {
+                    "drop": overlap["drop"],
+                    "reduce_refresh": overlap["reduce_refresh"],
+                } if overlap is not None else None,
+                "sources":
+                self._source_report(overlap),
                 "cache_bust":
                 int(datetime.now().timestamp() * 1000),
             }
@@ -297,7 +979,7 @@ async def run_full_pipeline(
                 "updated_at": datetime.now(timezone.utc).isoformat(),
                 "proxy_count": len(working_proxies),
                 "working_count": stats["working"],
-                "source_count": len(sources),
+                "source_count": len(self.sources) + len(self.skipped_sources),
                 "cache_bust": int(datetime.now().timestamp() * 1000),
                 "stats": stats_json,
             }
@@ -326,42 +1008,28 @@ async def run_full_pipeline(
             "error": None,
         }
 
-    except Exception as e:
-        logger.error(f"Pipeline failed with exception: {e}", exc_info=True)
-        return {
-            "success": False,
-            "stats": stats,
-            "output_files": {},
-            "error": f"Pipeline failed: {e}",
-        }
-
-
-async def _fetch_source(session: aiohttp.ClientSession,
-                        source_url: str) -> tuple:
-    try:
-        timeout = aiohttp.ClientTimeout(total=30)
-
-        async with session.get(source_url, timeout=timeout, ssl=True) as response:
-            if response.status != 200:
-                raise Exception(f"HTTP {response.status}")
-
-            text = await response.text()
-
-            if text.strip().count('\n') > 0 and len(text) > 100:
-                try:
-                    decoded = base64.b64decode(text).decode('utf-8')
-                    text = decoded
-                except Exception:
-                    pass
-
-            configs = [
-                line.strip() for line in text.split('\n')
-                if line.strip() and not line.strip().startswith('#')
-            ]
-
-            logger.debug(f"Fetched {len(configs)} configs from {source_url}")
-            return (configs, len(configs))
 
-    except Exception as e:
-        logger.error(f"Error fetching {source_url}: {e}")
-        raise
\ No newline at end of file
+async def _drain(queue: asyncio.Queue):
+    """Yield queue items until the end-of-stream marker"""
+    while (item := await queue.get()) is not _DONE:
+        yield item
+
+
+async def _waiting(queue: asyncio.Queue, limit: int):
+    """
+    Yield batches of whatever is already waiting in queue (up to limit).
+
+    Taking waiting items at once lets the caller reorder them, e.g. so a
+    large source that arrived first does not crowd out the ones behind it.
+    """
+    finished = False
+    while not finished:
+        batch: list = []
+        while len(batch) < limit and (not batch or not queue.empty()):
+            item = await queue.get()
+            if item is _DONE:
+                finished = True
+                break
+            batch.append(item)
+        if batch:
+            yield batch
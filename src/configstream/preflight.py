@@ -0,0 +1,197 @@
+"""
+Pre-flight reachability checks.
+
+A cheap TCP connect (plus a TLS handshake where the config uses TLS) weeds
+out dead endpoints before paying for a full sing-box test. Proxies sharing
+an endpoint share a single probe.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import ssl
+from dataclasses import dataclass
+
+from .config import AppSettings
+from .models import Proxy
+
+logger = logging.getLogger(__name__)
+
+# Protocols carried over UDP cannot be judged by a TCP connect
+UDP_PROTOCOLS = {"hysteria", "hysteria2", "tuic", "wireguard"}
+
+# Protocols that always speak TLS on the wire
+TLS_PROTOCOLS = {"trojan", "naive", "https"}
+
+
+@dataclass
+class ProbeResult:
+    """Outcome of probing a single endpoint"""
+
+    reachable: bool
+    connect_ms: float | None = None
+    tls_handshake_ms: float | None = None
+    error: str | None = None
+
+
+def _detail(details: dict | None, key: str) -> str:
+    """Read a details value that may be stored as a parse_qs list"""
+    if not details:
+        return ""
+    value = details.get(key, "")
+    if isinstance(value, list):
+        value = value[0] if value else ""
+    return str(value or "")
+
+
+def tls_server_name(proxy: Proxy) -> str | None:
+    """
+    Return the SNI to handshake with, or None if the config is plain TCP.
+    """
+    details = proxy.details
+    security = _detail(details, "security").lower()
+
+    if proxy.protocol == "vmess":
+        uses_tls = _detail(details, "tls").lower() == "tls"
+        sni = _detail(details, "sni") or _detail(details, "host")
+    elif proxy.protocol == "vless":
+        uses_tls = security in ("tls", "reality")
+        sni = _detail(details, "sni")
+    elif proxy.protocol in TLS_PROTOCOLS:
+        uses_tls = security != "none"
+        sni = _detail(details, "sni") or _detail(details, "peer")
+    else:
+        uses_tls = security == "tls"
+        sni = _detail(details, "sni")
+
+    if not uses_tls:
+        return None
+    return sni or proxy.address
+
+
+def endpoint_key(proxy: Proxy) -> tuple | None:
+    """
+    Return (host, port, sni) to probe, or None if the proxy is not probed.
+
+    A resolved IP is probed instead of the host name, so host names that
+    point at the same server share a probe; the SNI stays the name.
+    """
+    if proxy.protocol in UDP_PROTOCOLS or not proxy.address:
+        return None
+    host = (proxy.resolved_ips[0]
+            if proxy.resolved_ips else proxy.address.lower())
+    return (host, proxy.port, tls_server_name(proxy))
+
+
+def apply_probe_result(proxy: Proxy, result: ProbeResult) -> bool:
+    """Record a probe outcome on proxy and return whether it survived"""
+    if result.reachable:
+        proxy.connect_ms = result.connect_ms
+        proxy.tls_handshake_ms = result.tls_handshake_ms
+        return True
+    proxy.is_working = False
+    proxy.security_issues.append(f"Pre-flight failed: {result.error}")
+    return False
+
+
+def _tls_context() -> ssl.SSLContext:
+    # Only the handshake matters here; self-signed certificates are common
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+async def probe_endpoint(
+    host: str,
+    port: int,
+    server_name: str | None = None,
+    timeout: float = 3.0,
+) -> ProbeResult:
+    """
+    Open a TCP connection to host:port and optionally complete a TLS handshake.
+
+    Args:
+        host: Hostname or IP address
+        port: TCP port
+        server_name: SNI for the TLS handshake, or None to skip TLS
+        timeout: Timeout for the connect and for the handshake
+
+    Returns:
+        ProbeResult with timings in milliseconds
+    """
+    loop = asyncio.get_running_loop()
+    writer = None
+    transport = None
+    try:
+        start = loop.time()
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port),
+                                           timeout)
+        connect_ms = round((loop.time() - start) * 1000, 2)
+
+        tls_ms = None
+        if server_name is not None:
+            start = loop.time()
+            transport = await asyncio.wait_for(
+                loop.start_tls(writer.transport,
+                               writer.transport.get_protocol(),
+                               _tls_context(),
+                               server_hostname=server_name),
+                timeout,
+            )
+            tls_ms = round((loop.time() - start) * 1000, 2)
+
+        return ProbeResult(True, connect_ms, tls_ms)
+
+    except asyncio.TimeoutError:
+        return ProbeResult(False, error="Timeout")
+    except (OSError, ssl.SSLError) as e:
+        return ProbeResult(False, error=str(e) or type(e).__name__)
+    except (UnicodeError, ValueError) as e:
+        # Host names the parsers accept but IDNA cannot encode
+        return ProbeResult(False, error=f"Invalid host: {e}")
+    finally:
+        if transport is not None:
+            transport.close()
+        elif writer is not None:
+            writer.close()
+
+
+class EndpointProber:
+    """
+    Per-proxy pre-flight for streaming pipelines.
+
+    Proxies arrive one at a time, so instead of deduplicating a full list
+    up front, concurrent and later checks of the same endpoint await the
+    probe that is already running or finished.
+    """
+
+    def __init__(self, timeout: float | None = None):
+        self.timeout = (timeout if timeout is not None else
+                        AppSettings().PREFLIGHT_TIMEOUT)
+        self._probes: dict[tuple, asyncio.Task] = {}
+
+    @property
+    def endpoints_probed(self) -> int:
+        return len(self._probes)
+
+    async def check(self, proxy: Proxy) -> bool:
+        """Probe the proxy's endpoint (once) and return whether it survived"""
+        key = endpoint_key(proxy)
+        if key is None:
+            return True
+
+        probe = self._probes.get(key)
+        if probe is None:
+            host, port, server_name = key
+            probe = asyncio.create_task(
+                probe_endpoint(host, port, server_name, self.timeout))
+            self._probes[key] = probe
+        return apply_probe_result(proxy, await asyncio.shield(probe))
+
+    async def close(self) -> None:
+        """Cancel probes nobody is waiting for any more"""
+        for probe in self._probes.values():
+            probe.cancel()
+        await asyncio.gather(*self._probes.values(), return_exceptions=True)
@@ -0,0 +1,244 @@
+"""
+Columnar storage of tested proxies.
+
+A run keeps every working proxy until the outputs are written. ProxyTable
+holds them as columns instead of Proxy objects: numbers in typed arrays,
+protocols, countries and sources once each in a string pool, IPs packed
+into 16 bytes and no details dicts at all. Filtering, sorting and the
+statistics work on row numbers; Proxy objects (with details parsed again
+from their configs) are only built for the rows that are written out.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import math
+import sys
+from array import array
+from collections.abc import Hashable, Iterable
+from typing import Any, Generic, TypeVar
+
+from .core import parse_config
+from .models import Proxy
+
+IPAddress = ipaddress.IPv4Address | ipaddress.IPv6Address
+
+T = TypeVar("T", bound=Hashable)
+
+_NO_IP = bytes(16)
+_IPV4_MAPPED = bytes(10) + b"\xff\xff"
+
+
+def pack_ip(address: str) -> bytes:
+    """16-byte form of an IP address (IPv4 mapped), zeros for host names"""
+    try:
+        ip = ipaddress.ip_address(address.strip("[]"))
+    except ValueError:
+        return _NO_IP
+    return _IPV4_MAPPED + ip.packed if ip.version == 4 else ip.packed
+
+
+def _float(value: float | None) -> float:
+    return math.nan if value is None else float(value)
+
+
+def _optional(value: float) -> float | None:
+    return None if math.isnan(value) else value
+
+
+class _StringPool(Generic[T]):
+    """Distinct strings of a column, referenced by index"""
+
+    def __init__(self) -> None:
+        self.values: list[T] = []
+        self._index: dict[T, int] = {}
+
+    def add(self, value: T) -> int:
+        index = self._index.get(value)
+        if index is None:
+            index = self._index[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+
+class ProxyTable:
+    """Array-backed columns of proxies, one row per proxy"""
+
+    def __init__(self, proxies: Iterable[Proxy] = ()):
+        self.ports = array("l")
+        self.latencies = array("d")
+        self.connect_ms = array("d")
+        self.tls_handshake_ms = array("d")
+        self.working = array("B")
+        self.secure = array("B")
+        self.ips = bytearray()
+        self.protocol_ids = array("L")
+        self.country_ids = array("L")
+        self.source_ids = array("L")
+        self._protocols: _StringPool[str] = _StringPool()
+        # (country, country_code) pairs
+        self._countries: _StringPool[tuple[str, str]] = _StringPool()
+        self._sources: _StringPool[str] = _StringPool()
+
+        self.configs: list[str] = []
+        self.addresses: list[str] = []
+        self.uuids: list[str] = []
+        self.remarks: list[str] = []
+        self.cities: list[str] = []
+        self.asns: list[str] = []
+        self.tested_at: list[str] = []
+        # Shared with the deduplication stage, which may still add to them
+        self.sources: list[list[str]] = []
+        # None for the usual empty lists
+        self.security_issues: list[list[str] | None] = []
+        self.resolved_ips: list[list[str] | None] = []
+        self.extend(proxies)
+
+    def __len__(self) -> int:
+        return len(self.configs)
+
+    def append(self, proxy: Proxy) -> int:
+        """Add a proxy; returns its row number"""
+        self.ports.append(int(proxy.port))
+        self.latencies.append(_float(proxy.latency))
+        self.connect_ms.append(_float(proxy.connect_ms))
+        self.tls_handshake_ms.append(_float(proxy.tls_handshake_ms))
+        self.working.append(bool(proxy.is_working))
+        self.secure.append(bool(proxy.is_secure))
+        self.ips += pack_ip(proxy.resolved_ips[0]
+                            if proxy.resolved_ips else proxy.address)
+        self.protocol_ids.append(self._protocols.add(proxy.protocol))
+        self.country_ids.append(
+            self._countries.add((proxy.country, proxy.country_code)))
+        self.source_ids.append(self._sources.add(proxy.source))
+
+        self.configs.append(proxy.config)
+        self.addresses.append(proxy.address)
+        self.uuids.append(proxy.uuid)
+        self.remarks.append(proxy.remarks)
+        self.cities.append(sys.intern(proxy.city or ""))
+        self.asns.append(sys.intern(proxy.asn or ""))
+        self.tested_at.append(proxy.tested_at)
+        self.sources.append(proxy.sources)
+        self.security_issues.append(proxy.security_issues or None)
+        self.resolved_ips.append(proxy.resolved_ips or None)
+        return len(self.configs) - 1
+
+    def extend(self, proxies: Iterable[Proxy]) -> None:
+        for proxy in proxies:
+            self.append(proxy)
+
+    def latency(self, row: int) -> float | None:
+        return _optional(self.latencies[row])
+
+    def protocol(self, row: int) -> str:
+        return self._protocols.values[self.protocol_ids[row]]
+
+    def country_code(self, row: int) -> str:
+        return self._countries.values[self.country_ids[row]][1]
+
+    def ip(self, row: int) -> IPAddress | None:
+        """IP address of a row, None for a host name that did not resolve"""
+        packed = bytes(self.ips[row * 16:row * 16 + 16])
+        if packed == _NO_IP:
+            return None
+        ip = ipaddress.IPv6Address(packed)
+        return ip.ipv4_mapped or ip
+
+    def details(self, row: int) -> dict[str, Any]:
+        """Protocol details of a row, parsed again from its config"""
+        parsed = parse_config(self.configs[row])
+        return parsed.details if parsed is not None and parsed.details else {}
+
+    def select(self,
+               rows: Iterable[int] | None = None,
+               min_latency: float | None = None,
+               max_latency: float | None = None) -> list[int]:
+        """
+        Rows with a measured latency within the bounds.
+
+        Without bounds every row is kept, measured or not.
+        """
+        if rows is None:
+            rows = range(len(self))
+        if min_latency is None and max_latency is None:
+            return list(rows)
+        low = -math.inf if min_latency is None else min_latency
+        high = math.inf if max_latency is None else max_latency
+        latencies = self.latencies
+        # NaN (not measured) fails both comparisons; 0 counts as unmeasured
+        return [
+            row for row in rows
+            if latencies[row] and low <= latencies[row] <= high
+        ]
+
+    def sort_by_latency(self, rows: Iterable[int] | None = None) -> list[int]:
+        """Rows fastest first, unmeasured ones last in their original order"""
+        if rows is None:
+            rows = range(len(self))
+        latencies = self.latencies
+
+        def key(row: int) -> float:
+            latency = latencies[row]
+            return latency if latency and not math.isnan(
+                latency) else math.inf
+
+        return sorted(rows, key=key)
+
+    def protocol_counts(self,
+                        rows: Iterable[int] | None = None) -> dict[str, int]:
+        if rows is None:
+            rows = range(len(self))
+        counts = [0] * len(self._protocols.values)
+        for row in rows:
+            counts[self.protocol_ids[row]] += 1
+        return {
+            protocol: count
+            for protocol, count in zip(self._protocols.values, counts)
+            if count
+        }
+
+    def average_latency(self, rows: Iterable[int] | None = None) -> float:
+        """Mean of the measured latencies, 0 when there are none"""
+        if rows is None:
+            rows = range(len(self))
+        measured = [
+            self.latencies[row] for row in rows
+            if self.latencies[row] and not math.isnan(self.latencies[row])
+        ]
+        return sum(measured) / len(measured) if measured else 0
+
+    def proxy(self, row: int, details: bool = True) -> Proxy:
+        """Build the Proxy of a row"""
+        country, country_code = self._countries.values[self.country_ids[row]]
+        return Proxy(
+            config=self.configs[row],
+            protocol=self.protocol(row),
+            address=self.addresses[row],
+            port=self.ports[row],
+            uuid=self.uuids[row],
+            remarks=self.remarks[row],
+            country=country,
+            country_code=country_code,
+            city=self.cities[row],
+            asn=self.asns[row],
+            latency=self.latency(row),
+            is_working=bool(self.working[row]),
+            is_secure=bool(self.secure[row]),
+            security_issues=list(self.security_issues[row] or ()),
+            tested_at=self.tested_at[row],
+            source=self._sources.values[self.source_ids[row]],
+            sources=self.sources[row],
+            connect_ms=_optional(self.connect_ms[row]),
+            tls_handshake_ms=_optional(self.tls_handshake_ms[row]),
+            resolved_ips=list(self.resolved_ips[row] or ()),
+            details=self.details(row) if details else {},
+        )
+
+    def proxies(self,
+                rows: Iterable[int] | None = None,
+                details: bool = True) -> list[Proxy]:
+        """Build the Proxies of rows, in the given order"""
+        if rows is None:
+            rows = range(len(self))
+        return [self.proxy(row, details) for row in rows]
@@ -0,0 +1,109 @@
+"""
+Quota-driven early termination for the test stage.
+
+Consumers usually only need the fastest few hundred proxies overall or per
+country. WorkingQuota tracks working results as they arrive so the test
+stage can stop scheduling new work once the quotas are met, while a small
+exploration budget keeps testing sources that have not produced anything
+yet so the result does not collapse onto a single source.
+"""
+
+from __future__ import annotations
+
+import math
+from collections import Counter
+from collections.abc import Iterable, Iterator
+
+from .config import AppSettings
+from .models import Proxy
+
+
+def interleave_by_source(proxies: Iterable[Proxy]) -> list[Proxy]:
+    """Order proxies round-robin across their sources"""
+    groups: dict[str, list[Proxy]] = {}
+    for proxy in proxies:
+        groups.setdefault(proxy.source, []).append(proxy)
+
+    ordered = []
+    queues = [iter(group) for group in groups.values()]
+    while queues:
+        remaining = []
+        for queue in queues:
+            queued = next(queue, None)
+            if queued is not None:
+                ordered.append(queued)
+                remaining.append(queue)
+        queues = remaining
+    return ordered
+
+
+class WorkingQuota:
+    """Tracks working results against a global target and per-country caps"""
+
+    def __init__(
+        self,
+        target_working: int | None = None,
+        per_country: int | None = None,
+        exploration: float | None = None,
+    ):
+        """
+        Args:
+            target_working: Stop once this many working proxies are found
+            per_country: Skip countries that already have this many
+            exploration: Fraction of the quota spent testing sources that
+                have not produced a working proxy yet, after quotas are met
+        """
+        if exploration is None:
+            exploration = AppSettings().QUOTA_EXPLORATION
+        quota_size = target_working or per_country or 0
+
+        self.target_working = target_working
+        self.per_country = per_country
+        self.explore_left = math.ceil(quota_size * exploration)
+        self.working = 0
+        self.by_country: Counter[str] = Counter()
+        self.productive_sources: set[str] = set()
+        self._exploring: set[int] = set()
+
+    @property
+    def target_reached(self) -> bool:
+        return bool(self.target_working
+                    and self.working >= self.target_working)
+
+    @property
+    def done(self) -> bool:
+        """True once no further test can improve the result"""
+        return (self.target_reached and self.explore_left <= 0
+                and not self._exploring)
+
+    def _country_full(self, proxy: Proxy) -> bool:
+        return bool(self.per_country and
+                    self.by_country[proxy.country_code or "XX"] >=
+                    self.per_country)
+
+    def wants(self, proxy: Proxy) -> bool:
+        """Decide whether proxy is still worth scheduling"""
+        if not self.target_reached and not self._country_full(proxy):
+            return True
+        if self.explore_left > 0 and proxy.source not in self.productive_sources:
+            self.explore_left -= 1
+            self._exploring.add(id(proxy))
+            return True
+        return False
+
+    def record(self, proxy: Proxy) -> None:
+        """Account for a finished test"""
+        self._exploring.discard(id(proxy))
+        if not proxy.is_working:
+            return
+        self.working += 1
+        self.by_country[proxy.country_code or "XX"] += 1
+        self.productive_sources.add(proxy.source)
+
+    def schedule(self, proxies: Iterable[Proxy]) -> Iterator[Proxy]:
+        """Lazily yield the proxies that are still wanted at pull time"""
+        for proxy in proxies:
+            if self.done:
+                return
+            if self.wants(proxy):
+                yield proxy
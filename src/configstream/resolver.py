@@ -0,0 +1,184 @@
+"""
+Asynchronous DNS resolution of proxy servers.
+
+Most configs name their server by host name. Resolving every name once per
+run, and reusing answers across runs for as long as their TTL allows,
+gives GeoIP an address it can look up and lets pre-flight probes connect
+to IPs, so proxies behind the same IP:port share a single probe.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import ipaddress
+import json
+import logging
+import os
+import time
+import warnings
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Literal
+
+import aiodns
+
+from .config import AppSettings
+from .fingerprint import normalize_host
+from .models import Proxy
+
+logger = logging.getLogger(__name__)
+
+
+def is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host.strip("[]"))
+    except ValueError:
+        return False
+    return True
+
+
+class DNSCache:
+    """On-disk cache of DNS answers, each kept until its TTL runs out"""
+
+    def __init__(self, path: str | Path, max_entries: int | None = None):
+        settings = AppSettings()
+        self.path = Path(path)
+        self.max_entries = max_entries or settings.DNS_CACHE_MAX_ENTRIES
+        # Host -> {"ips": [...], "expires": epoch seconds}; no IPs means
+        # the name did not resolve
+        self.entries: OrderedDict[str, dict[str, Any]] = OrderedDict()
+
+    def load(self) -> None:
+        """Load the answers that have not expired yet"""
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable DNS cache {self.path}: {e}")
+            return
+        now = time.time()
+        for host, entry in data.get("entries", {}).items():
+            if entry.get("expires", 0) > now:
+                self.entries[host] = entry
+        logger.info(f"Loaded {len(self.entries)} cached DNS answers")
+
+    def save(self) -> None:
+        """Write the cache atomically"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps({"entries": self.entries}))
+        os.replace(tmp_path, self.path)
+
+    def get(self, host: str) -> list[str] | None:
+        """Cached IPs of host ([] if it did not resolve), None if unknown"""
+        entry = self.entries.get(host)
+        if entry is None or entry["expires"] <= time.time():
+            return None
+        self.entries.move_to_end(host)
+        ips: list[str] = entry["ips"]
+        return ips
+
+    def put(self, host: str, ips: list[str], ttl: float) -> None:
+        self.entries[host] = {"ips": ips, "expires": time.time() + ttl}
+        self.entries.move_to_end(host)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class HostResolver:
+    """
+    Resolves proxy host names, each distinct name at most once at a time.
+
+    Answers are cached for their TTL; names that do not resolve are cached
+    for DNS_NEGATIVE_TTL seconds.
+    """
+
+    def __init__(self,
+                 cache: DNSCache | None = None,
+                 timeout: float | None = None):
+        settings = AppSettings()
+        self.cache = cache
+        self.timeout = (timeout
+                        if timeout is not None else settings.DNS_TIMEOUT)
+        self.negative_ttl = settings.DNS_NEGATIVE_TTL
+        self._resolver: aiodns.DNSResolver | None = None
+        self._pending: dict[str, asyncio.Future] = {}
+        self.lookups = 0
+        self.failures = 0
+
+    async def resolve(self, host: str) -> list[str]:
+        """
+        IPs of host, IPv4 first; the host itself if it is an IP.
+
+        Returns:
+            Addresses, or [] if the name did not resolve
+        """
+        host = normalize_host(host)
+        if not host or is_ip(host):
+            return [host] if host else []
+        if self.cache is not None:
+            cached = self.cache.get(host)
+            if cached is not None:
+                return cached
+
+        pending = self._pending.get(host)
+        if pending is None:
+            pending = asyncio.ensure_future(self._lookup(host))
+            self._pending[host] = pending
+            pending.add_done_callback(
+                lambda _: self._pending.pop(host, None))
+        return await asyncio.shield(pending)
+
+    async def resolve_proxy(self, proxy: Proxy) -> Proxy:
+        """Record the IPs of the proxy's server on proxy.resolved_ips"""
+        if not proxy.resolved_ips:
+            proxy.resolved_ips = await self.resolve(proxy.address)
+        return proxy
+
+    async def _query(self, host: str,
+                     qtype: Literal["A", "AAAA"]) -> list[Any]:
+        if self._resolver is None:
+            self._resolver = aiodns.DNSResolver(timeout=self.timeout,
+                                                tries=2)
+        with warnings.catch_warnings():
+            # Deprecated in aiodns 4, but the API every version has
+            warnings.simplefilter("ignore", DeprecationWarning)
+            future = self._resolver.query(host, qtype)
+        try:
+            return await future
+        except aiodns.error.DNSError:
+            return []
+
+    async def _lookup(self, host: str) -> list[str]:
+        self.lookups += 1
+        try:
+            answers = await asyncio.gather(self._query(host, "A"),
+                                           self._query(host, "AAAA"))
+        except (OSError, ValueError) as e:
+            logger.debug(f"Could not resolve {host}: {e}")
+            answers = ([], [])
+        records = [record for answer in answers for record in answer]
+        ips = list(dict.fromkeys(record.host for record in records))
+        if ips:
+            ttl = min(record.ttl for record in records)
+        else:
+            self.failures += 1
+            ttl = self.negative_ttl
+        if self.cache is not None:
+            self.cache.put(host, ips, ttl)
+        return ips
+
+    async def close(self) -> None:
+        """Cancel lookups nobody is waiting for and release the channel"""
+        for pending in list(self._pending.values()):
+            pending.cancel()
+        await asyncio.gather(*self._pending.values(), return_exceptions=True)
+        if self._resolver is not None:
+            # close() is a coroutine in aiodns 4 and missing before 3.3
+            close = getattr(self._resolver, "close", None)
+            outcome = close() if close is not None else None
+            if inspect.isawaitable(outcome):
+                await outcome
+            self._resolver = None
@@ -0,0 +1,221 @@
+"""
+Bounded worker pool for running pipeline stages concurrently.
+
+A fixed number of long-lived workers pull items from a bounded queue, so
+memory use and the number of in-flight coroutines stay constant no matter
+how large the input is.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+from collections.abc import (AsyncIterable, AsyncIterator, Awaitable,
+                             Callable, Iterable)
+from typing import Any, Generic, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_SENTINEL = object()
+
+
+class WorkerPool(Generic[T, R]):
+    """Fixed set of workers consuming items from a bounded queue.
+
+    Example:
+        >>> async with WorkerPool(tester.test, max_workers=25,
+        ...                       on_result=record) as pool:
+        ...     for proxy in proxies:
+        ...         await pool.submit(proxy)
+    """
+
+    def __init__(
+        self,
+        worker: Callable[[T], Awaitable[R]],
+        max_workers: int = 10,
+        queue_size: int | None = None,
+        on_result: Callable[[T, R], Any] | None = None,
+        on_error: Callable[[T, Exception], Any] | None = None,
+    ):
+        """
+        Args:
+            worker: Coroutine function called once per item
+            max_workers: Number of concurrent workers
+            queue_size: Maximum queued items (defaults to twice max_workers)
+            on_result: Callback invoked with (item, result) as each item completes
+            on_error: Callback invoked with (item, exception) when the worker raises
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+
+        self.worker = worker
+        self.max_workers = max_workers
+        self.on_result = on_result
+        self.on_error = on_error
+        self._queue: asyncio.Queue = asyncio.Queue(
+            maxsize=queue_size or max_workers * 2)
+        self._workers: list[asyncio.Task] = []
+        self._stopped = False
+
+    @property
+    def stopped(self) -> bool:
+        """True once stop() has been called"""
+        return self._stopped
+
+    def start(self) -> None:
+        """Spawn the workers (called automatically by submit)"""
+        if self._workers or self._stopped:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker_loop())
+            for _ in range(self.max_workers)
+        ]
+
+    async def submit(self, item: T) -> bool:
+        """
+        Queue an item for processing, waiting while the queue is full.
+
+        Returns:
+            False if the pool has been stopped and the item was not queued
+        """
+        if self._stopped:
+            return False
+        self.start()
+        await self._queue.put(item)
+        return not self._stopped
+
+    async def join(self) -> None:
+        """Signal end of input and wait for the workers to drain the queue"""
+        if not self._stopped:
+            for _ in self._workers:
+                await self._queue.put(_SENTINEL)
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stop(self) -> None:
+        """Stop scheduling new work and cancel in-flight items"""
+        if self._stopped:
+            return
+        self._stopped = True
+        for task in self._workers:
+            task.cancel()
+        # Free any producer blocked on a full queue
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    async def __aenter__(self) -> WorkerPool[T, R]:
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.stop()
+        await self.join()
+
+    async def _worker_loop(self) -> None:
+        while True:
+            item = await self._queue.get()
+            if item is _SENTINEL:
+                return
+
+            try:
+                result = await self.worker(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await self._notify(self.on_error, item, e)
+                if self.on_error is None:
+                    logger.error(f"Worker failed on item: {str(e)[:100]}")
+                continue
+
+            await self._notify(self.on_result, item, result)
+
+    async def _notify(self, callback: Callable | None, item: Any,
+                      value: Any) -> None:
+        if callback is None:
+            return
+        try:
+            outcome = callback(item, value)
+            if inspect.isawaitable(outcome):
+                await outcome
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Worker pool callback failed: {e}")
+
+
+async def iterate(items: Iterable[T] | AsyncIterable[T]) -> AsyncIterator[T]:
+    """Iterate a sync or async iterable with async for"""
+    if isinstance(items, AsyncIterable):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def batched(items: Iterable[T] | AsyncIterable[T],
+                  size: int) -> AsyncIterator[list[T]]:
+    """Group a sync or async iterable into lists of at most size items"""
+    batch: list[T] = []
+    async for item in iterate(items):
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def map_bounded(
+    items: Iterable[T] | AsyncIterable[T],
+    worker: Callable[[T], Awaitable[R]],
+    max_workers: int = 10,
+    on_result: Callable[[T, R], Any] | None = None,
+    stop_when: Callable[[], bool] | None = None,
+) -> list[R]:
+    """
+    Run worker over items with at most max_workers in flight.
+
+    Items are pulled from the iterable lazily, so generators are never
+    materialized up front. Async iterables (e.g. a queue reader) work too.
+
+    Args:
+        items: Items to process
+        worker: Coroutine function called once per item
+        max_workers: Number of concurrent workers
+        on_result: Callback invoked with (item, result) as each item completes
+        stop_when: Checked after each result; when it returns True, no new
+            items are scheduled and in-flight ones are cancelled
+
+    Returns:
+        Results in input order; items whose worker raised or were cancelled
+        are omitted
+    """
+    results: dict[int, R] = {}
+
+    async def run_indexed(entry: tuple[int, T]) -> R:
+        return await worker(entry[1])
+
+    async def collect(entry: tuple[int, T], result: R) -> None:
+        results[entry[0]] = result
+        if on_result is not None:
+            outcome = on_result(entry[1], result)
+            if inspect.isawaitable(outcome):
+                await outcome
+        if stop_when is not None and stop_when():
+            pool.stop()
+
+    pool = WorkerPool(run_indexed, max_workers, on_result=collect)
+    async with pool:
+        index = 0
+        async for item in iterate(items):
+            if not await pool.submit((index, item)):
+                break
+            index += 1
+
+    return [results[index] for index in sorted(results)]
@@ -1,14 +1,19 @@
+import asyncio
 from collections import defaultdict
 from time import time
 
 
 class RateLimiter:
-    """Token bucket rate limiter for proxy testing"""
+    """Token bucket rate limiter, one bucket per identifier (e.g. a host)"""
 
     def __init__(self, requests_per_second: float = 10):
         self.rate = requests_per_second
-        self.buckets = defaultdict(lambda: {
-            "tokens": 0,
+        # A bucket holds at least one whole token, or rates below 1 could
+        # never allow a request
+        self.capacity = max(1.0, requests_per_second)
+        # New buckets start full, allowing an initial burst of `capacity`
+        self.buckets: defaultdict[str, dict[str, float]] = defaultdict(lambda: {
+            "tokens": self.capacity,
             "last_update": time()
         })
 
@@ -20,7 +25,7 @@ class RateLimiter:
         # Add tokens based on time elapsed
         time_passed = current_time - bucket["last_update"]
         bucket["tokens"] += time_passed * self.rate
-        bucket["tokens"] = min(bucket["tokens"], self.rate)  # Cap at rate
+        bucket["tokens"] = min(bucket["tokens"], self.capacity)
         bucket["last_update"] = current_time
 
         if bucket["tokens"] >= 1:
@@ -33,3 +38,8 @@ class RateLimiter:
         """Get seconds to wait before next allowed request"""
         bucket = self.buckets[identifier]
         return (1 - bucket["tokens"]) / self.rate
+
+    async def acquire(self, identifier: str) -> None:
+        """Wait until a request is allowed, then consume its token"""
+        while not self.is_allowed(identifier):
+            await asyncio.sleep(self.get_wait_time(identifier))
@@ -0,0 +1,217 @@
+"""
+Shared sing-box host for batch testing.
+
+Instead of spawning one sing-box process per proxy, a SingBoxHost builds a
+single configuration holding one outbound per proxy, each bound to its own
+local HTTP inbound port, and runs it as one process.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import tempfile
+import time
+from typing import Any
+
+from singbox2proxy import SingBoxProxy
+
+from .models import Proxy
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for every inbound of a started host to accept connections
+READY_TIMEOUT = 15
+
+
+def _pick_free_port() -> int:
+    """Ask the OS for an unused local TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        port: int = s.getsockname()[1]
+        return port
+
+
+def translate_outbound(config: str, tag: str) -> dict[str, Any]:
+    """
+    Translate a proxy link into a sing-box outbound.
+
+    Args:
+        config: Proxy link (vmess://, vless://, ss://, ...)
+        tag: Tag to assign to the outbound
+
+    Returns:
+        sing-box outbound dictionary
+
+    Raises:
+        ValueError: If the link cannot be translated
+    """
+    generator = SingBoxProxy(config,
+                             http_port=False,
+                             socks_port=False,
+                             config_only=True,
+                             client=False)
+    outbound = dict(generator.generate_config()["outbounds"][0])
+    outbound["tag"] = tag
+    return outbound
+
+
+class HostSlot:
+    """Local inbound port bound to a single proxy outbound"""
+
+    def __init__(self, index: int, port: int):
+        self.index = index
+        self.port = port
+        self.inbound_tag = f"in-{index}"
+        self.outbound_tag = f"out-{index}"
+
+    @property
+    def http_proxy_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+
+class SingBoxHost:
+    """One sing-box process serving a slot per proxy in a batch"""
+
+    def __init__(self, proxies: list[Proxy]):
+        self.proxies = proxies
+        self.slots: dict[int, HostSlot] = {}
+        self.errors: dict[int, str] = {}
+        self._process: SingBoxProxy | None = None
+        self._config_path: str | None = None
+
+    def build_config(self) -> dict[str, Any]:
+        """
+        Build a sing-box config with one inbound/outbound pair per proxy.
+
+        Proxies whose links cannot be translated are left out of the config
+        and recorded in self.errors so a single bad link does not take down
+        the whole batch.
+        """
+        self.slots.clear()
+        self.errors.clear()
+
+        inbounds = []
+        outbounds = []
+        rules = []
+
+        for index, proxy in enumerate(self.proxies):
+            slot = HostSlot(index, _pick_free_port())
+            try:
+                outbound = translate_outbound(proxy.config, slot.outbound_tag)
+            except Exception as e:
+                self.errors[id(proxy)] = str(e)
+                continue
+
+            self.slots[id(proxy)] = slot
+            inbounds.append({
+                "type": "http",
+                "tag": slot.inbound_tag,
+                "listen": "127.0.0.1",
+                "listen_port": slot.port,
+            })
+            outbounds.append(outbound)
+            rules.append({
+                "inbound": [slot.inbound_tag],
+                "outbound": slot.outbound_tag,
+            })
+
+        outbounds.append({"type": "block", "tag": "block"})
+
+        return {
+            "log": {
+                "level": "warn"
+            },
+            "inbounds": inbounds,
+            "outbounds": outbounds,
+            "route": {
+                "rules": rules,
+                "final": "block"
+            },
+        }
+
+    def slot_for(self, proxy: Proxy) -> HostSlot | None:
+        """Return the slot serving proxy, or None if it was not hosted"""
+        return self.slots.get(id(proxy))
+
+    def error_for(self, proxy: Proxy) -> str | None:
+        """Return the translation error for proxy, if any"""
+        return self.errors.get(id(proxy))
+
+    async def start(self) -> None:
+        """Write the combined config and launch the sing-box process"""
+        config = self.build_config()
+        if not self.slots:
+            logger.debug("No proxies in batch could be translated")
+            return
+
+        fd, self._config_path = tempfile.mkstemp(prefix="configstream-host-",
+                                                 suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(config, f)
+
+        # singbox2proxy polls the first slot's inbound; the rest are
+        # checked by _wait_until_ready
+        first_slot = next(iter(self.slots.values()))
+        process = SingBoxProxy(self._config_path,
+                               http_port=first_slot.port,
+                               socks_port=False,
+                               config_only=True,
+                               client=False)
+        self._process = process
+        # start() blocks until sing-box is up
+        await asyncio.to_thread(process.start)
+        await self._wait_until_ready()
+        logger.debug(
+            f"Started shared sing-box host with {len(self.slots)} outbounds")
+
+    async def _wait_until_ready(self) -> None:
+        """
+        Wait until every slot's inbound accepts connections.
+
+        Raises:
+            TimeoutError: If some inbound is still closed after READY_TIMEOUT
+        """
+        deadline = time.monotonic() + READY_TIMEOUT
+        waiting = {slot.port for slot in self.slots.values()}
+        while waiting:
+            for port in list(waiting):
+                try:
+                    _, writer = await asyncio.open_connection(
+                        "127.0.0.1", port)
+                except OSError:
+                    continue
+                writer.close()
+                waiting.discard(port)
+            if not waiting:
+                return
+            if time.monotonic() >= deadline:
+                raise TimeoutError(
+                    f"{len(waiting)} sing-box inbounds did not open")
+            await asyncio.sleep(0.05)
+
+    async def stop(self) -> None:
+        """Stop the sing-box process and remove the generated config"""
+        try:
+            if self._process is not None:
+                await asyncio.to_thread(self._process.stop)
+        except Exception:
+            pass
+        finally:
+            self._process = None
+            if self._config_path:
+                try:
+                    os.unlink(self._config_path)
+                except OSError:
+                    pass
+                self._config_path = None
+
+    async def __aenter__(self) -> SingBoxHost:
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.stop()
@@ -0,0 +1,233 @@
+"""
+On-disk cache of source bodies for conditional GETs.
+
+The last body of every source is kept together with its ETag and
+Last-Modified, so the next fetch can send If-None-Match/If-Modified-Since
+and a 304 is served from the local copy. Extracted config lists are stored
+by body hash, so an unchanged body (or the same body mirrored under another
+URL) is never parsed twice.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import IO, Any
+
+logger = logging.getLogger(__name__)
+
+# Bump when the stored parse results would no longer match the parsers
+PARSE_VERSION = 3
+
+
+def body_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class BodyWriter:
+    """Streams a body to disk while hashing it; see SourceCache.body_writer"""
+
+    def __init__(self, cache: SourceCache, source: str):
+        self.cache = cache
+        self.source = source
+        self._hash = hashlib.sha256()
+        self._file: IO[bytes] | None = None
+        self._tmp_path: Path | None = None
+        try:
+            bodies = cache.directory / "bodies"
+            bodies.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=bodies, suffix=".part")
+            self._file = os.fdopen(fd, "wb")
+            self._tmp_path = Path(tmp_name)
+        except OSError as e:
+            logger.warning(f"Could not cache body of {source}: {e}")
+
+    def write(self, chunk: bytes) -> None:
+        self._hash.update(chunk)
+        if self._file is not None:
+            self._file.write(chunk)
+
+    def commit(self, etag: str | None, last_modified: str | None) -> str:
+        """Keep the body with its validators; returns the body hash"""
+        digest = self._hash.hexdigest()
+        if self._file is None or self._tmp_path is None:
+            return digest
+        self._file.close()
+        self._file = None
+        try:
+            self.cache._commit(self.source, self._tmp_path, digest, etag,
+                               last_modified)
+        except OSError as e:
+            logger.warning(f"Could not cache body of {self.source}: {e}")
+        self.abort()
+        return digest
+
+    def abort(self) -> None:
+        """Discard a partially written body"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._tmp_path is not None:
+            self._tmp_path.unlink(missing_ok=True)
+            self._tmp_path = None
+
+
+class SourceCache:
+    """Stores source bodies, their validators and their parse results"""
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        self.not_modified = 0
+        self.not_due = 0
+        self.parse_hits = 0
+
+    def _meta_path(self, source: str) -> Path:
+        key = hashlib.sha256(source.encode("utf-8")).hexdigest()[:32]
+        return self.directory / f"{key}.json"
+
+    def _body_path(self, digest: str) -> Path:
+        return self.directory / "bodies" / f"{digest}.txt"
+
+    def _parsed_path(self, digest: str, kind: str) -> Path:
+        return self.directory / "parsed" / f"{digest}.{kind}.json"
+
+    def _meta(self, source: str) -> dict[str, Any] | None:
+        try:
+            meta: dict[str, Any] = json.loads(
+                self._meta_path(source).read_text())
+        except (OSError, json.JSONDecodeError):
+            return None
+        if not self._body_path(meta.get("body_hash", "")).exists():
+            return None
+        return meta
+
+    def conditional_headers(self, source: str) -> dict[str, str]:
+        """Validators to send with the next request for source"""
+        meta = self._meta(source)
+        if meta is None:
+            return {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def revalidated(self, source: str) -> str | None:
+        """Record a 304 for source and return the stored body hash"""
+        meta = self._meta(source)
+        if meta is None:
+            return None
+        self.not_modified += 1
+        meta["checked_at"] = time.time()
+        try:
+            _write_atomic(self._meta_path(source), json.dumps(meta))
+        except OSError as e:
+            logger.warning(f"Could not update cache entry of {source}: {e}")
+        return str(meta["body_hash"])
+
+    def fresh(self, source: str, max_age: float) -> str | None:
+        """
+        Body hash of source if it was fetched or revalidated within the
+        last max_age seconds, i.e. it is not due for a refetch yet.
+        """
+        meta = self._meta(source)
+        if meta is None:
+            return None
+        checked_at = meta.get("checked_at", meta.get("fetched_at", 0))
+        if time.time() - checked_at > max_age:
+            return None
+        self.not_due += 1
+        return str(meta["body_hash"])
+
+    def body_writer(self, source: str) -> BodyWriter:
+        """Start writing a new body for source chunk by chunk"""
+        return BodyWriter(self, source)
+
+    def store(self, source: str, body: bytes, etag: str | None,
+              last_modified: str | None) -> str:
+        """Keep a complete body and its validators; returns the body hash"""
+        writer = self.body_writer(source)
+        writer.write(body)
+        return writer.commit(etag, last_modified)
+
+    def _commit(self, source: str, tmp_path: Path, digest: str,
+                etag: str | None, last_modified: str | None) -> None:
+        now = time.time()
+        previous = self._meta(source)
+        body_path = self._body_path(digest)
+        if not body_path.exists():
+            os.replace(tmp_path, body_path)
+        if previous is not None and previous["body_hash"] != digest:
+            self._forget(previous["body_hash"])
+        _write_atomic(
+            self._meta_path(source),
+            json.dumps({
+                "source": source,
+                "etag": etag,
+                "last_modified": last_modified,
+                "body_hash": digest,
+                "fetched_at": now,
+                "checked_at": now,
+            }))
+
+    def _forget(self, digest: str) -> None:
+        # A mirror still pointing at this body simply refetches in full
+        self._body_path(digest).unlink(missing_ok=True)
+        for parsed_path in (self.directory / "parsed").glob(f"{digest}.*"):
+            parsed_path.unlink(missing_ok=True)
+
+    def configs(self,
+                digest: str,
+                kind: str,
+                parse: Callable[[bytes], list[str]],
+                body: bytes | None = None) -> list[str]:
+        """
+        Return the configs extracted from a body, parsing it only once.
+
+        Args:
+            digest: Body hash from store() or revalidated()
+            kind: Name of the parser, so different parsers do not collide
+            parse: Extracts configs from the raw body on a cache miss
+            body: The body if already in memory
+        """
+        parsed_path = self._parsed_path(digest, kind)
+        try:
+            stored = json.loads(parsed_path.read_text())
+            if stored.get("version") == PARSE_VERSION:
+                self.parse_hits += 1
+                configs: list[str] = stored["configs"]
+                return configs
+        except (OSError, json.JSONDecodeError, KeyError):
+            pass
+
+        if body is None:
+            body = self._body_path(digest).read_bytes()
+        configs = parse(body)
+        self.put_configs(digest, kind, configs)
+        return configs
+
+    def put_configs(self, digest: str, kind: str, configs: list[str]) -> None:
+        """Store configs extracted from the body with the given hash"""
+        parsed_path = self._parsed_path(digest, kind)
+        try:
+            parsed_path.parent.mkdir(parents=True, exist_ok=True)
+            _write_atomic(parsed_path,
+                          json.dumps({
+                              "version": PARSE_VERSION,
+                              "configs": configs
+                          }))
+        except OSError as e:
+            logger.warning(f"Could not cache parse result {digest}: {e}")
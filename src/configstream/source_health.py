@@ -0,0 +1,249 @@
+"""
+Per-source health history.
+
+Every run records, for each source, how it fetched (latency, bytes,
+configs), how many configs only it contributed and how many of its proxies
+turned out to work. The decayed history gives each source a score, the
+expected number of working proxies it yields per run, which the pipeline
+uses to fetch and test the best sources first. Sources that stay empty or
+dead for several runs are skipped for an exponentially growing back-off
+period instead of wasting connections and test capacity every run.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+from .config import AppSettings
+from .models import Proxy
+
+logger = logging.getLogger(__name__)
+
+HEALTH_VERSION = 1
+
+# Back-off never grows beyond a week, so a revived source is found again
+MAX_BACKOFF_SECONDS = 7 * 24 * 3600
+
+# History of sources not seen for this long is dropped
+RETENTION_SECONDS = 30 * 24 * 3600
+
+
+class SourceHealthDB:
+    """On-disk history of source yield, used to rank and back off sources"""
+
+    def __init__(
+        self,
+        path: str | Path,
+        decay: float | None = None,
+        backoff_runs: int | None = None,
+        backoff_hours: float | None = None,
+    ):
+        """
+        Args:
+            path: JSON file holding the history
+            decay: Weight of the latest run in the running averages
+            backoff_runs: Consecutive barren runs before a source is
+                skipped (0 disables back-off)
+            backoff_hours: Length of the first back-off; doubles on every
+                further barren run
+        """
+        settings = AppSettings()
+        self.path = Path(path)
+        self.decay = decay if decay is not None else settings.SOURCE_HEALTH_DECAY
+        self.backoff_runs = (backoff_runs if backoff_runs is not None else
+                             settings.SOURCE_BACKOFF_RUNS)
+        self.backoff_hours = (backoff_hours if backoff_hours is not None
+                              else settings.SOURCE_BACKOFF_HOURS)
+        self.records: dict[str, dict[str, Any]] = {}
+        # Observations of the current run, folded in by commit()
+        self.run: dict[str, dict[str, Any]] = {}
+        self.last_run: dict[str, dict[str, Any]] = {}
+
+    def load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(
+                f"Ignoring unreadable source history {self.path}: {e}")
+            return
+        if data.get("version") == HEALTH_VERSION:
+            self.records = data.get("sources", {})
+
+    def save(self) -> None:
+        """Write the history atomically"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(
+            json.dumps({
+                "version": HEALTH_VERSION,
+                "sources": self.records
+            }))
+        os.replace(tmp_path, self.path)
+
+    def score(self, source: str) -> float | None:
+        """Expected working proxies per run, or None for an unknown source"""
+        record = self.records.get(source)
+        if record is None:
+            return None
+        # Smoothed, so sources whose proxies were never tested are not zero
+        working_ratio = (record["working"] + 1) / (record["tested"] + 2)
+        score: float = round(record["unique"] * working_ratio, 3)
+        return score
+
+    def backed_off(self, source: str, now: float | None = None) -> bool:
+        record = self.records.get(source)
+        if record is None or self.backoff_runs <= 0:
+            return False
+        skip_until: float = record.get("skip_until", 0)
+        return skip_until > (now or time.time())
+
+    def schedule(self, sources: Iterable[str]) -> tuple[list[str], list[str]]:
+        """
+        Order sources best first and hold back the backed-off ones.
+
+        Unknown sources come first so they build up a history quickly.
+
+        Returns:
+            (due, skipped) source lists
+        """
+        now = time.time()
+        due: list[str] = []
+        skipped: list[str] = []
+        for source in sources:
+            (skipped if self.backed_off(source, now) else due).append(source)
+        if not due and skipped:
+            logger.warning("Every source is backed off, fetching all of them")
+            due, skipped = skipped, []
+
+        def rank(source: str) -> tuple[bool, float]:
+            score = self.score(source)
+            return (score is not None, -(score or 0.0))
+
+        return sorted(due, key=rank), skipped
+
+    def rank(self, proxies: list[Proxy]) -> list[Proxy]:
+        """Stable-sort proxies so those from the best sources come first"""
+        scores: dict[str, float] = {}
+        for proxy in proxies:
+            if proxy.source not in scores:
+                score = self.score(proxy.source)
+                scores[proxy.source] = (float("inf")
+                                        if score is None else score)
+        return sorted(proxies, key=lambda p: -scores[p.source])
+
+    def _observed(self, source: str) -> dict[str, Any]:
+        return self.run.setdefault(source, _empty_observation())
+
+    def observe_fetch(self, source: str, success: bool,
+                      response_time: float | None, bytes_received: int,
+                      configs: int) -> None:
+        observed = self._observed(source)
+        observed["fetched"] = success
+        observed["fetch_seconds"] = response_time
+        observed["bytes"] = bytes_received
+        observed["configs"] = configs
+
+    def observe_unique(self, source: str) -> None:
+        """A config this source contributed that no earlier source had"""
+        self._observed(source)["unique"] += 1
+
+    def observe_test(self, proxy: Proxy) -> None:
+        observed = self._observed(proxy.source)
+        observed["tested"] += 1
+        if proxy.is_working:
+            observed["working"] += 1
+
+    def commit(self) -> None:
+        """Fold this run's observations into the history"""
+        now = time.time()
+        for source, observed in self.run.items():
+            record = self.records.get(source)
+            if record is None:
+                record = self.records[source] = {
+                    "runs": 0,
+                    "fetch_seconds": observed["fetch_seconds"],
+                    "bytes": observed["bytes"],
+                    "configs": observed["configs"],
+                    "unique": observed["unique"],
+                    "tested": 0.0,
+                    "working": 0.0,
+                    "barren_runs": 0,
+                }
+            self._fold(record, observed)
+            record["runs"] += 1
+            record["last_seen"] = now
+
+            barren = (not observed["fetched"] or observed["configs"] == 0
+                      or (observed["tested"] and not observed["working"]))
+            if observed["working"]:
+                record["barren_runs"] = 0
+                record.pop("skip_until", None)
+            elif barren:
+                record["barren_runs"] += 1
+                excess = record["barren_runs"] - self.backoff_runs
+                if self.backoff_runs > 0 and excess >= 0:
+                    backoff = min(self.backoff_hours * 3600 * 2**excess,
+                                  MAX_BACKOFF_SECONDS)
+                    record["skip_until"] = now + backoff
+                    logger.info(f"Backing off {source} for "
+                                f"{backoff / 3600:.1f}h after "
+                                f"{record['barren_runs']} barren runs")
+
+        for source in [
+                source for source, record in self.records.items()
+                if now - record.get("last_seen", now) > RETENTION_SECONDS
+        ]:
+            del self.records[source]
+        self.last_run, self.run = self.run, {}
+
+    def _fold(self, record: dict[str, Any], observed: dict[str, Any]) -> None:
+        weight = self.decay
+        for key in ("bytes", "configs", "unique"):
+            record[key] = round(
+                (1 - weight) * record[key] + weight * observed[key], 3)
+        if observed["fetch_seconds"] is not None:
+            previous = record["fetch_seconds"]
+            record["fetch_seconds"] = round(
+                observed["fetch_seconds"] if previous is None else
+                (1 - weight) * previous + weight * observed["fetch_seconds"],
+                3)
+        # Decayed totals, so the working ratio follows recent runs
+        for key in ("tested", "working"):
+            record[key] = round((1 - weight) * record[key] + observed[key],
+                                3)
+
+    def report(self, source: str) -> dict[str, Any]:
+        """This run's yield of source plus its updated score"""
+        observed = (self.run.get(source) or self.last_run.get(source)
+                    or _empty_observation())
+        record = self.records.get(source, {})
+        return {
+            "unique": observed["unique"],
+            "tested": observed["tested"],
+            "working": observed["working"],
+            "working_ratio": (round(observed["working"] /
+                                    observed["tested"], 3)
+                              if observed["tested"] else None),
+            "score": self.score(source),
+            "skipped_until": record.get("skip_until"),
+        }
+
+
+def _empty_observation() -> dict[str, Any]:
+    return {
+        "fetched": False,
+        "fetch_seconds": None,
+        "bytes": 0,
+        "configs": 0,
+        "unique": 0,
+        "tested": 0,
+        "working": 0,
+    }
@@ -0,0 +1,131 @@
+"""
+The sources file.
+
+Every non-comment line holds a source URL, optionally followed by
+key=value options, so a plain URL list stays valid:
+
+    https://example.com/sub.txt
+    https://example.com/daily.txt refresh=24h priority=5 format=base64
+    https://example.com/clash.yaml format=clash max_bytes=8M
+
+refresh:   Reuse the cached body instead of refetching until it is this
+           old (seconds, or a number with s/m/h/d)
+priority:  Higher priorities are fetched first (default 0)
+format:    plain, base64, clash or sing-box; skips sniffing the body
+max_bytes: Abort bodies larger than this (bytes, or a number with K/M/G)
+"""
+
+from __future__ import annotations
+
+import re
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+# Body formats a source can be declared as ("auto" sniffs the body)
+SOURCE_FORMATS = ("auto", "plain", "base64", "clash", "sing-box")
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)([smhd]?)", re.IGNORECASE)
+_SIZE = re.compile(r"(\d+(?:\.\d+)?)([kmg]?)b?", re.IGNORECASE)
+
+
+class SourceFileError(ValueError):
+    """Raised for a malformed line in the sources file"""
+
+
+@dataclass(frozen=True)
+class SourceSpec:
+    """A source URL and its fetch options"""
+
+    url: str
+    # Seconds a cached body stays fresh; None refetches every run
+    refresh: float | None = None
+    priority: int = 0
+    format: str = "auto"
+    max_bytes: int | None = None
+
+    @classmethod
+    def coerce(cls, source: str | SourceSpec) -> SourceSpec:
+        """Accept a bare URL wherever a SourceSpec is expected"""
+        return source if isinstance(source, SourceSpec) else cls(source)
+
+
+def parse_duration(value: str) -> float:
+    """Seconds in a duration such as 90, 30m, 6h or 1d"""
+    match = _DURATION.fullmatch(value.strip())
+    if match is None:
+        raise ValueError(f"invalid duration {value!r}")
+    unit = match.group(2).lower() or "s"
+    return float(match.group(1)) * _DURATION_UNITS[unit]
+
+
+def parse_size(value: str) -> int:
+    """Bytes in a size such as 1048576, 512K, 8M or 1GB"""
+    match = _SIZE.fullmatch(value.strip())
+    if match is None:
+        raise ValueError(f"invalid size {value!r}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).lower()])
+
+
+def parse_source_line(line: str) -> SourceSpec | None:
+    """Parse one line of the sources file; None for blanks and comments"""
+    fields = line.split()
+    if not fields or fields[0].startswith("#"):
+        return None
+
+    url, options = fields[0], {}
+    for field in fields[1:]:
+        if field.startswith("#"):
+            break
+        key, sep, value = field.partition("=")
+        if not sep or not value:
+            raise ValueError(f"expected key=value, got {field!r}")
+        options[key.lower().replace("-", "_")] = value
+
+    refresh = options.pop("refresh", None)
+    priority = options.pop("priority", "0")
+    fmt = options.pop("format", "auto").lower()
+    max_bytes = options.pop("max_bytes", None)
+    if options:
+        raise ValueError(f"unknown option {', '.join(sorted(options))}")
+    if fmt not in SOURCE_FORMATS:
+        raise ValueError(f"unknown format {fmt!r}")
+    try:
+        rank = int(priority)
+    except ValueError:
+        raise ValueError(f"invalid priority {priority!r}") from None
+
+    return SourceSpec(
+        url=url,
+        refresh=parse_duration(refresh) if refresh is not None else None,
+        priority=rank,
+        format=fmt,
+        max_bytes=parse_size(max_bytes) if max_bytes is not None else None,
+    )
+
+
+def parse_sources(lines: Iterable[str]) -> list[SourceSpec]:
+    """
+    Parse the lines of a sources file.
+
+    A URL listed twice keeps its first entry.
+
+    Raises:
+        SourceFileError: If a line cannot be parsed
+    """
+    specs: dict[str, SourceSpec] = {}
+    for number, line in enumerate(lines, start=1):
+        try:
+            spec = parse_source_line(line)
+        except ValueError as e:
+            raise SourceFileError(f"line {number}: {e}") from None
+        if spec is not None:
+            specs.setdefault(spec.url, spec)
+    return list(specs.values())
+
+
+def load_sources(path: str | Path) -> list[SourceSpec]:
+    """Read and parse a sources file"""
+    return parse_sources(Path(path).read_text().splitlines())
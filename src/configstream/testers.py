@@ -1,6 +1,8 @@
 import asyncio
 import logging
+from collections.abc import AsyncIterable, Callable, Iterable
 from datetime import datetime, timezone
+from typing import Any
 
 import aiohttp
 from aiohttp_proxy import ProxyConnector
@@ -8,6 +10,8 @@ from singbox2proxy import SingBoxProxy
 
 from .config import AppSettings
 from .models import Proxy
+from .scheduler import batched, map_bounded
+from .singbox_host import SingBoxHost
 
 logger = logging.getLogger(__name__)
 
@@ -15,10 +19,16 @@ logger = logging.getLogger(__name__)
 class SingBoxTester:
     """Concrete implementation of proxy tester using SingBox"""
 
-    def __init__(self, timeout: int | None = None):
+    def __init__(self,
+                 timeout: int | None = None,
+                 host_size: int = 0,
+                 race: bool | None = None):
         self.config = AppSettings()
         self.timeout = timeout if timeout is not None else self.config.TEST_TIMEOUT
         self.current_test_url_index = 0
+        # Number of proxies per shared sing-box process (0 = one per proxy)
+        self.host_size = host_size
+        self.race = race if race is not None else self.config.TEST_RACE
 
     async def test(self, proxy: Proxy) -> Proxy:
         """
@@ -27,50 +37,192 @@ class SingBoxTester:
         """
         proxy.tested_at = datetime.now(timezone.utc).isoformat()
 
-        sb_proxy = SingBoxProxy(proxy.config)
+        # Without config_only the constructor starts sing-box itself, on
+        # the event loop; start() blocks until it is up
+        sb_proxy = SingBoxProxy(proxy.config, config_only=True)
         try:
-            await sb_proxy.start()
-            connector = ProxyConnector.from_url(sb_proxy.http_proxy_url)
-
-            # Try multiple test URLs
-            for test_url in self.config.TEST_URLS.values():
-                try:
-                    async with aiohttp.ClientSession(
-                            connector=connector) as session:
-                        start_time = asyncio.get_event_loop().time()
-                        async with session.get(
-                                test_url,
-                                timeout=aiohttp.ClientTimeout(
-                                    total=self.timeout)) as response:
-                            if response.status == 204:
-                                end_time = asyncio.get_event_loop().time()
-                                proxy.latency = round(
-                                    (end_time - start_time) * 1000, 2)
-                                proxy.is_working = True
-                                break
-
-                except TimeoutError:
-                    continue
-                except Exception as e:
-                    logger.debug(f"Test URL {test_url} failed: {str(e)}")
-                    continue
-
-            if not proxy.is_working:
-                proxy.security_issues.append("All test URLs failed")
+            await asyncio.to_thread(sb_proxy.start)
+            await self._probe(proxy, sb_proxy.http_proxy_url)
 
         except Exception as e:
-            proxy.is_working = False
-            # Mask sensitive data in logs
-            if self.config.MASK_SENSITIVE_DATA:
-                proxy.security_issues.append(f"Connection failed: [MASKED]")
-            else:
-                proxy.security_issues.append(f"Connection failed: {str(e)}")
-            logger.error(f"Proxy test error: {str(e)[:50]}")
+            self._record_failure(proxy, e)
 
         finally:
             try:
-                await sb_proxy.stop()
+                await asyncio.to_thread(sb_proxy.stop)
             except Exception:
                 pass
 
         return proxy
+
+    async def test_many(
+        self,
+        proxies: Iterable[Proxy] | AsyncIterable[Proxy],
+        max_workers: int = 10,
+        on_result: Callable[[Proxy, Proxy], Any] | None = None,
+        stop_when: Callable[[], bool] | None = None,
+    ) -> list[Proxy]:
+        """
+        Test many proxies with at most max_workers tests in flight.
+
+        When host_size is set, proxies are tested in batches through a
+        shared multi-outbound sing-box process instead of one process each.
+        Once stop_when returns True, no further proxies are scheduled and
+        in-flight tests are cancelled.
+        """
+        if self.host_size <= 1:
+            return await map_bounded(proxies, self.test, max_workers,
+                                     on_result, stop_when)
+
+        tested = []
+        async for batch in batched(proxies, self.host_size):
+            tested.extend(await self._test_hosted(batch, max_workers,
+                                                  on_result, stop_when))
+            if stop_when is not None and stop_when():
+                break
+        return tested
+
+    async def _test_hosted(
+        self,
+        batch: list[Proxy],
+        max_workers: int,
+        on_result: Callable[[Proxy, Proxy], Any] | None,
+        stop_when: Callable[[], bool] | None = None,
+    ) -> list[Proxy]:
+        host = SingBoxHost(batch)
+        try:
+            try:
+                await host.start()
+            except Exception as e:
+                logger.warning(
+                    f"Shared sing-box host failed, testing batch individually: {str(e)[:100]}"
+                )
+                await host.stop()
+                return await map_bounded(batch, self.test, max_workers,
+                                         on_result, stop_when)
+
+            async def test_in_slot(proxy: Proxy) -> Proxy:
+                proxy.tested_at = datetime.now(timezone.utc).isoformat()
+                slot = host.slot_for(proxy)
+                try:
+                    if slot is None:
+                        raise ValueError(
+                            host.error_for(proxy) or "Proxy was not hosted")
+                    await self._probe(proxy, slot.http_proxy_url)
+                except Exception as e:
+                    self._record_failure(proxy, e)
+                return proxy
+
+            return await map_bounded(batch, test_in_slot, max_workers,
+                                     on_result, stop_when)
+        finally:
+            await host.stop()
+
+    async def _probe(self, proxy: Proxy, http_proxy_url: str) -> None:
+        """Fetch the test URLs through a local HTTP proxy until one succeeds"""
+        if self.race:
+            latency = await self._race_test_urls(http_proxy_url)
+        else:
+            latency = await self._try_test_urls(http_proxy_url)
+
+        if latency is not None:
+            proxy.latency = latency
+            proxy.is_working = True
+        else:
+            proxy.security_issues.append("All test URLs failed")
+
+    async def _fetch_test_url(self, session: aiohttp.ClientSession,
+                              test_url: str) -> float | None:
+        """Return the latency in ms if test_url answers 204, else None"""
+        start_time = asyncio.get_event_loop().time()
+        async with session.get(test_url,
+                               timeout=aiohttp.ClientTimeout(
+                                   total=self.timeout)) as response:
+            if response.status == 204:
+                end_time = asyncio.get_event_loop().time()
+                return round((end_time - start_time) * 1000, 2)
+        return None
+
+    async def _try_test_urls(self, http_proxy_url: str) -> float | None:
+        """Try each test URL in order, falling back after a full timeout"""
+        for test_url in self.config.TEST_URLS.values():
+            try:
+                connector = ProxyConnector.from_url(http_proxy_url)
+                async with aiohttp.ClientSession(
+                        connector=connector) as session:
+                    latency = await self._fetch_test_url(session, test_url)
+                    if latency is not None:
+                        return latency
+
+            except TimeoutError:
+                continue
+            except Exception as e:
+                logger.debug(f"Test URL {test_url} failed: {str(e)}")
+                continue
+
+        return None
+
+    async def _race_test_urls(self, http_proxy_url: str) -> float | None:
+        """
+        Race the test URLs within a single timeout window.
+
+        The next URL is launched when the previous ones have not answered
+        within TEST_RACE_STAGGER seconds, or as soon as one fails. The first
+        success wins and the remaining requests are cancelled.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.timeout
+        remaining_urls = list(self.config.TEST_URLS.values())
+        pending: set[asyncio.Task] = set()
+
+        connector = ProxyConnector.from_url(http_proxy_url)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            try:
+                while pending or remaining_urls:
+                    if remaining_urls and not pending:
+                        pending.add(
+                            asyncio.create_task(
+                                self._fetch_test_url(session,
+                                                     remaining_urls.pop(0))))
+
+                    time_left = deadline - loop.time()
+                    if time_left <= 0:
+                        break
+                    wait = (min(self.config.TEST_RACE_STAGGER, time_left)
+                            if remaining_urls else time_left)
+
+                    done, pending = await asyncio.wait(
+                        pending,
+                        timeout=wait,
+                        return_when=asyncio.FIRST_COMPLETED)
+
+                    for task in done:
+                        if task.exception() is not None:
+                            logger.debug(
+                                f"Test URL failed: {str(task.exception())}")
+                            continue
+                        latency: float | None = task.result()
+                        if latency is not None:
+                            return latency
+
+                    # Stagger elapsed or a URL failed: bring in the next one
+                    if remaining_urls and pending:
+                        pending.add(
+                            asyncio.create_task(
+                                self._fetch_test_url(session,
+                                                     remaining_urls.pop(0))))
+            finally:
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        return None
+
+    def _record_failure(self, proxy: Proxy, error: Exception) -> None:
+        proxy.is_working = False
+        # Mask sensitive data in logs
+        if self.config.MASK_SENSITIVE_DATA:
+            proxy.security_issues.append("Connection failed: [MASKED]")
+        else:
+            proxy.security_issues.append(f"Connection failed: {str(error)}")
+        logger.error(f"Proxy test error: {str(error)[:50]}")
@@ -4,6 +4,7 @@ from __future__ import annotations
 
 import asyncio
 import inspect
+import sys
 from collections.abc import Awaitable, Callable
 from dataclasses import dataclass
 from pathlib import Path
@@ -39,6 +40,43 @@ def pytest_pyfunc_call(pyfuncitem: pytest.Function) -> bool | None:
     return True
 
 
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Point CACHE_DIR at a temporary directory.
+
+    Pipeline runs save the test result cache (and their journal) there, so
+    without this tests would write to data/cache in the working tree and
+    reuse each other's results.
+    """
+
+    import configstream.pipeline  # noqa: F401  (binds AppSettings)
+
+    # test_config reloads the config module, so modules may hold different
+    # AppSettings classes
+    settings_classes = {
+        module.AppSettings
+        for name, module in list(sys.modules.items())
+        if name.startswith("configstream") and hasattr(module, "AppSettings")
+    }
+    for settings in settings_classes:
+        monkeypatch.setattr(settings, "CACHE_DIR", str(tmp_path / "cache"))
+
+
+@pytest.fixture(autouse=True)
+def isolated_geoip_readers(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Give every test its own set of shared GeoIP readers.
+
+    open_reader keeps one reader per database for the whole process, so a
+    reader patched in by one test would otherwise be handed to the next.
+    """
+
+    import configstream.geoip
+
+    monkeypatch.setattr(configstream.geoip, "_readers", {})
+
+
 @dataclass
 class SimpleFS:
     """Lightweight fake file-system helper used by CLI tests."""
@@ -0,0 +1,66 @@
+import base64
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from configstream.body_stream import (BodyTooLargeError, LineSplitter,
+                                      iter_lines, split_lines)
+
+BODY = "\n".join(f"trojan://pw@10.0.0.{i}:443#node{i}" for i in range(50))
+
+
+def _feed_in_chunks(data, size):
+    splitter = LineSplitter()
+    lines = []
+    for start in range(0, len(data), size):
+        lines.extend(splitter.feed(data[start:start + size]))
+    return lines + splitter.close()
+
+
+def test_plain_body_skips_blank_lines_and_comments():
+    body = b"# header\r\nvmess://a\r\n\nvless://b"
+    assert split_lines(body) == ["vmess://a", "vless://b"]
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 4096])
+def test_base64_body_decoded_across_chunk_boundaries(size):
+    encoded = base64.b64encode(BODY.encode())
+    wrapped = b"\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+
+    assert _feed_in_chunks(wrapped, size) == BODY.split("\n")
+
+
+def test_unpadded_urlsafe_base64():
+    encoded = base64.urlsafe_b64encode(BODY.encode()).rstrip(b"=")
+    assert split_lines(encoded) == BODY.split("\n")
+
+
+@pytest.mark.asyncio
+async def test_iter_lines_aborts_oversized_bodies(aiohttp_client):
+    async def handler(request):
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for _ in range(100):
+            await response.write(b"vmess://" + b"x" * 1000 + b"\n")
+        return response
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    lines = []
+    async with client.get("/") as response:
+        with pytest.raises(BodyTooLargeError):
+            async for line in iter_lines(response, max_bytes=10_000):
+                lines.append(line)
+
+    assert len(lines) < 100
+
+
+def test_declared_format_skips_sniffing():
+    encoded = base64.b64encode(BODY.encode())
+
+    # The sniffer would take this line for a base64 body
+    assert split_lines(encoded[:40], "plain") == [encoded[:40].decode()]
+    assert split_lines(encoded, "base64") == BODY.split("\n")
@@ -0,0 +1,81 @@
+import time
+
+from configstream.cache import ResultCache, config_fingerprint
+from configstream.models import Proxy
+
+
+def _proxy(config="trojan://pw@1.2.3.4:443#remark", working=True):
+    proxy = Proxy(config=config, protocol="trojan", address="1.2.3.4", port=443)
+    proxy.is_working = working
+    proxy.latency = 120.0 if working else None
+    proxy.tested_at = "2024-01-01T00:00:00+00:00"
+    if not working:
+        proxy.security_issues.append("All test URLs failed")
+    return proxy
+
+
+def test_fingerprint_ignores_remarks():
+    assert config_fingerprint(_proxy("trojan://pw@h:1#a")) == config_fingerprint(
+        _proxy("trojan://pw@h:1#b"))
+    assert config_fingerprint(_proxy("trojan://pw@h:1")) != config_fingerprint(
+        _proxy("trojan://pw@h:2"))
+
+
+def test_round_trip_restores_outcome(tmp_path):
+    cache = ResultCache(tmp_path / "results.json", ttl=60)
+    cache.put(_proxy())
+    cache.put(_proxy("trojan://pw@5.6.7.8:443", working=False))
+    cache.save()
+
+    reloaded = ResultCache(tmp_path / "results.json", ttl=60)
+    reloaded.load()
+    fresh = [_proxy("trojan://pw@1.2.3.4:443#other"),
+             _proxy("trojan://pw@5.6.7.8:443"),
+             _proxy("trojan://pw@9.9.9.9:443")]
+    for proxy in fresh:
+        proxy.is_working = False
+        proxy.latency = None
+        proxy.security_issues = []
+
+    assert [reloaded.restore(proxy) for proxy in fresh] == [True, True, False]
+    assert fresh[0].is_working is True and fresh[0].latency == 120.0
+    assert fresh[1].is_working is False
+    assert fresh[1].security_issues == ["All test URLs failed"]
+
+
+def test_write_only_cache_records_without_restoring(tmp_path):
+    cache = ResultCache(tmp_path / "results.json", ttl=60)
+    cache.put(_proxy())
+    cache.save()
+
+    write_only = ResultCache(tmp_path / "results.json", ttl=60,
+                             write_only=True)
+    write_only.load()
+    assert not write_only.restore(_proxy())
+    write_only.put(_proxy("trojan://pw@5.6.7.8:443", working=False))
+    write_only.save()
+
+    reloaded = ResultCache(tmp_path / "results.json", ttl=60)
+    reloaded.load()
+    assert len(reloaded.entries) == 2
+
+
+def test_stale_entries_are_ignored(tmp_path):
+    cache = ResultCache(tmp_path / "results.json", ttl=60)
+    cache.put(_proxy())
+    key = config_fingerprint(_proxy())
+    cache.entries[key]["checked"] = time.time() - 120
+
+    assert cache.get(key) is None
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(tmp_path / "results.json", ttl=60, max_entries=2)
+    first, second, third = (_proxy(f"trojan://pw@10.0.0.{i}:443") for i in range(3))
+    cache.put(first)
+    cache.put(second)
+    cache.get(config_fingerprint(first))
+    cache.put(third)
+
+    assert config_fingerprint(second) not in cache.entries
+    assert config_fingerprint(first) in cache.entries
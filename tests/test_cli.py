@@ -40,7 +40,7 @@ def test_cli_retest_command(runner, mocker):
     }
     mocker.patch("builtins.open",
                  mocker.mock_open(read_data=json.dumps([valid_proxy])))
-    mocker.patch(
+    run = mocker.patch(
         "configstream.pipeline.run_full_pipeline",
         new_callable=AsyncMock,
         return_value={
@@ -55,6 +55,9 @@ def test_cli_retest_command(runner, mocker):
         ["retest", "--input", "output/proxies.json", "--output", "output/"])
     assert result.exit_code == 0
     assert "Retest completed successfully!" in result.output
+    # Retests refresh the result cache for the next merge
+    assert run.call_args.kwargs["read_cache"] is False
+    assert run.call_args.kwargs.get("use_cache", True) is True
 
 
 def test_cli_update_databases_command(runner, mocker):
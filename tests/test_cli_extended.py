@@ -1,3 +1,5 @@
+import json
+
 import pytest
 from click.testing import CliRunner
 from unittest.mock import patch
@@ -145,3 +147,43 @@ def test_cli_update_databases(runner):
         result = runner.invoke(cli, ["update-databases"])
         assert result.exit_code == 0
         mock_download.assert_called_once()
+
+
+def test_cli_sources_analyze(runner):
+    """sources analyze reports redundant sources and saves the report."""
+    report = {
+        "sources": [{
+            "source": "http://a",
+            "configs": 2,
+            "unique_configs": 2,
+            "identical_to": None,
+            "subset_of": None,
+            "recommendation": None,
+        }, {
+            "source": "http://b",
+            "configs": 1,
+            "unique_configs": 0,
+            "identical_to": None,
+            "subset_of": "http://a",
+            "recommendation": "drop",
+        }],
+        "drop": ["http://b"],
+        "reduce_refresh": [],
+    }
+    with runner.isolated_filesystem():
+        with open("sources.txt", "w") as f:
+            f.write("http://a\nhttp://b refresh=1h\n")
+        with patch("configstream.cli.analyze_sources",
+                   return_value=(report, {})) as analyze:
+            result = runner.invoke(cli, [
+                "sources", "analyze", "--sources", "sources.txt", "--output",
+                "overlap.json"
+            ])
+            saved = json.loads(open("overlap.json").read())
+
+    assert result.exit_code == 0, result.output
+    assert [spec.url for spec in analyze.call_args.args[0]
+            ] == ["http://a", "http://b"]
+    assert "subset of http://a" in result.output
+    assert "1 sources could be dropped" in result.output
+    assert saved["drop"] == ["http://b"]
@@ -6,6 +6,9 @@ def test_app_settings_defaults():
     settings = AppSettings()
     assert settings.TEST_TIMEOUT == 10
     assert settings.BATCH_SIZE == 50
+    # Results of one workflow merge are still fresh in the next, three
+    # hours later
+    assert settings.CACHE_TTL > 3 * 3600
     assert "vmess" in settings.PROTOCOL_COLORS
 
 
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from configstream.body_stream import BodyDecodeError
+from configstream.core import parse_config
+from configstream.documents import clash_configs, singbox_configs
+
+CLASH = """
+proxies:
+  - {name: ss, type: ss, server: 1.1.1.1, port: 8388, cipher: aes-128-gcm, password: pw}
+  - name: vless
+    type: vless
+    server: 2.2.2.2
+    port: 443
+    uuid: 11111111-2222-3333-4444-555555555555
+    tls: true
+    servername: example.com
+    network: ws
+    ws-opts: {path: /ws, headers: {Host: example.com}}
+  - {name: vmess, type: vmess, server: 3.3.3.3, port: 443, uuid: abc, alterId: 0, cipher: auto}
+  - {name: unsupported, type: snell, server: 4.4.4.4, port: 1}
+  - {name: broken, type: trojan}
+proxy-groups: []
+"""
+
+SINGBOX = {
+    "outbounds": [{
+        "type": "hysteria2",
+        "tag": "hy2",
+        "server": "5.5.5.5",
+        "server_port": 8443,
+        "password": "pw",
+        "tls": {
+            "enabled": True,
+            "server_name": "example.com"
+        },
+    }, {
+        "type": "tuic",
+        "tag": "tuic",
+        "server": "6.6.6.6",
+        "server_port": 443,
+        "uuid": "abc",
+        "password": "pw",
+        "congestion_control": "bbr",
+    }, {
+        "type": "selector",
+        "tag": "proxy",
+        "outbounds": ["hy2", "tuic"]
+    }],
+}
+
+
+def test_clash_proxies_become_parseable_links():
+    proxies = [parse_config(link) for link in clash_configs(CLASH.encode())]
+
+    assert [(p.protocol, p.address, p.port) for p in proxies] == [
+        ("shadowsocks", "1.1.1.1", 8388),
+        ("vless", "2.2.2.2", 443),
+        ("vmess", "3.3.3.3", 443),
+    ]
+    assert proxies[0].details == {"method": "aes-128-gcm", "password": "pw"}
+    assert proxies[1].details["path"] == "/ws"
+    assert proxies[1].details["security"] == "tls"
+    assert proxies[2].remarks == "vmess"
+
+
+def test_singbox_outbounds_become_parseable_links():
+    links = singbox_configs(json.dumps(SINGBOX).encode())
+    proxies = [parse_config(link) for link in links]
+
+    assert [(p.protocol, p.address, p.port) for p in proxies] == [
+        ("hysteria2", "5.5.5.5", 8443),
+        ("tuic", "6.6.6.6", 443),
+    ]
+    assert "sni=example.com" in links[0]
+
+
+@pytest.mark.parametrize("convert, body", [
+    (clash_configs, b"proxies: [unclosed"),
+    (clash_configs, b"just text"),
+    (singbox_configs, b"{not json"),
+    (singbox_configs, b'{"outbounds": {}}'),
+])
+def test_invalid_documents_are_rejected(convert, body):
+    with pytest.raises(BodyDecodeError):
+        convert(body)
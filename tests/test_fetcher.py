@@ -3,7 +3,9 @@ import asyncio
 import pytest
 from aiohttp import web
 
-from configstream.fetcher import fetch_from_source
+from configstream.fetcher import FetchEngine, fetch_from_source
+from configstream.source_cache import SourceCache
+from configstream.sources import SourceSpec
 
 
 @pytest.mark.asyncio
@@ -88,3 +90,225 @@ async def test_fetch_from_source_empty_source(aiohttp_client):
     assert result.success is True
     assert result.configs == []
     assert result.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_fetch_from_source_conditional_get(aiohttp_client, tmp_path):
+    """A 304 is answered from the source cache without re-parsing."""
+    seen_headers = []
+
+    async def handler(request):
+        seen_headers.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.Response(text="vmess://proxy1\nvless://proxy2",
+                            headers={"ETag": '"v1"'})
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+    cache = SourceCache(tmp_path / "sources")
+
+    source_url = str(client.server.make_url("/"))
+    async with client.session as session:
+        first = await fetch_from_source(session, source_url, cache=cache)
+        second = await fetch_from_source(session, source_url, cache=cache)
+
+    assert seen_headers == [None, '"v1"']
+    assert first.not_modified is False
+    assert second.not_modified is True
+    assert second.status_code == 304
+    assert second.configs == first.configs == ["vmess://proxy1", "vless://proxy2"]
+    assert cache.parse_hits == 1
+
+
+@pytest.mark.asyncio
+async def test_fetch_from_source_refetches_a_304_without_cached_body(
+        aiohttp_client, tmp_path):
+    """A 304 the cache cannot answer is followed by a full request."""
+    cache = SourceCache(tmp_path / "sources")
+    seen_headers = []
+
+    async def handler(request):
+        seen_headers.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            # The cached body disappears while the request is in flight
+            for body in (tmp_path / "sources" / "bodies").iterdir():
+                body.unlink()
+            return web.Response(status=304)
+        return web.Response(text="vmess://proxy1\nvless://proxy2",
+                            headers={"ETag": '"v1"'})
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    source_url = str(client.server.make_url("/"))
+    async with client.session as session:
+        await fetch_from_source(session, source_url, cache=cache)
+        result = await fetch_from_source(session, source_url, cache=cache,
+                                         max_retries=1)
+
+    assert seen_headers == [None, '"v1"', None]
+    assert result.success is True
+    assert result.not_modified is False
+    assert result.configs == ["vmess://proxy1", "vless://proxy2"]
+
+
+@pytest.mark.asyncio
+async def test_fetch_from_source_rejects_oversized_body(aiohttp_client):
+    """Bodies beyond max_bytes are aborted without retrying."""
+    calls = 0
+
+    async def handler(request):
+        nonlocal calls
+        calls += 1
+        return web.Response(text="vmess://" + "x" * 5000)
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    source_url = str(client.server.make_url("/"))
+    async with client.session as session:
+        result = await fetch_from_source(session, source_url, max_bytes=1000)
+
+    assert result.success is False
+    assert "exceeds" in result.error
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_fetch_engine_limits_requests_per_host(aiohttp_client):
+    """Sources on one host are fetched at most per_host at a time."""
+    in_flight = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return web.Response(text=f"vmess://{request.match_info['n']}")
+
+    app = web.Application()
+    app.router.add_get("/{n}", handler)
+    client = await aiohttp_client(app)
+
+    sources = [str(client.server.make_url(f"/{n}")) for n in range(8)]
+    results = {}
+    async with FetchEngine(max_concurrent=10, per_host=2) as engine:
+        await engine.fetch_each(
+            sources, lambda source, result: results.update({source: result}))
+
+    assert peak == 2
+    assert [results[s].configs for s in sources
+            ] == [[f"vmess://{n}"] for n in range(8)]
+    assert all(r.bytes_received == len("vmess://0") for r in results.values())
+
+
+@pytest.mark.asyncio
+async def test_fetch_engine_requeues_rate_limited_host(aiohttp_client):
+    """A 429 pauses only its host; other hosts use the slot meanwhile."""
+    events = []
+
+    async def limited(request):
+        if "limited" not in events:
+            events.append("limited")
+            return web.Response(status=429, headers={"Retry-After": "1"})
+        events.append("limited ok")
+        return web.Response(text="vmess://limited")
+
+    async def other(request):
+        events.append("other")
+        return web.Response(text="vless://other")
+
+    app = web.Application()
+    app.router.add_get("/limited", limited)
+    app.router.add_get("/other", other)
+    client = await aiohttp_client(app)
+
+    limited_url = str(client.server.make_url("/limited"))
+    # Same server under a second host name
+    other_url = str(client.server.make_url("/other")).replace(
+        "127.0.0.1", "localhost")
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    results = {}
+    async with FetchEngine(max_concurrent=1, per_host=1,
+                           host_rate=0) as engine:
+        await engine.fetch_each(
+            [limited_url, other_url],
+            lambda source, result: results.update({source: result}))
+
+    assert events == ["limited", "other", "limited ok"]
+    assert loop.time() - start >= 1
+    assert results[limited_url].configs == ["vmess://limited"]
+    assert results[other_url].configs == ["vless://other"]
+
+
+@pytest.mark.asyncio
+async def test_fetch_engine_reuses_sources_that_are_not_due(
+        aiohttp_client, tmp_path):
+    """Sources within their refresh interval are served from the cache."""
+    calls = 0
+
+    async def handler(request):
+        nonlocal calls
+        calls += 1
+        return web.Response(text="vmess://proxy1")
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+    cache = SourceCache(tmp_path / "sources")
+
+    source_url = str(client.server.make_url("/"))
+    spec = SourceSpec(source_url, refresh=3600)
+    async with FetchEngine(cache=cache) as engine:
+        first = await engine.fetch(spec)
+        second = await engine.fetch(spec)
+        # Without a refresh interval the source is always refetched
+        third = await engine.fetch(source_url)
+
+    assert calls == 2
+    assert first.not_due is False
+    assert second.not_due is True
+    assert second.configs == first.configs == ["vmess://proxy1"]
+    assert third.not_due is False
+    assert cache.not_due == 1
+
+
+@pytest.mark.asyncio
+async def test_fetch_engine_honours_declared_format(aiohttp_client):
+    """A format hint skips sniffing; documents are converted to links."""
+    clash = ("proxies:\n"
+             "  - {name: a, type: trojan, server: 1.2.3.4, port: 443, "
+             "password: pw, sni: example.com}\n")
+    # Looks like base64 to the sniffer, but is declared plain
+    plain = "dm1lc3M6Ly9wcm94eQ==\nvmess://proxy1"
+
+    app = web.Application()
+    app.router.add_get("/clash", lambda request: web.Response(text=clash))
+    app.router.add_get("/plain", lambda request: web.Response(text=plain))
+    client = await aiohttp_client(app)
+
+    async with FetchEngine() as engine:
+        documented = await engine.fetch(
+            SourceSpec(str(client.server.make_url("/clash")),
+                       format="clash"))
+        listed = await engine.fetch(
+            SourceSpec(str(client.server.make_url("/plain")),
+                       format="plain"))
+        limited = await engine.fetch(
+            SourceSpec(str(client.server.make_url("/clash")),
+                       format="clash",
+                       max_bytes=10))
+
+    assert documented.configs == [
+        "trojan://pw@1.2.3.4:443?sni=example.com&type=tcp#a"
+    ]
+    assert listed.configs == ["vmess://proxy1"]
+    assert limited.success is False
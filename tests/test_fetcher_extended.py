@@ -6,6 +6,18 @@ from aiohttp import web
 from configstream.fetcher import FetchResult, fetch_multiple_sources, fetch_from_source
 
 
+def _mock_body(response, body: bytes):
+    """Make a mocked response stream body in chunks like aiohttp does."""
+
+    async def iter_chunked(size):
+        for start in range(0, len(body), size):
+            yield body[start:start + size]
+
+    response.content_length = len(body)
+    response.content = MagicMock()
+    response.content.iter_chunked = iter_chunked
+
+
 @pytest.mark.asyncio
 async def test_fetch_multiple_sources_success(aiohttp_client):
     """Test successful fetching from multiple sources."""
@@ -118,11 +130,14 @@ async def test_fetch_from_source_rate_limit_error():
     mock_context_manager.__aenter__.return_value = mock_response
     mock_session.get.return_value = mock_context_manager
 
-    result = await fetch_from_source(mock_session,
-                                     "http://example.com",
-                                     max_retries=1)
+    result = await asyncio.wait_for(
+        fetch_from_source(mock_session, "http://example.com", max_retries=3),
+        1)
     assert not result.success
     assert "Rate limited" in result.error
+    # The wait is left to the caller instead of sleeping in here
+    assert result.retry_after == 60
+    assert mock_session.get.call_count == 1
 
 
 @pytest.mark.asyncio
@@ -143,7 +158,7 @@ async def test_fetch_from_source_server_error():
     # The third attempt will be successful
     mock_response_200 = AsyncMock()
     mock_response_200.status = 200
-    mock_response_200.text = AsyncMock(return_value="vless://proxy")
+    _mock_body(mock_response_200, b"vless://proxy")
     mock_response_200.headers = {"Content-Type": "text/plain"}
 
 
@@ -170,7 +185,7 @@ async def test_fetch_from_source_unexpected_content_type(caplog):
     mock_response = AsyncMock()
     mock_response.status = 200
     mock_response.headers = {"Content-Type": "text/html"}
-    mock_response.text = AsyncMock(return_value="<html><body>vless://proxy</body></html>")
+    _mock_body(mock_response, b"<html><body>vless://proxy</body></html>")
     mock_context_manager.__aenter__.return_value = mock_response
     mock_session.get.return_value = mock_context_manager
 
@@ -0,0 +1,39 @@
+from configstream.filters import PreTestFilter, parse_filter_values
+from configstream.models import Proxy
+
+
+def _proxy(protocol="vless", port=443, country_code="", asn=""):
+    return Proxy(config=f"{protocol}://x", protocol=protocol, address="1.1.1.1",
+                 port=port, country_code=country_code, asn=asn)
+
+
+def test_parse_filter_values():
+    assert parse_filter_values(None) is None
+    assert parse_filter_values("") is None
+    assert parse_filter_values("a, b,,") == {"a", "b"}
+    assert parse_filter_values(["x"]) == {"x"}
+
+
+def test_inactive_filter_matches_everything():
+    pre_filter = PreTestFilter.from_options()
+    assert not pre_filter.active
+    assert pre_filter.matches(_proxy())
+
+
+def test_protocol_and_port_filters():
+    pre_filter = PreTestFilter.from_options(protocol="SS,vless", port=[443])
+
+    assert pre_filter.active and not pre_filter.needs_geo
+    assert pre_filter.matches(_proxy("vless", 443))
+    assert pre_filter.matches(_proxy("shadowsocks", 443))
+    assert not pre_filter.matches(_proxy("trojan", 443))
+    assert not pre_filter.matches(_proxy("vless", 8443))
+
+
+def test_geo_filters():
+    pre_filter = PreTestFilter.from_options(country="de", asn="13335")
+
+    assert pre_filter.needs_geo
+    assert pre_filter.matches(_proxy(country_code="DE", asn="AS13335"))
+    assert not pre_filter.matches(_proxy(country_code="US", asn="AS13335"))
+    assert not pre_filter.matches(_proxy(country_code="DE", asn="AS1"))
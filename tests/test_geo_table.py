@@ -0,0 +1,148 @@
+import ipaddress
+from unittest.mock import MagicMock, patch
+
+import geoip2.models
+import pytest
+
+from configstream.geo_table import GeoIPRangeTable
+from configstream.geoip import GeoIPService, build_range_table
+
+
+def _record(code, city=None, asn=None):
+    record = {"country": {"iso_code": code, "names": {"en": f"Country {code}"}}}
+    if city:
+        record["city"] = {"names": {"en": city}}
+    if asn:
+        record["traits"] = {"autonomous_system_number": asn}
+    return record
+
+
+NETWORKS = [
+    (ipaddress.ip_network("1.0.0.0/24"), _record("AU", "Sydney", 13335)),
+    (ipaddress.ip_network("1.0.1.0/24"), _record("AU", "Sydney", 13335)),
+    (ipaddress.ip_network("8.8.8.0/24"), _record("US", asn=15169)),
+    (ipaddress.ip_network("80.0.0.0/8"), {"traits": {}}),
+    (ipaddress.ip_network("2001:db8::/32"), _record("DE", "Berlin")),
+    (ipaddress.ip_network("2a00::/12"), _record("NL")),
+]
+
+ADDRESSES = [
+    "1.0.0.1", "1.0.1.255", "1.0.2.0", "8.8.8.8", "8.8.9.1", "0.0.0.0",
+    "80.1.2.3", "255.255.255.255", "2001:db8::1", "2001:db9::1",
+    "2a0f:ffff::1", "::1", "example.com", ""
+]
+
+
+def _table():
+    return GeoIPRangeTable.compile(NETWORKS, epoch=7, ip_version=6,
+                                   country_only=False)
+
+
+def test_table_lookups(tmp_path):
+    path = tmp_path / "GeoLite2-City.ranges"
+    _table().save(path)
+    table = GeoIPRangeTable.load(path)
+
+    assert table.epoch == 7
+    assert table.lookup("1.0.1.9") == ("Country AU", "AU", "Sydney",
+                                       "AS13335")
+    assert table.lookup("8.8.8.8") == ("Country US", "US", "Unknown",
+                                       "AS15169")
+    assert table.lookup("80.0.0.1") == ("Unknown", "XX", "Unknown", "")
+    assert table.lookup("2001:db8:ffff::1")[1] == "DE"
+    # IPv4 addresses written as IPv6 find their IPv4 range
+    assert table.lookup("::ffff:8.8.8.8")[1] == "US"
+    assert table.lookup("1.0.2.0") is None
+    assert table.lookup("example.com") is None
+    # Adjacent ranges with the same answer are stored once
+    assert len(table.v4_starts) == 7
+    assert table.lookup_many(ADDRESSES) == [
+        table.lookup(address) for address in ADDRESSES
+    ]
+    table.close()
+
+
+def test_table_rejects_other_files(tmp_path):
+    path = tmp_path / "GeoLite2-City.ranges"
+    path.write_bytes(b"not a table" * 10)
+    with pytest.raises(ValueError):
+        GeoIPRangeTable.load(path)
+
+    _table().save(path)
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        GeoIPRangeTable.load(path)
+
+
+def _reader(epoch):
+    """geoip2 Reader stand-in answering from NETWORKS"""
+
+    def city(address):
+        ip = ipaddress.ip_address(address)
+        for network, record in NETWORKS:
+            if ip.version == network.version and ip in network:
+                return geoip2.models.City(["en"], **record)
+        raise ValueError("not found")
+
+    reader = MagicMock()
+    reader.metadata.return_value.build_epoch = epoch
+    reader.metadata.return_value.database_type = "GeoLite2-City"
+    reader.city.side_effect = city
+    return reader
+
+
+def _service(tmp_path, backend, epoch=7):
+    db_path = tmp_path / "GeoLite2-City.mmdb"
+    db_path.write_bytes(b"")
+    service = GeoIPService(db_path, backend=backend)
+    with patch("geoip2.database.Reader", return_value=_reader(epoch)):
+        assert service.open()
+    return service
+
+
+@pytest.mark.asyncio
+async def test_table_backend_matches_reader(tmp_path):
+    reader_service = _service(tmp_path, "reader")
+    expected = await reader_service.lookup_many(ADDRESSES)
+
+    # Without a compiled table the reader answers
+    service = _service(tmp_path, "table")
+    assert service.table is None
+    assert await service.lookup_many(ADDRESSES) == expected
+    service.close()
+
+    db_path = tmp_path / "GeoLite2-City.mmdb"
+    with patch.object(GeoIPRangeTable, "from_database",
+                      return_value=_table()) as compile_table, \
+            patch("geoip2.database.Reader", return_value=_reader(7)):
+        assert build_range_table(db_path)
+        # A table of the current build is not compiled again
+        assert not build_range_table(db_path)
+    compile_table.assert_called_once()
+    assert (tmp_path / "GeoLite2-City.ranges").exists()
+
+    table_service = _service(tmp_path, "table")
+    assert table_service.table is not None
+    assert await table_service.lookup_many(ADDRESSES) == expected
+    table_service.close()
+
+    # A table of another build is ignored
+    service = _service(tmp_path, "table", epoch=8)
+    assert service.table is None
+    service.close()
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        GeoIPService(backend="bogus")
+
+
+def test_table_of_an_asn_database():
+    table = GeoIPRangeTable.compile(
+        [(ipaddress.ip_network("1.1.1.0/24"), {
+            "autonomous_system_number": 13335,
+            "autonomous_system_organization": "CLOUDFLARENET",
+        })],
+        epoch=1, ip_version=6, country_only=False)
+    assert table.lookup("1.1.1.1")[3] == "AS13335"
+    assert table.lookup("1.1.2.1") is None
@@ -6,7 +6,9 @@ from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
-from configstream.geoip import GeoIPManager, download_geoip_dbs
+from configstream.geoip import (GeoIPManager, GeoIPService,
+                                download_geoip_dbs, open_reader)
+from configstream.models import Proxy
 
 
 @pytest.fixture
@@ -46,7 +48,23 @@ async def test_download_databases_success(mock_session, manager):
     manager._download_and_extract = AsyncMock()
     result = await manager.download_databases()
     assert result
-    assert manager._download_and_extract.call_count == 2
+    assert manager._download_and_extract.call_count == 3
+
+
+@pytest.mark.asyncio
+@patch("aiohttp.ClientSession")
+async def test_download_databases_compiles_range_tables(
+        mock_session, manager, monkeypatch):
+    monkeypatch.setattr("configstream.geoip.AppSettings.GEOIP_BACKEND",
+                        "table")
+    manager._download_and_extract = AsyncMock(return_value=True)
+    with patch("configstream.geoip.build_range_table",
+               side_effect=[True, OSError("disk full"), False]) as build:
+        assert await manager.download_databases()
+    # A table that cannot be compiled leaves the reader to answer
+    assert sorted(call.args[0].name for call in build.call_args_list) == [
+        "GeoLite2-ASN.mmdb", "GeoLite2-City.mmdb", "GeoLite2-Country.mmdb"
+    ]
 
 
 @pytest.mark.asyncio
@@ -58,21 +76,25 @@ async def test_download_databases_failure(mock_session, manager):
     assert not result
 
 
-@pytest.mark.asyncio
-async def test_download_and_extract(manager, fs):
-    # Create a mock tar.gz file in memory
+def _archive(content=b"dummy_db_content"):
     tar_buffer = io.BytesIO()
     with tarfile.open(fileobj=tar_buffer, mode="w:gz") as tar:
-        db_content = b"dummy_db_content"
         tarinfo = tarfile.TarInfo(
             name="GeoLite2-City_20240101/GeoLite2-City.mmdb")
-        tarinfo.size = len(db_content)
-        tar.addfile(tarinfo, io.BytesIO(db_content))
-    tar_buffer.seek(0)
+        tarinfo.size = len(content)
+        tar.addfile(tarinfo, io.BytesIO(content))
+    return tar_buffer.getvalue()
+
 
-    mock_response = AsyncMock()
-    mock_response.status = 200
-    mock_response.read.return_value = tar_buffer.read()
+def _download_session(status=200, body=b"", headers=None):
+    async def chunks(size):
+        for i in range(0, len(body), size):
+            yield body[i:i + size]
+
+    mock_response = MagicMock()
+    mock_response.status = status
+    mock_response.headers = headers or {}
+    mock_response.content.iter_chunked = chunks
 
     # session.get() returns an async context manager.
     get_context_manager = AsyncMock()
@@ -81,9 +103,16 @@ async def test_download_and_extract(manager, fs):
     # session.get is a regular method, so we use MagicMock for it.
     mock_session = MagicMock()
     mock_session.get.return_value = get_context_manager
+    return mock_session
+
 
-    await manager._download_and_extract(mock_session, "http://fake-url.com",
-                                        "city")
+@pytest.mark.asyncio
+async def test_download_and_extract(manager, fs):
+    mock_session = _download_session(body=_archive(),
+                                     headers={"ETag": "\"v1\""})
+
+    assert await manager._download_and_extract(mock_session,
+                                               "http://fake-url.com", "city")
 
     db_path = Path("data") / "GeoLite2-City.mmdb"
     assert db_path.exists()
@@ -92,6 +121,42 @@ async def test_download_and_extract(manager, fs):
     # Check that the tar file is cleaned up
     tar_path = Path("data") / "geoip-city.tar.gz"
     assert not tar_path.exists()
+    assert not Path("data/GeoLite2-City.mmdb.tmp").exists()
+
+
+@pytest.mark.asyncio
+async def test_download_is_conditional(manager, fs, monkeypatch):
+    await manager._download_and_extract(
+        _download_session(body=_archive(b"v1"),
+                          headers={"ETag": "\"v1\""}),
+        "http://fake-url.com", "city")
+
+    # Checked moments ago: no request at all
+    skipped = _download_session(status=500)
+    assert not await manager._download_and_extract(
+        skipped, "http://fake-url.com", "city")
+    skipped.get.assert_not_called()
+
+    monkeypatch.setattr("configstream.geoip.AppSettings.GEOIP_REFRESH_HOURS",
+                        0)
+    not_modified = _download_session(status=304)
+    assert not await manager._download_and_extract(
+        not_modified, "http://fake-url.com", "city")
+    assert not_modified.get.call_args.kwargs["headers"] == {
+        "If-None-Match": "\"v1\""
+    }
+    assert Path("data/GeoLite2-City.mmdb").read_bytes() == b"v1"
+
+
+@pytest.mark.asyncio
+async def test_download_keeps_database_on_bad_archive(manager, fs):
+    fs.create_file("data/GeoLite2-City.mmdb", contents="old")
+    with pytest.raises(Exception):
+        await manager._download_and_extract(
+            _download_session(body=b"not a tarball"), "http://fake-url.com",
+            "city")
+    assert Path("data/GeoLite2-City.mmdb").read_text() == "old"
+    assert not Path("data/geoip-city.tar.gz").exists()
 
 
 def test_verify_databases_success(manager, fs):
@@ -129,3 +194,160 @@ async def test_download_geoip_dbs_failure(mock_manager_class):
     assert not result
     mock_manager.download_databases.assert_called_once()
     mock_manager.verify_databases.assert_not_called()
+
+
+def _city(country_code):
+    response = MagicMock()
+    response.country.name = f"Country {country_code}"
+    response.country.iso_code = country_code
+    response.city.name = "City"
+    response.traits.autonomous_system_number = 64500
+    return response
+
+
+def _service(tmp_path, epoch=1, **kwargs):
+    db_path = tmp_path / "GeoLite2-City.mmdb"
+    db_path.write_bytes(b"")
+    service = GeoIPService(db_path, cache_path=tmp_path / "geoip.json",
+                           **kwargs)
+    reader = MagicMock()
+    reader.metadata.return_value.build_epoch = epoch
+    reader.city.side_effect = lambda address: (_city("DE") if address ==
+                                               "1.2.3.4" else _raise())
+    with patch("geoip2.database.Reader", return_value=reader):
+        assert service.open()
+    return service, reader
+
+
+def _raise():
+    raise ValueError("not found")
+
+
+@pytest.mark.asyncio
+async def test_geoip_service_dedups_and_caches(tmp_path):
+    service, reader = _service(tmp_path, chunk_size=1)
+    proxies = [
+        Proxy(config="", protocol="trojan", address=address, port=443)
+        for address in ("1.2.3.4", "1.2.3.4", "5.6.7.8")
+    ]
+
+    await service.geolocate(proxies)
+
+    assert reader.city.call_count == 2
+    assert [p.country_code for p in proxies] == ["DE", "DE", "XX"]
+    assert proxies[0].asn == "AS64500"
+    assert proxies[2].country == "Unknown"
+
+    await service.geolocate(proxies)
+    assert reader.city.call_count == 2
+    assert service.hits == 2
+
+
+@pytest.mark.asyncio
+async def test_geoip_service_cache_persists_per_build(tmp_path):
+    service, _ = _service(tmp_path)
+    await service.lookup_many(["1.2.3.4"])
+    service.close()
+
+    same_build, reader = _service(tmp_path)
+    found = await same_build.lookup_many(["1.2.3.4"])
+    assert found["1.2.3.4"][1] == "DE"
+    reader.city.assert_not_called()
+
+    new_build, reader = _service(tmp_path, epoch=2)
+    assert not new_build.entries
+    await new_build.lookup_many(["1.2.3.4"])
+    reader.city.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_geoip_service_without_database(tmp_path):
+    service = GeoIPService(tmp_path / "missing.mmdb")
+    assert not service.open()
+    proxy = Proxy(config="", protocol="trojan", address="1.2.3.4", port=443)
+    await service.geolocate([proxy])
+    assert proxy.country_code == "XX"
+    service.close()
+
+
+def test_open_reader_is_shared_until_replaced(tmp_path):
+    db_path = tmp_path / "GeoLite2-City.mmdb"
+    db_path.write_bytes(b"")
+    with patch("geoip2.database.Reader",
+               side_effect=lambda *a, **k: MagicMock()) as reader_class:
+        first = open_reader(db_path, "memory")
+        assert open_reader(db_path, "memory") is first
+        assert open_reader(db_path, "mmap") is not first
+
+        os.utime(db_path, ns=(1, 1))
+        assert open_reader(db_path, "memory") is not first
+    assert reader_class.call_count == 3
+
+    assert open_reader(tmp_path / "missing.mmdb") is None
+    with pytest.raises(ValueError):
+        open_reader(db_path, "bogus")
+
+
+@pytest.mark.asyncio
+async def test_geoip_service_country_database(tmp_path):
+    service, reader = _service(tmp_path)
+    reader.metadata.return_value.database_type = "GeoLite2-Country"
+    service.open()
+    reader.country.side_effect = lambda address: _city("FR")
+
+    found = await service.lookup_many(["9.9.9.9"])
+
+    assert found["9.9.9.9"][:3] == ("Country FR", "FR", "")
+    reader.city.assert_not_called()
+
+
+def test_geoip_service_picks_country_database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "GeoLite2-Country.mmdb").write_bytes(b"")
+    # Without a City database the Country one is better than nothing
+    assert GeoIPService().db_path.name == "GeoLite2-Country.mmdb"
+    (tmp_path / "data" / "GeoLite2-City.mmdb").write_bytes(b"")
+    assert GeoIPService().db_path.name == "GeoLite2-City.mmdb"
+
+
+@pytest.mark.asyncio
+async def test_geoip_service_uses_resolved_ips(tmp_path):
+    service, reader = _service(tmp_path)
+    proxy = Proxy(config="", protocol="trojan", address="a.com", port=443,
+                  resolved_ips=["1.2.3.4"])
+    await service.geolocate([proxy])
+    assert proxy.country_code == "DE"
+    reader.city.assert_called_once_with("1.2.3.4")
+
+
+@pytest.mark.asyncio
+async def test_geoip_service_reads_asns_from_the_asn_database(tmp_path):
+    (tmp_path / "GeoLite2-City.mmdb").write_bytes(b"")
+    (tmp_path / "GeoLite2-ASN.mmdb").write_bytes(b"")
+    city_reader = MagicMock()
+    city_reader.metadata.return_value.build_epoch = 1
+    city_reader.city.side_effect = lambda address: (_city("DE") if address ==
+                                                    "1.2.3.4" else _raise())
+    asn_reader = MagicMock()
+    asn_reader.metadata.return_value.build_epoch = 2
+    asn_reader.asn.return_value.autonomous_system_number = 3320
+
+    def open_database(path, mode):
+        return asn_reader if path.endswith("GeoLite2-ASN.mmdb") else city_reader
+
+    service = GeoIPService(tmp_path / "GeoLite2-City.mmdb")
+    with patch("geoip2.database.Reader", side_effect=open_database):
+        assert service.open()
+    assert service.has_asn
+
+    found = await service.lookup_many(["1.2.3.4", "5.6.7.8"])
+
+    assert found["1.2.3.4"] == ("Country DE", "DE", "City", "AS3320")
+    # Known to the ASN database only
+    assert found["5.6.7.8"] == ("Unknown", "XX", "Unknown", "AS3320")
+
+
+def test_geoip_service_without_asn_database(tmp_path):
+    service, _ = _service(tmp_path)
+    assert not service.has_asn
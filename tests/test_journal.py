@@ -0,0 +1,92 @@
+from configstream.journal import ResultJournal
+from configstream.models import Proxy
+
+
+def _proxy(config="trojan://pw@1.2.3.4:443#remark", working=True):
+    proxy = Proxy(config=config, protocol="trojan", address="1.2.3.4", port=443)
+    proxy.is_working = working
+    proxy.latency = 80.0 if working else None
+    if not working:
+        proxy.security_issues.append("All test URLs failed")
+    return proxy
+
+
+def test_resume_replays_recorded_results(tmp_path):
+    journal = ResultJournal(tmp_path / "journal.ndjson")
+    journal.open()
+    journal.record(_proxy())
+    journal.record(_proxy("trojan://pw@5.6.7.8:443", working=False))
+    journal.close()
+
+    resumed = ResultJournal(tmp_path / "journal.ndjson")
+    resumed.open(resume=True)
+    working = Proxy(config="trojan://pw@1.2.3.4:443#other",
+                    protocol="trojan",
+                    address="1.2.3.4",
+                    port=443)
+    failed = Proxy(config="trojan://pw@5.6.7.8:443",
+                   protocol="trojan",
+                   address="5.6.7.8",
+                   port=443)
+    untested = Proxy(config="trojan://pw@9.9.9.9:443",
+                     protocol="trojan",
+                     address="9.9.9.9",
+                     port=443)
+
+    assert resumed.replayed == 2
+    assert resumed.restore(working) and working.latency == 80.0
+    assert resumed.restore(failed) and not failed.is_working
+    assert failed.security_issues == ["All test URLs failed"]
+    assert not resumed.restore(untested)
+    resumed.close()
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    path = tmp_path / "journal.ndjson"
+    journal = ResultJournal(path)
+    journal.open()
+    journal.record(_proxy())
+    journal.close()
+    with open(path, "a") as f:
+        f.write('{"key": "abc", "work')
+
+    resumed = ResultJournal(path)
+    resumed.open(resume=True)
+    resumed.close()
+
+    assert resumed.replayed == 1
+
+
+def test_fresh_run_discards_old_journal(tmp_path):
+    path = tmp_path / "journal.ndjson"
+    journal = ResultJournal(path)
+    journal.open()
+    journal.record(_proxy())
+    journal.close()
+
+    fresh = ResultJournal(path)
+    fresh.open()
+    assert not fresh.restore(_proxy())
+    fresh.discard()
+    assert not path.exists()
+
+
+def test_stale_results_are_not_replayed(tmp_path, monkeypatch):
+    path = tmp_path / "journal.ndjson"
+    journal = ResultJournal(path)
+    journal.open()
+    journal.record(_proxy())
+    journal.close()
+    with open(path, "a") as f:
+        # Written before entries were timestamped
+        f.write('{"key": "abc", "working": true, "latency": 1}\n')
+
+    monkeypatch.setattr("configstream.journal.time.time",
+                        lambda: 4000000000.0)
+    resumed = ResultJournal(path, max_age=3600)
+    resumed.open(resume=True)
+    resumed.close()
+
+    assert resumed.replayed == 0
+    assert resumed.stale == 2
+    assert not resumed.restore(_proxy())
@@ -0,0 +1,102 @@
+import pytest
+
+from configstream.fetcher import FetchResult
+from configstream.overlap import (SourceOverlap, analyze_sources,
+                                  config_set_hash, config_key)
+
+
+def _configs(*hosts):
+    return [f"trojan://pw@{host}:443#{host}" for host in hosts]
+
+
+def _by_source(report):
+    return {entry["source"]: entry for entry in report["sources"]}
+
+
+def test_remarks_do_not_change_the_config_key():
+    assert config_key("trojan://pw@a:443#one") == config_key(
+        " trojan://pw@a:443#two ")
+    assert config_key("trojan://pw@a:443") != config_key("trojan://pw@b:443")
+    assert config_set_hash([1, 2]) == config_set_hash([2, 1])
+
+
+def test_identical_and_subset_sources_are_flagged():
+    overlap = SourceOverlap()
+    assert overlap.observe("big", "h1", _configs("a", "b", "c")) is None
+    assert overlap.observe("mirror", "h1", ["never looked at"]) == "big"
+    overlap.observe("reordered", "h2", _configs("c", "b", "a"))
+    overlap.observe("part", "h3", _configs("a", "b"))
+    overlap.observe("own", "h4", _configs("x", "y"))
+    overlap.observe("empty", "h5", [])
+
+    report = overlap.analyze()
+    entries = _by_source(report)
+
+    assert entries["big"]["recommendation"] is None
+    assert entries["mirror"]["identical_to"] == "big"
+    assert entries["reordered"]["identical_to"] == "big"
+    assert entries["reordered"]["config_set_hash"] == entries["big"][
+        "config_set_hash"]
+    assert entries["part"]["subset_of"] == "big"
+    assert entries["own"]["unique_configs"] == 2
+    assert entries["empty"]["recommendation"] is None
+    assert sorted(report["drop"]) == ["mirror", "part", "reordered"]
+
+
+def test_sources_adding_almost_nothing_fetch_less_often():
+    overlap = SourceOverlap()
+    hosts = [f"10.0.0.{i}" for i in range(40)]
+    overlap.observe("first", None, _configs(*hosts[:20]))
+    overlap.observe("second", None, _configs(*hosts[20:]))
+    overlap.observe("straddling", None, _configs(*hosts[10:30], "10.0.1.1"))
+    # Its subsets being dropped leaves the superset with unique configs
+    overlap.observe("subset", None, _configs(*hosts[:5]))
+
+    report = overlap.analyze()
+    entries = _by_source(report)
+
+    assert report["drop"] == ["subset"]
+    assert report["reduce_refresh"] == ["straddling"]
+    assert entries["straddling"]["unique_configs"] == 1
+    assert entries["first"]["unique_configs"] == 10
+    assert entries["subset"]["unique_configs"] == 0
+
+
+@pytest.mark.asyncio
+async def test_analyze_sources_observes_in_file_order(monkeypatch):
+    arrival = ["http://b", "http://a"]
+
+    async def fetch_each(self, specs, on_result):
+        for url in arrival:
+            on_result(url, FetchResult(url, _configs("a"), True,
+                                       body_hash="same"))
+
+    monkeypatch.setattr("configstream.overlap.FetchEngine.fetch_each",
+                        fetch_each)
+    report, results = await analyze_sources(["http://a", "http://b"])
+
+    assert report["drop"] == ["http://b"]
+    assert set(results) == {"http://a", "http://b"}
+
+
+def test_re_encoded_mirrors_are_subsets():
+    overlap = SourceOverlap()
+    overlap.observe("origin", None, [
+        "vless://id@a.com:443?type=ws&security=tls#one",
+        "trojan://pw@b.com:443#two",
+    ])
+    # Same servers, parameters reordered and remarks changed
+    overlap.observe("mirror", None,
+                    ["vless://ID@A.com:443?security=tls&type=ws#copy"])
+
+    assert overlap.analyze()["drop"] == ["mirror"]
+
+
+def test_sources_collect_fingerprints_as_they_are_parsed():
+    overlap = SourceOverlap()
+    assert overlap.observe_body("a", "h1") is None
+    assert overlap.observe_body("b", "h1") == "a"
+    overlap.add("a", "0123456789abcdef" * 2)
+    assert overlap.configs["b"] == overlap.configs["a"] == {
+        0x0123456789abcdef
+    }
@@ -1,5 +1,12 @@
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import MagicMock
+
 import pytest
-from configstream.core import parse_config
+from configstream import parsers
+from configstream.core import (parse_config, parse_config_batch,
+                               parse_config_batch_parallel)
+from configstream.fetcher import classify_lines, config_line_scheme
+from configstream.models import Proxy
 
 
 def test_parse_vmess():
@@ -17,4 +24,68 @@ def test_parse_invalid():
 
 def test_parse_empty():
     assert parse_config("") is None
-    assert parse_config(None) is None
\ No newline at end of file
+    assert parse_config(None) is None
+
+def test_scheme_aliases_parse():
+    assert parse_config("hy2://pw@example.com:443").protocol == "hysteria2"
+    assert parse_config("wg://key@example.com:51820").protocol == "wireguard"
+    assert parse_config("naive://u:p@example.com").protocol == "naive"
+    assert parse_config("VLESS://id@example.com:443").protocol == "vless"
+
+
+def test_fetcher_accepts_exactly_the_parsed_schemes():
+    for line in ("naive+https://u:p@example.com", "hy2://pw@example.com:443",
+                 "socks5://example.com:1080"):
+        scheme = config_line_scheme(line)
+        assert scheme is not None
+        assert parse_config(line, scheme) is not None
+    assert config_line_scheme("invalid://config") is None
+    assert config_line_scheme("no scheme here") is None
+
+
+def test_register_parser(monkeypatch):
+    monkeypatch.setattr(parsers, "PARSERS", dict(parsers.PARSERS))
+
+    @parsers.register_parser("Custom")
+    def parse_custom(config):
+        return Proxy(config=config, protocol="custom", address="example.com",
+                     port=1)
+
+    assert config_line_scheme("CUSTOM://x") == "custom"
+    assert parse_config("custom://x").protocol == "custom"
+
+
+@pytest.mark.asyncio
+async def test_parse_batch_parallel_matches_inline():
+    configs = [f"trojan://pw@10.0.{i // 256}.{i % 256}:443#n{i}"
+               for i in range(50)] + ["invalid://config"]
+    with ProcessPoolExecutor(2) as executor:
+        parallel = await parse_config_batch_parallel(configs, executor,
+                                                     chunk_size=7,
+                                                     min_configs=10)
+    assert parallel == parse_config_batch(configs)
+    assert [proxy.remarks for proxy in parallel[:2]] == ["n0", "n1"]
+
+
+@pytest.mark.asyncio
+async def test_parse_batch_parallel_small_batches_inline():
+    executor = MagicMock()
+    proxies = await parse_config_batch_parallel(
+        ["trojan://pw@1.2.3.4:443"], executor, min_configs=10)
+    assert [proxy.address for proxy in proxies] == ["1.2.3.4"]
+    executor.submit.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_classified_configs_skip_the_parser_lookup(monkeypatch):
+    configs, schemes = classify_lines(
+        ["trojan://pw@1.2.3.4:443", "# comment", "VLESS://id@example.com:443"])
+    assert schemes == ["trojan", "vless"]
+
+    def lookup(config):
+        raise AssertionError("classified twice")
+
+    monkeypatch.setattr("configstream.core.parser_for", lookup)
+    proxies = await parse_config_batch_parallel(configs, None,
+                                                schemes=schemes)
+    assert [proxy.protocol for proxy in proxies] == ["trojan", "vless"]
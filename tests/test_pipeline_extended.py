@@ -1,12 +1,26 @@
 import asyncio
 import base64
 import json
+import os
+import signal
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
+from aiohttp import web
 
-from configstream.core import Proxy
+from configstream.core import Proxy, parse_config_batch
+from configstream.fetcher import FetchResult
+from configstream.journal import ResultJournal
 from configstream.pipeline import run_full_pipeline
+from configstream.source_health import SourceHealthDB
+from configstream.sources import SourceSpec
+
+
+def _serve(configs):
+    """Make every source fetch return configs"""
+    return patch("configstream.fetcher.fetch_from_source",
+                 return_value=FetchResult("http://example.com", configs,
+                                          True))
 
 
 @pytest.mark.asyncio
@@ -18,10 +32,698 @@ async def test_pipeline_no_sources():
 
 @pytest.mark.asyncio
 async def test_pipeline_unparseable_config(tmp_path):
-    with patch("configstream.pipeline._fetch_source",
-               return_value=(["invalid config"], 1)):
+    with _serve(["invalid config"]):
         result = await run_full_pipeline(sources=["http://returns-garbage.com"],
                                          output_dir=tmp_path)
         assert result["success"] is False
         assert result["stats"]["fetched"] == 1
-        assert result["stats"]["tested"] == 0
\ No newline at end of file
+        assert result["stats"]["tested"] == 0
+
+@pytest.mark.asyncio
+async def test_pipeline_reuses_cached_results(tmp_path):
+    """A second run within the TTL must not re-test the same configs."""
+    tested_batches = []
+
+    class FakeTester:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def test_many(self,
+                            proxies,
+                            max_workers=10,
+                            on_result=None,
+                            stop_when=None):
+            batch = [proxy async for proxy in proxies]
+            tested_batches.append(batch)
+            for proxy in batch:
+                proxy.is_working = True
+                proxy.latency = 50.0
+                if on_result:
+                    await on_result(proxy, proxy)
+            return batch
+
+    configs = ["trojan://pw@1.2.3.4:443#a", "trojan://pw@5.6.7.8:443#b"]
+    with _serve(configs), patch(
+                   "configstream.pipeline.SingBoxTester", FakeTester):
+        for _ in range(2):
+            result = await run_full_pipeline(
+                sources=["http://example.com"],
+                output_dir=str(tmp_path / "out"),
+                preflight=False,
+                cache_dir=str(tmp_path / "cache"),
+            )
+            assert result["success"] is True
+
+    assert [len(batch) for batch in tested_batches] == [2, 0]
+    assert result["stats"]["cached"] == 2
+    assert result["stats"]["working"] == 2
+
+
+@pytest.mark.asyncio
+async def test_retest_refreshes_the_result_cache(tmp_path):
+    """Without read_cache every proxy is tested and its result cached."""
+    tested = []
+
+    class FakeTester:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def test_many(self,
+                            proxies,
+                            max_workers=10,
+                            on_result=None,
+                            stop_when=None):
+            batch = [proxy async for proxy in proxies]
+            tested.append(len(batch))
+            for proxy in batch:
+                proxy.is_working = True
+                proxy.latency = 50.0
+                if on_result:
+                    await on_result(proxy, proxy)
+            return batch
+
+    configs = ["trojan://pw@1.2.3.4:443#a", "trojan://pw@5.6.7.8:443#b"]
+    with patch("configstream.pipeline.SingBoxTester", FakeTester):
+        for read_cache in (False, False, True):
+            result = await run_full_pipeline(
+                sources=[],
+                output_dir=str(tmp_path / "out"),
+                proxies=parse_config_batch(configs),
+                preflight=False,
+                read_cache=read_cache,
+                cache_dir=str(tmp_path / "cache"),
+                resolve_dns=False,
+            )
+            assert result["success"] is True
+
+    assert tested == [2, 2, 0]
+    assert result["stats"]["cached"] == 2
+
+
+@pytest.mark.asyncio
+async def test_pipeline_applies_protocol_filter_before_testing(tmp_path):
+    """Only proxies passing the pre-test filters reach the tester."""
+    tested = []
+
+    class FakeTester:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def test_many(self,
+                            proxies,
+                            max_workers=10,
+                            on_result=None,
+                            stop_when=None):
+            batch = [proxy async for proxy in proxies]
+            tested.extend(batch)
+            return batch
+
+    configs = ["trojan://pw@1.2.3.4:443#a", "vless://id@5.6.7.8:443#b"]
+    with _serve(configs), patch(
+                   "configstream.pipeline.SingBoxTester", FakeTester):
+        result = await run_full_pipeline(
+            sources=["http://example.com"],
+            output_dir=str(tmp_path / "out"),
+            preflight=False,
+            use_cache=False,
+            protocol_filter="vless",
+        )
+
+    assert [p.protocol for p in tested] == ["vless"]
+    assert result["stats"]["prefiltered"] == 1
+
+
+@pytest.mark.asyncio
+async def test_pipeline_stops_testing_once_target_is_met(tmp_path):
+    """--target-working stops scheduling tests once enough proxies work."""
+    tested = []
+
+    class FakeTester:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def test_many(self,
+                            proxies,
+                            max_workers=10,
+                            on_result=None,
+                            stop_when=None):
+            results = []
+            async for proxy in proxies:
+                proxy.is_working = True
+                proxy.latency = 10.0
+                tested.append(proxy)
+                results.append(proxy)
+                await on_result(proxy, proxy)
+                if stop_when and stop_when():
+                    break
+            return results
+
+    configs = [f"trojan://pw@10.0.0.{i}:443#p{i}" for i in range(20)]
+    with _serve(configs), patch(
+                   "configstream.pipeline.SingBoxTester", FakeTester):
+        result = await run_full_pipeline(
+            sources=["http://example.com"],
+            output_dir=str(tmp_path / "out"),
+            preflight=False,
+            use_cache=False,
+            target_working=5,
+            exploration=0,
+        )
+
+    assert len(tested) == 5
+    assert result["stats"]["working"] == 5
+    assert result["stats"]["quota_skipped"] == 15
+
+
+@pytest.mark.asyncio
+async def test_pipeline_streams_tests_before_slow_sources_finish(tmp_path):
+    """Testing starts while a slow source is still downloading."""
+    events = []
+
+    async def fake_fetch(session, source, *args, **kwargs):
+        if source == "http://slow":
+            await asyncio.sleep(0.2)
+            events.append("slow fetched")
+            return FetchResult(source, ["trojan://pw@5.6.7.8:443#slow"],
+                               True)
+        return FetchResult(source, ["trojan://pw@1.2.3.4:443#fast"], True)
+
+    class FakeTester:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def test_many(self,
+                            proxies,
+                            max_workers=10,
+                            on_result=None,
+                            stop_when=None):
+            tested = []
+            async for proxy in proxies:
+                events.append(f"tested {proxy.remarks}")
+                proxy.is_working = True
+                proxy.latency = 10.0
+                await on_result(proxy, proxy)
+                tested.append(proxy)
+            return tested
+
+    with patch("configstream.fetcher.fetch_from_source",
+               side_effect=fake_fetch), patch(
+                   "configstream.pipeline.SingBoxTester", FakeTester):
+        result = await run_full_pipeline(
+            sources=["http://slow", "http://fast"],
+            output_dir=str(tmp_path / "out"),
+            preflight=False,
+            use_cache=False,
+        )
+
+    assert events == ["tested fast", "slow fetched", "tested slow"]
+    assert result["stats"]["working"] == 2
+
+
+@pytest.mark.asyncio
+async def test_pipeline_drops_duplicates_and_retests_given_proxies(tmp_path):
+    """Supplied proxies skip fetching and duplicates are tested once."""
+    tested = []
+
+    class FakeTester:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def test_many(self,
+                            proxies,
+                            max_workers=10,
+                            on_result=None,
+                            stop_when=None):
+            batch = [proxy async for proxy in proxies]
+            tested.extend(batch)
+            return batch
+
+    proxies = [
+        Proxy(config="trojan://pw@1.2.3.4:443#a",
+              protocol="trojan",
+              address="1.2.3.4",
+              port=443,
+              is_working=True),
+        Proxy(config="trojan://pw@1.2.3.4:443#b",
+              protocol="trojan",
+              address="1.2.3.4",
+              port=443),
+    ]
+    with patch("configstream.fetcher.fetch_from_source") as fetch, patch(
+            "configstream.pipeline.SingBoxTester", FakeTester):
+        result = await run_full_pipeline(
+            sources=[],
+            output_dir=str(tmp_path / "out"),
+            proxies=proxies,
+            preflight=False,
+            use_cache=False,
+        )
+
+    fetch.assert_not_called()
+    assert len(tested) == 1
+    assert result["stats"]["duplicates"] == 1
+    assert result["stats"]["working"] == 0
+
+
+@pytest.mark.asyncio
+async def test_pipeline_counts_unprobeable_hosts_as_preflight_failures(
+        tmp_path):
+    """Malformed hosts and probe errors fail pre-flight, not vanish."""
+    from configstream import preflight
+    real_probe = preflight.probe_endpoint
+    tested = []
+
+    class FakeTester:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def test_many(self,
+                            proxies,
+                            max_workers=10,
+                            on_result=None,
+                            stop_when=None):
+            batch = [proxy async for proxy in proxies]
+            tested.extend(batch)
+            return batch
+
+    async def probe(host, port, server_name=None, timeout=3.0):
+        if host == "boom.example":
+            raise RuntimeError("probe crashed")
+        return await real_probe(host, port, server_name, timeout)
+
+    proxies = parse_config_batch(["trojan://pw@a..b:443#a",
+                                  "trojan://pw@boom.example:443#b"])
+    with patch("configstream.pipeline.SingBoxTester", FakeTester), \
+            patch("configstream.preflight.probe_endpoint", side_effect=probe):
+        result = await run_full_pipeline(
+            sources=[],
+            output_dir=str(tmp_path / "out"),
+            proxies=proxies,
+            use_cache=False,
+            resolve_dns=False,
+        )
+
+    assert tested == []
+    assert result["stats"]["preflight_failed"] == 2
+    assert proxies[0].security_issues[-1].startswith(
+        "Pre-flight failed: Invalid host")
+    assert proxies[1].security_issues[-1] == (
+        "Pre-flight failed: probe crashed")
+
+
+@pytest.mark.asyncio
+async def test_pipeline_resume_skips_journaled_configs(tmp_path):
+    """--resume only tests configs an interrupted run did not reach."""
+    done = Proxy(config="trojan://pw@1.2.3.4:443#a",
+                 protocol="trojan",
+                 address="1.2.3.4",
+                 port=443,
+                 is_working=True,
+                 latency=20.0)
+    journal = ResultJournal(tmp_path / "cache" / "test_journal.ndjson")
+    journal.open()
+    journal.record(done)
+    journal.close()
+
+    tested = []
+
+    class FakeTester:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def test_many(self,
+                            proxies,
+                            max_workers=10,
+                            on_result=None,
+                            stop_when=None):
+            batch = [proxy async for proxy in proxies]
+            tested.extend(batch)
+            return batch
+
+    configs = ["trojan://pw@1.2.3.4:443#a", "trojan://pw@5.6.7.8:443#b"]
+    with _serve(configs), patch(
+                   "configstream.pipeline.SingBoxTester", FakeTester):
+        result = await run_full_pipeline(
+            sources=["http://example.com"],
+            output_dir=str(tmp_path / "out"),
+            preflight=False,
+            use_cache=False,
+            cache_dir=str(tmp_path / "cache"),
+            resume=True,
+        )
+
+    assert [p.address for p in tested] == ["5.6.7.8"]
+    assert result["stats"]["resumed"] == 1
+    assert result["stats"]["working"] == 1
+    # A completed run leaves nothing to resume
+    assert not (tmp_path / "cache" / "test_journal.ndjson").exists()
+
+
+@pytest.mark.asyncio
+async def test_pipeline_resumes_after_the_cache_ttl(tmp_path):
+    """A run killed hours ago is resumed even though its cache expired."""
+    done = Proxy(config="trojan://pw@1.2.3.4:443#a",
+                 protocol="trojan",
+                 address="1.2.3.4",
+                 port=443,
+                 is_working=True,
+                 latency=20.0)
+    path = tmp_path / "cache" / "test_journal.ndjson"
+    journal = ResultJournal(path)
+    journal.open()
+    journal.record(done)
+    journal.close()
+    # Interrupted three hours ago, at the previous merge
+    entry = json.loads(path.read_text())
+    entry["journaled_at"] -= 3 * 3600
+    path.write_text(json.dumps(entry) + "\n")
+
+    tested = []
+
+    class FakeTester:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def test_many(self,
+                            proxies,
+                            max_workers=10,
+                            on_result=None,
+                            stop_when=None):
+            batch = [proxy async for proxy in proxies]
+            tested.extend(batch)
+            return batch
+
+    configs = ["trojan://pw@1.2.3.4:443#a", "trojan://pw@5.6.7.8:443#b"]
+    with _serve(configs), patch(
+                   "configstream.pipeline.SingBoxTester", FakeTester):
+        result = await run_full_pipeline(
+            sources=["http://example.com"],
+            output_dir=str(tmp_path / "out"),
+            preflight=False,
+            cache_ttl=1800,
+            cache_dir=str(tmp_path / "cache"),
+            resume=True,
+        )
+
+    assert [p.address for p in tested] == ["5.6.7.8"]
+    assert result["stats"]["resumed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_pipeline_sigterm_writes_partial_outputs(tmp_path):
+    """SIGTERM stops testing but still writes what was found so far."""
+    class FakeTester:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def test_many(self,
+                            proxies,
+                            max_workers=10,
+                            on_result=None,
+                            stop_when=None):
+            async for proxy in proxies:
+                proxy.is_working = True
+                proxy.latency = 10.0
+                await on_result(proxy, proxy)
+                os.kill(os.getpid(), signal.SIGTERM)
+                await asyncio.sleep(10)
+
+    configs = [f"trojan://pw@10.0.0.{i}:443" for i in range(5)]
+    with _serve(configs), patch(
+                   "configstream.pipeline.SingBoxTester", FakeTester):
+        result = await asyncio.wait_for(
+            run_full_pipeline(
+                sources=["http://example.com"],
+                output_dir=str(tmp_path / "out"),
+                preflight=False,
+                use_cache=False,
+                cache_dir=str(tmp_path / "cache"),
+            ), 5)
+
+    assert result["success"] is True
+    assert result["partial"] is True
+    assert result["stats"]["working"] == 1
+    stats = json.loads((tmp_path / "out" / "statistics.json").read_text())
+    assert stats["partial"] is True
+    journal = (tmp_path / "cache" / "test_journal.ndjson").read_text()
+    assert len(journal.splitlines()) == 1
+
+
+@pytest.mark.asyncio
+async def test_pipeline_reports_fetch_metadata(aiohttp_client, tmp_path):
+    """statistics.json lists status, timing and bytes of every source."""
+    body = "trojan://pw@1.2.3.4:443\n"
+
+    async def handler(request):
+        if request.headers.get("If-Modified-Since") == "yesterday":
+            return web.Response(status=304)
+        return web.Response(text=body, headers={"Last-Modified": "yesterday"})
+
+    async def missing(request):
+        return web.Response(status=404)
+
+    class FakeTester:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def test_many(self,
+                            proxies,
+                            max_workers=10,
+                            on_result=None,
+                            stop_when=None):
+            batch = [proxy async for proxy in proxies]
+            for proxy in batch:
+                proxy.is_working = True
+                proxy.latency = 10.0
+                await on_result(proxy, proxy)
+            return batch
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    app.router.add_get("/missing", missing)
+    client = await aiohttp_client(app)
+    source = str(client.server.make_url("/"))
+    gone = str(client.server.make_url("/missing"))
+
+    runs = []
+    with patch("configstream.pipeline.SingBoxTester", FakeTester):
+        for _ in range(2):
+            result = await run_full_pipeline(
+                sources=[source, gone],
+                output_dir=str(tmp_path / "out"),
+                preflight=False,
+                use_cache=False,
+                cache_dir=str(tmp_path / "cache"),
+            )
+            assert result["stats"]["working"] == 1
+            runs.append(
+                json.loads(
+                    (tmp_path / "out" / "statistics.json").read_text()))
+
+    first = {r["source"]: r for r in runs[0]["sources"]}
+    assert first[source]["status_code"] == 200
+    assert first[source]["bytes"] == len(body)
+    assert first[source]["config_count"] == 1
+    assert first[source]["response_time"] is not None
+    assert first[gone]["success"] is False
+    assert runs[0]["total_bytes_fetched"] == len(body)
+
+    second = {r["source"]: r for r in runs[1]["sources"]}
+    assert second[source]["not_modified"] is True
+    assert second[source]["bytes"] == 0
+    assert runs[1]["total_not_modified"] == 1
+
+
+@pytest.mark.asyncio
+async def test_pipeline_skips_backed_off_sources(tmp_path):
+    """Sources in back-off are not fetched and history is recorded."""
+    health = SourceHealthDB(tmp_path / "cache" / "source_health.json",
+                            backoff_runs=1)
+    health.observe_fetch("http://dead", False, None, 0, 0)
+    health.commit()
+    health.save()
+
+    class FakeTester:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def test_many(self,
+                            proxies,
+                            max_workers=10,
+                            on_result=None,
+                            stop_when=None):
+            batch = [proxy async for proxy in proxies]
+            for proxy in batch:
+                proxy.is_working = True
+                proxy.latency = 10.0
+                await on_result(proxy, proxy)
+            return batch
+
+    with _serve(["trojan://pw@1.2.3.4:443"]) as fetch, patch(
+            "configstream.pipeline.SingBoxTester", FakeTester):
+        result = await run_full_pipeline(
+            sources=["http://dead", "http://alive"],
+            output_dir=str(tmp_path / "out"),
+            preflight=False,
+            use_cache=False,
+            cache_dir=str(tmp_path / "cache"),
+        )
+
+    assert [call.args[1] for call in fetch.call_args_list] == ["http://alive"]
+    assert result["stats"]["sources_skipped"] == 1
+    stats = json.loads((tmp_path / "out" / "statistics.json").read_text())
+    by_source = {entry["source"]: entry for entry in stats["sources"]}
+    assert by_source["http://dead"]["skipped"] is True
+    assert by_source["http://alive"]["working"] == 1
+    assert by_source["http://alive"]["unique"] == 1
+
+    health.load()
+    assert health.records["http://alive"]["runs"] == 1
+
+
+@pytest.mark.asyncio
+async def test_pipeline_fetches_higher_priority_sources_first(tmp_path):
+    """Declared priorities decide the fetch order."""
+    with _serve(["invalid config"]) as fetch:
+        await run_full_pipeline(
+            sources=[
+                "http://low",
+                SourceSpec("http://high", priority=5),
+                SourceSpec("http://lowest", priority=-1),
+            ],
+            output_dir=str(tmp_path / "out"),
+            cache_dir=str(tmp_path / "cache"),
+        )
+
+    assert [call.args[1] for call in fetch.call_args_list
+            ] == ["http://high", "http://low", "http://lowest"]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_skips_mirrored_bodies(tmp_path):
+    """A body already served by another source is not parsed again."""
+    mirrored = FetchResult("http://example.com", ["trojan://pw@1.2.3.4:443"],
+                           True,
+                           body_hash="same")
+    with patch("configstream.fetcher.fetch_from_source",
+               return_value=mirrored), patch(
+                   "configstream.core.parse_config_batch",
+                   wraps=parse_config_batch) as parse:
+        result = await run_full_pipeline(
+            sources=["http://a", "http://b"],
+            output_dir=str(tmp_path / "out"),
+            preflight=False,
+            cache_dir=str(tmp_path / "cache"),
+        )
+
+    assert parse.call_count == 1
+    assert result["stats"]["mirrored_sources"] == 1
+    assert result["stats"]["duplicates"] == 0
+    stats = json.loads((tmp_path / "out" / "statistics.json").read_text())
+    assert stats["redundant_sources"]["drop"] == ["http://b"]
+    by_source = {entry["source"]: entry for entry in stats["sources"]}
+    assert by_source["http://b"]["identical_to"] == "http://a"
+
+
+@pytest.mark.asyncio
+async def test_pipeline_tests_one_copy_per_server(tmp_path):
+    """Copies of a server are tested once and remember every source."""
+    tested = []
+
+    class FakeTester:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def test_many(self,
+                            proxies,
+                            max_workers=10,
+                            on_result=None,
+                            stop_when=None):
+            batch = [proxy async for proxy in proxies]
+            tested.extend(batch)
+            for proxy in batch:
+                proxy.is_working = True
+                proxy.latency = 10.0
+                await on_result(proxy, proxy)
+            return batch
+
+    results = {
+        "http://a":
+        FetchResult("http://a",
+                    ["trojan://pw@1.2.3.4:443?sni=x.com&type=tcp#A"], True),
+        "http://b":
+        FetchResult("http://b", ["trojan://pw@1.2.3.4:443?sni=X.com#B"],
+                    True),
+    }
+
+    async def fetch(session, source, *args, **kwargs):
+        return results[source]
+
+    with patch("configstream.fetcher.fetch_from_source",
+               side_effect=fetch), patch(
+                   "configstream.pipeline.SingBoxTester", FakeTester):
+        result = await run_full_pipeline(
+            sources=["http://a", "http://b"],
+            output_dir=str(tmp_path / "out"),
+            preflight=False,
+            use_cache=False,
+            cache_dir=str(tmp_path / "cache"),
+        )
+
+    assert len(tested) == 1
+    assert result["stats"]["duplicates"] == 1
+    proxies = json.loads((tmp_path / "out" / "proxies.json").read_text())
+    assert sorted(proxies[0]["sources"]) == ["http://a", "http://b"]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_asn_filter_needs_asn_database(tmp_path):
+    with _serve(["trojan://pw@1.2.3.4:443"]) as fetch, patch(
+            "configstream.pipeline.GeoIPService.open", return_value=True):
+        result = await run_full_pipeline(sources=["http://a"],
+                                         output_dir=tmp_path,
+                                         asn_filter="AS13335",
+                                         cache_dir=str(tmp_path / "cache"))
+    assert result["success"] is False
+    assert "GeoLite2-ASN" in result["error"]
+    fetch.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_pipeline_geolocates_filtered_proxies_in_batches(tmp_path):
+    batches = []
+
+    async def geolocate(proxies):
+        batches.append(len(proxies))
+        for proxy in proxies:
+            proxy.country_code = "DE" if proxy.port % 2 else "US"
+        return proxies
+
+    class FakeTester:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def test_many(self,
+                            proxies,
+                            max_workers=10,
+                            on_result=None,
+                            stop_when=None):
+            return [proxy async for proxy in proxies]
+
+    configs = [f"trojan://pw@1.2.3.4:{port}" for port in range(1000, 1100)]
+    with _serve(configs), patch(
+            "configstream.pipeline.SingBoxTester", FakeTester), patch(
+                "configstream.pipeline.GeoIPService.open",
+                return_value=True), patch(
+                    "configstream.pipeline.GeoIPService.geolocate",
+                    side_effect=geolocate):
+        result = await run_full_pipeline(sources=["http://example.com"],
+                                         output_dir=str(tmp_path / "out"),
+                                         preflight=False,
+                                         use_cache=False,
+                                         resolve_dns=False,
+                                         country_filter="DE")
+
+    assert result["stats"]["prefiltered"] == 50
+    # 100 proxies do not take 100 lookups
+    assert len(batches) < 10
@@ -0,0 +1,96 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from configstream.models import Proxy
+from configstream.preflight import (EndpointProber, ProbeResult,
+                                    endpoint_key, probe_endpoint,
+                                    tls_server_name)
+
+
+@pytest.mark.asyncio
+async def test_probe_endpoint_reachable():
+    async def handler(reader, writer):
+        writer.close()
+
+    server = await asyncio.start_server(handler, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        result = await probe_endpoint("127.0.0.1", port, timeout=1)
+
+    assert result.reachable is True
+    assert result.connect_ms is not None
+    assert result.tls_handshake_ms is None
+
+
+@pytest.mark.asyncio
+async def test_probe_endpoint_refused():
+    server = await asyncio.start_server(lambda r, w: None, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    server.close()
+    await server.wait_closed()
+
+    result = await probe_endpoint("127.0.0.1", port, timeout=1)
+
+    assert result.reachable is False
+    assert result.error
+
+
+@pytest.mark.asyncio
+async def test_probe_endpoint_malformed_host():
+    for host in ("a..b", "a" * 70 + ".com"):
+        result = await probe_endpoint(host, 443, timeout=1)
+        assert result.reachable is False
+        assert result.error.startswith("Invalid host")
+
+
+def test_tls_server_name_detection():
+    vless = Proxy(config="vless://x", protocol="vless", address="a.com", port=443,
+                  details={"security": "reality", "sni": "cdn.com"})
+    vmess = Proxy(config="vmess://x", protocol="vmess", address="b.com", port=443,
+                  details={"tls": "", "host": "h.com"})
+    trojan = Proxy(config="trojan://x", protocol="trojan", address="c.com", port=443,
+                   details={"sni": ["t.com"]})
+
+    assert tls_server_name(vless) == "cdn.com"
+    assert tls_server_name(vmess) is None
+    assert tls_server_name(trojan) == "t.com"
+
+
+@pytest.mark.asyncio
+async def test_endpoint_prober_probes_each_endpoint_once():
+    proxies = [
+        Proxy(config=f"vmess://{i}", protocol="vmess", address="a.com", port=443)
+        for i in range(3)
+    ]
+    calls = []
+
+    async def fake_probe(host, port, server_name=None, timeout=3.0):
+        calls.append(host)
+        await asyncio.sleep(0.01)
+        return ProbeResult(True, connect_ms=5.0)
+
+    prober = EndpointProber(timeout=1)
+    with patch("configstream.preflight.probe_endpoint", side_effect=fake_probe):
+        results = await asyncio.gather(*(prober.check(p) for p in proxies))
+    await prober.close()
+
+    assert results == [True, True, True]
+    assert calls == ["a.com"]
+    assert all(p.connect_ms == 5.0 for p in proxies)
+
+
+def test_endpoint_key_groups_names_by_resolved_ip():
+    first = Proxy(config="vless://x", protocol="vless", address="a.com",
+                  port=443, resolved_ips=["1.2.3.4"],
+                  details={"security": "tls", "sni": "cdn.com"})
+    second = Proxy(config="vless://y", protocol="vless", address="b.com",
+                   port=443, resolved_ips=["1.2.3.4"],
+                   details={"security": "tls", "sni": "cdn.com"})
+    unresolved = Proxy(config="vmess://z", protocol="vmess",
+                       address="C.com", port=443)
+
+    assert endpoint_key(first) == endpoint_key(second) == ("1.2.3.4", 443,
+                                                           "cdn.com")
+    assert endpoint_key(unresolved) == ("c.com", 443, None)
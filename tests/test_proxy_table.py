@@ -0,0 +1,72 @@
+import ipaddress
+
+import pytest
+
+from configstream.core import Proxy, parse_config
+from configstream.proxy_table import ProxyTable, pack_ip
+
+
+def _proxy(address, latency, protocol="trojan", country="US"):
+    return Proxy(config=f"{protocol}://pw@{address}:443?sni=example.com#x",
+                 protocol=protocol,
+                 address=address,
+                 port=443,
+                 latency=latency,
+                 country="Country " + country,
+                 country_code=country,
+                 is_working=True,
+                 source="http://a",
+                 sources=["http://a"])
+
+
+def test_proxy_interns_protocol_and_country():
+    first = Proxy(config="", protocol="".join(["vl", "ess"]), address="",
+                  port=1, country_code="".join(["D", "E"]))
+    second = Proxy(config="", protocol="vless", address="", port=1,
+                   country_code="DE")
+    assert first.protocol is second.protocol
+    assert first.country_code is second.country_code
+    with pytest.raises(AttributeError):
+        first.unknown_field = 1
+
+
+def test_pack_ip():
+    assert pack_ip("1.2.3.4")[-4:] == bytes([1, 2, 3, 4])
+    assert pack_ip("[2001:db8::1]") == ipaddress.ip_address(
+        "2001:db8::1").packed
+    assert pack_ip("example.com") == bytes(16)
+
+
+def test_table_round_trips_proxies():
+    proxies = [_proxy("1.2.3.4", 120.5), _proxy("example.com", None, "vless")]
+    table = ProxyTable(proxies)
+
+    assert len(table) == 2
+    assert table.ip(0) == ipaddress.ip_address("1.2.3.4")
+    assert table.ip(1) is None
+    rebuilt = table.proxies()
+    assert rebuilt[0].latency == 120.5 and rebuilt[1].latency is None
+    assert rebuilt[0].country == "Country US"
+    # Details are not stored but parsed again from the config
+    assert rebuilt[0].details == parse_config(proxies[0].config).details
+    assert rebuilt[0].details["sni"] == ["example.com"]
+    # Sources lists are shared, so later additions show up
+    proxies[0].sources.append("http://b")
+    assert rebuilt[0].sources == ["http://a", "http://b"]
+
+
+def test_table_filters_sorts_and_counts():
+    table = ProxyTable([
+        _proxy("1.1.1.1", 300),
+        _proxy("2.2.2.2", None),
+        _proxy("3.3.3.3", 50, "vless"),
+        _proxy("4.4.4.4", 900),
+    ])
+
+    assert table.select(min_latency=100) == [0, 3]
+    assert table.select(max_latency=500) == [0, 2]
+    assert table.select() == [0, 1, 2, 3]
+    assert table.sort_by_latency() == [2, 0, 3, 1]
+    assert table.protocol_counts([0, 1, 2]) == {"trojan": 2, "vless": 1}
+    assert table.average_latency([0, 2]) == 175
+    assert table.average_latency([1]) == 0
@@ -0,0 +1,65 @@
+from configstream.core import Proxy
+from configstream.quota import WorkingQuota, interleave_by_source
+
+
+def _proxy(source, index, country="US"):
+    return Proxy(config=f"vmess://{source}-{index}",
+                 protocol="vmess",
+                 address=f"10.0.0.{index}",
+                 port=443,
+                 country_code=country,
+                 source=source)
+
+
+def _work(proxy):
+    proxy.is_working = True
+    return proxy
+
+
+def test_interleave_by_source_round_robins():
+    proxies = [_proxy("a", i) for i in range(3)] + [_proxy("b", 9)]
+
+    ordered = interleave_by_source(proxies)
+
+    assert [p.source for p in ordered] == ["a", "b", "a", "a"]
+
+
+def test_target_working_stops_schedule():
+    quota = WorkingQuota(target_working=2, exploration=0)
+    proxies = [_proxy("a", i) for i in range(10)]
+
+    scheduled = []
+    for proxy in quota.schedule(proxies):
+        scheduled.append(proxy)
+        quota.record(_work(proxy))
+
+    assert len(scheduled) == 2
+    assert quota.done
+
+
+def test_per_country_quota_skips_full_countries():
+    quota = WorkingQuota(per_country=1, exploration=0)
+    proxies = [
+        _proxy("a", 1, "US"),
+        _proxy("a", 2, "US"),
+        _proxy("a", 3, "DE"),
+    ]
+
+    scheduled = []
+    for proxy in quota.schedule(proxies):
+        scheduled.append(proxy)
+        quota.record(_work(proxy))
+
+    assert [p.country_code for p in scheduled] == ["US", "DE"]
+
+
+def test_exploration_only_tests_unproductive_sources():
+    quota = WorkingQuota(target_working=10, exploration=0.2)
+    for i in range(10):
+        quota.record(_work(_proxy("a", i)))
+
+    assert quota.target_reached
+    assert not quota.wants(_proxy("a", 11))
+    assert quota.wants(_proxy("b", 1))
+    assert quota.wants(_proxy("b", 2))
+    assert not quota.wants(_proxy("b", 3))
@@ -1,3 +1,4 @@
+import asyncio
 import time
 
 from configstream.security.rate_limiter import RateLimiter
@@ -46,3 +47,27 @@ def test_get_wait_time_partial_bucket():
     # Expected wait time for 1 token at a rate of 10/sec is 0.1s
     # After consuming 5 tokens, we have 0 left. The next one should be available in ~0.1s
     assert 0.09 < wait_time < 0.11
+
+
+async def test_acquire_waits_for_a_token():
+    limiter = RateLimiter(requests_per_second=20)
+    limiter.buckets["test"] = {"tokens": 1, "last_update": time.time()}
+    start = time.monotonic()
+    await limiter.acquire("test")
+    await limiter.acquire("test")
+    assert 0.04 < time.monotonic() - start < 0.5
+
+
+def test_new_buckets_allow_an_initial_burst():
+    limiter = RateLimiter(requests_per_second=3)
+    assert [limiter.is_allowed("new") for _ in range(4)] == [
+        True, True, True, False
+    ]
+
+
+async def test_acquire_at_a_fractional_rate():
+    limiter = RateLimiter(requests_per_second=0.5)
+    await asyncio.wait_for(limiter.acquire("slow"), timeout=1)
+    assert not limiter.is_allowed("slow")
+    # The next token is two seconds away
+    assert 1.9 < limiter.get_wait_time("slow") <= 2
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import aiodns
+import pytest
+
+from configstream.models import Proxy
+from configstream.resolver import DNSCache, HostResolver
+
+
+class FakeDNS:
+    """Stands in for aiodns.DNSResolver"""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.queries = []
+
+    def query(self, host, qtype):
+        self.queries.append((host, qtype))
+
+        async def answer():
+            await asyncio.sleep(0.01)
+            records = self.answers.get((host, qtype))
+            if records is None:
+                raise aiodns.error.DNSError(4, "Domain name not found")
+            return [SimpleNamespace(host=ip, ttl=ttl) for ip, ttl in records]
+
+        return answer()
+
+
+def _resolver(tmp_path, answers):
+    resolver = HostResolver(DNSCache(tmp_path / "dns.json"))
+    resolver._resolver = FakeDNS(answers)
+    return resolver
+
+
+@pytest.mark.asyncio
+async def test_resolve_dedups_concurrent_lookups(tmp_path):
+    resolver = _resolver(tmp_path, {
+        ("a.com", "A"): [("1.2.3.4", 600)],
+        ("a.com", "AAAA"): [("2001:db8::1", 300)],
+    })
+
+    results = await asyncio.gather(resolver.resolve("a.com"),
+                                   resolver.resolve("A.com."))
+
+    assert results == [["1.2.3.4", "2001:db8::1"]] * 2
+    assert resolver.lookups == 1
+    assert await resolver.resolve("1.1.1.1") == ["1.1.1.1"]
+    # The shorter TTL of the answer decides when it expires
+    expires = resolver.cache.entries["a.com"]["expires"]
+    assert 290 < expires - time.time() <= 300
+
+
+@pytest.mark.asyncio
+async def test_resolve_caches_failures_and_persists(tmp_path):
+    resolver = _resolver(tmp_path, {("b.com", "A"): [("5.6.7.8", 60)]})
+    assert await resolver.resolve("missing.example") == []
+    assert await resolver.resolve("missing.example") == []
+    assert resolver.lookups == 1 and resolver.failures == 1
+    await resolver.resolve("b.com")
+    resolver.cache.save()
+
+    cache = DNSCache(tmp_path / "dns.json")
+    cache.load()
+    assert cache.get("b.com") == ["5.6.7.8"]
+    assert cache.get("missing.example") == []
+
+    cache.entries["b.com"]["expires"] = time.time() - 1
+    assert cache.get("b.com") is None
+
+
+@pytest.mark.asyncio
+async def test_resolve_proxy_records_ips(tmp_path):
+    resolver = _resolver(tmp_path, {("a.com", "A"): [("1.2.3.4", 600)]})
+    proxy = Proxy(config="trojan://pw@a.com:443", protocol="trojan",
+                  address="a.com", port=443)
+    await resolver.resolve_proxy(proxy)
+    await resolver.close()
+    assert proxy.resolved_ips == ["1.2.3.4"]
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from configstream.scheduler import WorkerPool, batched, map_bounded
+
+
+@pytest.mark.asyncio
+async def test_map_bounded_respects_max_workers():
+    """No more than max_workers items should ever be in flight."""
+    in_flight = 0
+    peak = 0
+
+    async def worker(item):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return item * 2
+
+    results = await map_bounded(range(20), worker, max_workers=4)
+
+    assert results == [i * 2 for i in range(20)]
+    assert peak == 4
+
+
+@pytest.mark.asyncio
+async def test_map_bounded_reports_progress_and_skips_errors():
+    """Failed items are dropped while every completion is reported."""
+    seen = []
+
+    async def worker(item):
+        if item == 3:
+            raise ValueError("boom")
+        return item
+
+    results = await map_bounded(range(5),
+                                worker,
+                                max_workers=2,
+                                on_result=lambda item, _: seen.append(item))
+
+    assert results == [0, 1, 2, 4]
+    assert sorted(seen) == [0, 1, 2, 4]
+
+
+@pytest.mark.asyncio
+async def test_map_bounded_consumes_items_lazily():
+    """The input iterable must not be materialized up front."""
+    pulled = 0
+
+    def items():
+        nonlocal pulled
+        for i in range(100):
+            pulled += 1
+            yield i
+
+    first_seen = None
+
+    async def worker(item):
+        nonlocal first_seen
+        if first_seen is None:
+            first_seen = pulled
+        return item
+
+    await map_bounded(items(), worker, max_workers=2)
+
+    assert first_seen is not None and first_seen < 100
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_stop_cancels_in_flight():
+    """Stopping the pool cancels running work and rejects new items."""
+    started = asyncio.Event()
+    finished = []
+
+    async def worker(item):
+        started.set()
+        await asyncio.sleep(10)
+        finished.append(item)
+
+    pool = WorkerPool(worker, max_workers=2)
+    await pool.submit(1)
+    await started.wait()
+    pool.stop()
+    await pool.join()
+
+    assert finished == []
+    assert await pool.submit(2) is False
+
+
+def test_worker_pool_rejects_zero_workers():
+    with pytest.raises(ValueError):
+        WorkerPool(lambda item: item, max_workers=0)
+
+
+@pytest.mark.asyncio
+async def test_map_bounded_stop_when_cancels_remaining_work():
+    """Once stop_when is satisfied nothing new is scheduled."""
+    done = []
+
+    async def worker(item):
+        await asyncio.sleep(0.01 if item < 3 else 1)
+        return item
+
+    results = await map_bounded(range(50),
+                                worker,
+                                max_workers=3,
+                                on_result=lambda item, _: done.append(item),
+                                stop_when=lambda: len(done) >= 3)
+
+    assert results == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_map_bounded_accepts_async_iterables():
+    """Items can be streamed from an async source such as a queue."""
+
+    async def items():
+        for i in range(5):
+            await asyncio.sleep(0)
+            yield i
+
+    async def worker(item):
+        return item + 1
+
+    assert await map_bounded(items(), worker, max_workers=2) == [1, 2, 3, 4, 5]
+    assert [b async for b in batched(items(), 2)] == [[0, 1], [2, 3], [4]]
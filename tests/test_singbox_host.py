@@ -0,0 +1,117 @@
+import json
+import socket
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from configstream.models import Proxy
+from configstream.singbox_host import SingBoxHost
+
+
+class FakeSingBox:
+    """SingBoxProxy stand-in with its blocking start() and stop()"""
+
+    def __init__(self, config, http_port=None, socks_port=None,
+                 config_only=False, client=None):
+        self.config = config
+        self.http_port = http_port
+        self.listeners = []
+        self.started_in = None
+
+    def generate_config(self):
+        if self.config.startswith("bad://"):
+            raise ValueError("Unsupported link")
+        return {
+            "outbounds": [{"type": "vmess", "tag": "proxy",
+                           "server": self.config}]
+        }
+
+    def start(self):
+        self.started_in = threading.current_thread()
+        with open(self.config) as f:
+            config = json.load(f)
+        for inbound in config["inbounds"]:
+            listener = socket.socket()
+            listener.bind(("127.0.0.1", inbound["listen_port"]))
+            listener.listen()
+            self.listeners.append(listener)
+
+    def stop(self):
+        for listener in self.listeners:
+            listener.close()
+
+
+def _proxy(config):
+    return Proxy(config=config, protocol="vmess", address="1.1.1.1", port=443)
+
+
+def test_build_config_routes_each_inbound_to_its_outbound():
+    proxies = [_proxy("vmess://a"), _proxy("vmess://b")]
+    host = SingBoxHost(proxies)
+
+    with patch("configstream.singbox_host.SingBoxProxy",
+               side_effect=FakeSingBox):
+        config = host.build_config()
+
+    assert len(config["inbounds"]) == 2
+    ports = {inbound["listen_port"] for inbound in config["inbounds"]}
+    assert len(ports) == 2
+    assert [o["tag"] for o in config["outbounds"]] == ["out-0", "out-1", "block"]
+    assert config["route"]["rules"][1] == {
+        "inbound": ["in-1"],
+        "outbound": "out-1"
+    }
+    assert host.slot_for(proxies[1]).port == config["inbounds"][1]["listen_port"]
+
+
+def test_build_config_skips_untranslatable_links():
+    proxies = [_proxy("bad://x"), _proxy("vmess://ok")]
+    host = SingBoxHost(proxies)
+
+    with patch("configstream.singbox_host.SingBoxProxy",
+               side_effect=FakeSingBox):
+        config = host.build_config()
+
+    assert len(config["inbounds"]) == 1
+    assert host.slot_for(proxies[0]) is None
+    assert "Unsupported link" in host.error_for(proxies[0])
+
+
+@pytest.mark.asyncio
+async def test_host_runs_single_process_for_batch():
+    proxies = [_proxy(f"vmess://{i}") for i in range(5)]
+
+    with patch("configstream.singbox_host.SingBoxProxy",
+               side_effect=FakeSingBox) as mock_singbox:
+        async with SingBoxHost(proxies) as host:
+            assert len(host.slots) == 5
+            process = host._process
+            # Blocking calls stay off the event loop
+            assert process.started_in is not threading.main_thread()
+            # Every inbound is open by the time slots are handed out
+            for slot in host.slots.values():
+                with socket.create_connection(("127.0.0.1", slot.port)):
+                    pass
+    assert all(listener.fileno() == -1 for listener in process.listeners)
+
+    # Five translations plus a single process launch
+    launches = [c for c in mock_singbox.call_args_list
+                if c.kwargs.get("http_port") is not False]
+    assert len(launches) == 1
+
+
+@pytest.mark.asyncio
+async def test_host_start_fails_when_an_inbound_stays_closed(monkeypatch):
+    class PartialSingBox(FakeSingBox):
+        def start(self):
+            super().start()
+            self.listeners.pop().close()
+
+    monkeypatch.setattr("configstream.singbox_host.READY_TIMEOUT", 0.2)
+    host = SingBoxHost([_proxy("vmess://a"), _proxy("vmess://b")])
+    with patch("configstream.singbox_host.SingBoxProxy",
+               side_effect=PartialSingBox):
+        with pytest.raises(TimeoutError):
+            await host.start()
+        await host.stop()
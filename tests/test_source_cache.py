@@ -0,0 +1,46 @@
+from configstream.source_cache import SourceCache, body_hash
+
+
+def _lines(text):
+    return text.decode().split()
+
+
+def test_validators_round_trip(tmp_path):
+    cache = SourceCache(tmp_path)
+    assert cache.conditional_headers("http://a") == {}
+
+    cache.store("http://a", b"vmess://1", '"etag"', "Mon, 01 Jan 2024 00:00:00 GMT")
+
+    assert cache.conditional_headers("http://a") == {
+        "If-None-Match": '"etag"',
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT",
+    }
+    assert cache.revalidated("http://a") == body_hash(b"vmess://1")
+    assert cache.not_modified == 1
+
+
+def test_parse_result_shared_by_body_hash(tmp_path):
+    cache = SourceCache(tmp_path)
+    calls = []
+
+    def parse(text):
+        calls.append(text)
+        return _lines(text)
+
+    digest = cache.store("http://a", b"vmess://1 vmess://2", None, None)
+    mirror = cache.store("http://mirror", b"vmess://1 vmess://2", None, None)
+
+    assert digest == mirror
+    assert cache.configs(digest, "test", parse) == ["vmess://1", "vmess://2"]
+    assert cache.configs(mirror, "test", parse) == ["vmess://1", "vmess://2"]
+    assert len(calls) == 1
+
+
+def test_changed_body_replaces_old_copy(tmp_path):
+    cache = SourceCache(tmp_path)
+    old = cache.store("http://a", b"vmess://old", '"1"', None)
+    new = cache.store("http://a", b"vmess://new", '"2"', None)
+
+    assert old != new
+    assert not (tmp_path / "bodies" / f"{old}.txt").exists()
+    assert cache.conditional_headers("http://a") == {"If-None-Match": '"2"'}
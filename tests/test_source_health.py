@@ -0,0 +1,86 @@
+import time
+
+from configstream.models import Proxy
+from configstream.source_health import SourceHealthDB
+
+
+def _proxy(source, working):
+    proxy = Proxy(config=f"trojan://pw@1.2.3.4:443#{source}",
+                  protocol="trojan",
+                  address="1.2.3.4",
+                  port=443,
+                  source=source)
+    proxy.is_working = working
+    return proxy
+
+
+def _run(db, source, configs=10, unique=10, tested=0, working=0, ok=True):
+    db.observe_fetch(source, ok, 0.5, configs * 40, configs)
+    for _ in range(unique):
+        db.observe_unique(source)
+    for index in range(tested):
+        db.observe_test(_proxy(source, index < working))
+
+
+def test_scores_follow_working_yield(tmp_path):
+    db = SourceHealthDB(tmp_path / "health.json", decay=1.0)
+    _run(db, "good", tested=10, working=8)
+    _run(db, "poor", tested=10, working=1)
+    db.commit()
+
+    assert db.score("good") > db.score("poor") > 0
+    assert db.score("unknown") is None
+
+    due, skipped = db.schedule(["poor", "unknown", "good"])
+    assert due == ["unknown", "good", "poor"]
+    assert skipped == []
+
+    ranked = db.rank([_proxy("poor", False), _proxy("good", False)])
+    assert [p.source for p in ranked] == ["good", "poor"]
+
+
+def test_barren_sources_are_backed_off(tmp_path):
+    db = SourceHealthDB(tmp_path / "health.json",
+                        backoff_runs=2,
+                        backoff_hours=1)
+    for _ in range(2):
+        _run(db, "empty", configs=0, unique=0)
+        _run(db, "dead", tested=5, working=0)
+        _run(db, "alive", tested=5, working=1)
+        _run(db, "untested")
+        db.commit()
+
+    due, skipped = db.schedule(["empty", "dead", "alive", "untested"])
+    assert sorted(skipped) == ["dead", "empty"]
+    assert sorted(due) == ["alive", "untested"]
+    assert db.records["empty"]["skip_until"] - time.time() > 3000
+
+    # A further barren run doubles the back-off; a working one lifts it
+    _run(db, "empty", configs=0, unique=0)
+    _run(db, "dead", tested=5, working=2)
+    db.commit()
+    assert db.records["empty"]["skip_until"] - time.time() > 7000
+    assert not db.backed_off("dead")
+
+
+def test_backing_off_everything_fetches_everything(tmp_path):
+    db = SourceHealthDB(tmp_path / "health.json", backoff_runs=1)
+    _run(db, "a", ok=False, configs=0, unique=0)
+    db.commit()
+    assert db.schedule(["a"]) == (["a"], [])
+
+
+def test_history_survives_reload_and_reports_yield(tmp_path):
+    db = SourceHealthDB(tmp_path / "health.json")
+    _run(db, "a", unique=4, tested=4, working=2)
+    db.commit()
+    db.save()
+
+    reloaded = SourceHealthDB(tmp_path / "health.json")
+    reloaded.load()
+    assert reloaded.score("a") == db.score("a")
+
+    report = db.report("a")
+    assert report["unique"] == 4
+    assert report["working_ratio"] == 0.5
+    assert report["score"] == db.score("a")
@@ -0,0 +1,45 @@
+import pytest
+
+from configstream.sources import (SourceFileError, SourceSpec, load_sources,
+                                  parse_duration, parse_size, parse_sources)
+
+
+def test_plain_url_list_is_still_valid(tmp_path):
+    path = tmp_path / "sources.txt"
+    path.write_text("# comment\n\nhttp://a\n  http://b  \nhttp://a\n")
+
+    assert load_sources(path) == [SourceSpec("http://a"), SourceSpec("http://b")]
+
+
+def test_options_are_parsed():
+    [spec] = parse_sources([
+        "http://a refresh=6h priority=5 format=Sing-Box max-bytes=8M # note"
+    ])
+
+    assert spec == SourceSpec("http://a",
+                              refresh=6 * 3600,
+                              priority=5,
+                              format="sing-box",
+                              max_bytes=8 * 1024 * 1024)
+
+
+@pytest.mark.parametrize("line", [
+    "http://a refresh",
+    "http://a refresh=soon",
+    "http://a format=xml",
+    "http://a priority=high",
+    "http://a max_bytes=lots",
+    "http://a colour=blue",
+])
+def test_malformed_lines_name_their_line_number(line):
+    with pytest.raises(SourceFileError, match="line 2"):
+        parse_sources(["http://ok", line])
+
+
+def test_units():
+    assert parse_duration("90") == 90
+    assert parse_duration("30m") == 1800
+    assert parse_duration("1.5d") == 1.5 * 86400
+    assert parse_size("512") == 512
+    assert parse_size("512K") == 512 * 1024
+    assert parse_size("1GB") == 1024**3
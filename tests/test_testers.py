@@ -1,4 +1,5 @@
-from unittest.mock import AsyncMock, patch
+import threading
+from unittest.mock import MagicMock, patch
 
 import pytest
 from aiohttp import web
@@ -27,9 +28,9 @@ async def test_singbox_tester_success(aiohttp_client):
     with patch("configstream.testers.AppSettings.TEST_URLS", test_urls), patch(
             "configstream.testers.SingBoxProxy") as mock_singbox_proxy:
 
-        mock_sb_instance = AsyncMock()
-        mock_sb_instance.start = AsyncMock()
-        mock_sb_instance.stop = AsyncMock()
+        mock_sb_instance = MagicMock()
+        mock_sb_instance.start = MagicMock()
+        mock_sb_instance.stop = MagicMock()
         mock_sb_instance.http_proxy_url = str(client.server.make_url("/"))
         mock_singbox_proxy.return_value = mock_sb_instance
 
@@ -55,10 +56,10 @@ async def test_singbox_tester_failure_masked():
     """
     # Arrange
     with patch("configstream.testers.SingBoxProxy") as mock_singbox_proxy:
-        mock_sb_instance = AsyncMock()
-        mock_sb_instance.start = AsyncMock(
+        mock_sb_instance = MagicMock()
+        mock_sb_instance.start = MagicMock(
             side_effect=Exception("Connection refused"))
-        mock_sb_instance.stop = AsyncMock()
+        mock_sb_instance.stop = MagicMock()
         mock_singbox_proxy.return_value = mock_sb_instance
 
         tester = SingBoxTester()
@@ -83,10 +84,10 @@ async def test_singbox_tester_failure_unmasked():
     """
     # Arrange
     with patch("configstream.testers.SingBoxProxy") as mock_singbox_proxy:
-        mock_sb_instance = AsyncMock()
-        mock_sb_instance.start = AsyncMock(
+        mock_sb_instance = MagicMock()
+        mock_sb_instance.start = MagicMock(
             side_effect=Exception("Connection refused"))
-        mock_sb_instance.stop = AsyncMock()
+        mock_sb_instance.stop = MagicMock()
         mock_singbox_proxy.return_value = mock_sb_instance
 
         tester = SingBoxTester()
@@ -101,4 +102,36 @@ async def test_singbox_tester_failure_unmasked():
 
     # Assert
     assert tested_proxy.is_working is False
-    assert "Connection refused" in tested_proxy.security_issues[0]
\ No newline at end of file
+    assert "Connection refused" in tested_proxy.security_issues[0]
+
+@pytest.mark.asyncio
+async def test_singbox_tester_starts_singbox_once_off_the_event_loop():
+    """sing-box is started once, by the tester, on a worker thread."""
+    calls = []
+
+    class FakeSingBoxProxy:
+        """SingBoxProxy stand-in that starts itself unless config_only"""
+
+        http_proxy_url = "http://127.0.0.1:9"
+
+        def __init__(self, config, config_only=False):
+            if not config_only:
+                self.start()
+
+        def start(self):
+            calls.append(("start", threading.current_thread()))
+
+        def stop(self):
+            calls.append(("stop", threading.current_thread()))
+
+    with patch("configstream.testers.SingBoxProxy", FakeSingBoxProxy), \
+            patch.object(SingBoxTester, "_probe") as probe:
+        proxy = Proxy(config="test_config",
+                      protocol="vmess",
+                      address="1.1.1.1",
+                      port=443)
+        await SingBoxTester().test(proxy)
+
+    probe.assert_awaited_once_with(proxy, FakeSingBoxProxy.http_proxy_url)
+    assert [name for name, _ in calls] == ["start", "stop"]
+    assert all(thread is not threading.main_thread() for _, thread in calls)
@@ -1,5 +1,5 @@
 import asyncio
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
@@ -12,7 +12,7 @@ from configstream.testers import SingBoxTester
 async def test_singbox_tester_timeout(mock_singbox_proxy):
     """Test the SingBoxTester with a timeout."""
     mock_instance = mock_singbox_proxy.return_value
-    mock_instance.start = AsyncMock(side_effect=asyncio.TimeoutError)
+    mock_instance.start = MagicMock(side_effect=asyncio.TimeoutError)
 
     tester = SingBoxTester()
     proxy = Proxy(config='direct',
@@ -29,7 +29,7 @@ async def test_singbox_tester_timeout(mock_singbox_proxy):
 async def test_singbox_tester_generic_exception(mock_singbox_proxy):
     """Test the SingBoxTester with a generic exception."""
     mock_instance = mock_singbox_proxy.return_value
-    mock_instance.start = AsyncMock(
+    mock_instance.start = MagicMock(
         side_effect=Exception("test error"))
 
     tester = SingBoxTester()
@@ -39,4 +39,95 @@ async def test_singbox_tester_generic_exception(mock_singbox_proxy):
                   port=80)
 
     result = await tester.test(proxy)
-    assert result.is_working is False
\ No newline at end of file
+    assert result.is_working is False
+
+@pytest.mark.asyncio
+async def test_singbox_tester_hosted_batch(aiohttp_client):
+    """Proxies in host mode are probed through their shared-host slot."""
+    from aiohttp import web
+
+    async def handler(request):
+        return web.Response(status=204)
+
+    app = web.Application()
+    app.router.add_get("/generate_204", handler)
+    client = await aiohttp_client(app)
+    test_urls = {"primary": str(client.server.make_url("/generate_204"))}
+
+    good = Proxy(config="vmess://good", protocol="vmess", address="1.1.1.1", port=443)
+    bad = Proxy(config="bad://link", protocol="vmess", address="2.2.2.2", port=443)
+
+    host = MagicMock()
+    host.start = AsyncMock()
+    host.stop = AsyncMock()
+    host.slot_for.side_effect = lambda p: MagicMock(
+        http_proxy_url=str(client.server.make_url("/"))) if p is good else None
+    host.error_for.return_value = "Unsupported link"
+
+    with patch("configstream.testers.AppSettings.TEST_URLS", test_urls), patch(
+            "configstream.testers.SingBoxHost", return_value=host), patch(
+                "configstream.testers.SingBoxProxy") as mock_singbox_proxy:
+        tester = SingBoxTester(host_size=10)
+        results = await tester.test_many([good, bad], max_workers=2)
+
+    mock_singbox_proxy.assert_not_called()
+    host.stop.assert_awaited_once()
+    assert results[0].is_working is True
+    assert results[1].is_working is False
+
+
+async def _race_app(aiohttp_client, slow_paths):
+    from aiohttp import web
+
+    async def handler(request):
+        if request.path in slow_paths:
+            await asyncio.sleep(5)
+        return web.Response(status=204)
+
+    app = web.Application()
+    app.router.add_get("/{name}", handler)
+    return await aiohttp_client(app)
+
+
+@pytest.mark.asyncio
+async def test_race_mode_uses_first_answering_url(aiohttp_client):
+    """A blocked primary URL must not cost a full timeout in race mode."""
+    client = await _race_app(aiohttp_client, {"/primary"})
+    test_urls = {
+        "primary": str(client.server.make_url("/primary")),
+        "fallback1": str(client.server.make_url("/fallback1")),
+    }
+    proxy_url = str(client.server.make_url("/"))
+
+    with patch("configstream.testers.AppSettings.TEST_URLS", test_urls), patch(
+            "configstream.testers.AppSettings.TEST_RACE_STAGGER", 0.1):
+        tester = SingBoxTester(timeout=3, race=True)
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        latency = await tester._race_test_urls(proxy_url)
+        elapsed = loop.time() - start
+
+    assert latency is not None
+    assert elapsed < 1
+
+
+@pytest.mark.asyncio
+async def test_race_mode_bounds_dead_proxy_to_one_timeout(aiohttp_client):
+    """When nothing answers, racing gives up after a single timeout window."""
+    client = await _race_app(aiohttp_client, {"/primary", "/fallback1", "/fallback2"})
+    test_urls = {
+        name: str(client.server.make_url(f"/{name}"))
+        for name in ("primary", "fallback1", "fallback2")
+    }
+    proxy_url = str(client.server.make_url("/"))
+
+    with patch("configstream.testers.AppSettings.TEST_URLS", test_urls), patch(
+            "configstream.testers.AppSettings.TEST_RACE_STAGGER", 0.1):
+        tester = SingBoxTester(timeout=1, race=True)
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        latency = await tester._race_test_urls(proxy_url)
+        elapsed = loop.time() - start
+
+    assert latency is None
+    assert elapsed < 1.5